@@ -0,0 +1,57 @@
+"""Add usage_rollups
+
+Revision ID: 004_add_usage_rollups
+Revises: 003_add_last_alert_date
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_add_usage_rollups'
+down_revision: Union[str, None] = '003_add_last_alert_date'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_rollups',
+        sa.Column('location_name', sa.String(), nullable=False),
+        sa.Column('local_date', sa.Date(), nullable=False),
+        sa.Column('bucket', sa.SmallInteger(), nullable=False),
+        sa.Column('weekday', sa.SmallInteger(), nullable=False),
+        sa.Column('usage_sum', sa.Integer(), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=False),
+        sa.Column('usage_min', sa.SmallInteger(), nullable=False),
+        sa.Column('usage_max', sa.SmallInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('location_name', 'local_date', 'bucket')
+    )
+    op.create_index('ix_usage_rollups_weekday', 'usage_rollups', ['weekday'])
+    
+    # Seed the rollups from existing history (same buckets as analytics.rollups)
+    op.execute("""
+        INSERT INTO usage_rollups
+            (location_name, local_date, bucket, weekday,
+             usage_sum, sample_count, usage_min, usage_max)
+        SELECT location_name,
+               local_ts::date,
+               (EXTRACT(HOUR FROM local_ts)::int * 60 + EXTRACT(MINUTE FROM local_ts)::int) / 30,
+               EXTRACT(ISODOW FROM local_ts)::int - 1,
+               SUM(usage_percentage), COUNT(*),
+               MIN(usage_percentage), MAX(usage_percentage)
+        FROM (
+            SELECT location_name, usage_percentage,
+                   timezone('America/Chicago', timezone('UTC', timestamp_utc)) AS local_ts
+            FROM usage_snapshots
+        ) s
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_usage_rollups_weekday', table_name='usage_rollups')
+    op.drop_table('usage_rollups')
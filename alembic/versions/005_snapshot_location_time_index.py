@@ -0,0 +1,130 @@
+"""Composite (location_name, timestamp_utc) index and optional partitioning
+
+Revision ID: 005_snapshot_location_time_index
+Revises: 004_add_usage_rollups
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+import os
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '005_snapshot_location_time_index'
+down_revision: Union[str, None] = '004_add_usage_rollups'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The DDL below is frozen to this revision's schema (surrogate id, location_name);
+# app.partitions manages partitions of the current one.
+MONTHS_AHEAD = 3
+
+
+def _partitioning_requested() -> bool:
+    return os.getenv("PARTITION_USAGE_SNAPSHOTS", "").lower() in ("1", "true", "yes")
+
+
+def _is_partitioned(conn) -> bool:
+    return bool(conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'usage_snapshots' AND pg_table_is_visible(c.oid)"
+    )).scalar())
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition(conn) -> None:
+    """Rebuild usage_snapshots as a RANGE (timestamp_utc) partitioned table, keeping all rows.
+    
+    The primary key becomes (id, timestamp_utc) because Postgres requires the
+    partition key in every unique constraint. Rows outside the monthly
+    partitions land in a DEFAULT partition rather than failing the insert.
+    """
+    conn.execute(sa.text("ALTER TABLE usage_snapshots RENAME TO usage_snapshots_unpartitioned"))
+    for (index_name,) in conn.execute(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'usage_snapshots_unpartitioned'"
+    )).all():
+        conn.execute(sa.text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_unpartitioned"'))
+    
+    conn.execute(sa.text(
+        "CREATE TABLE usage_snapshots (LIKE usage_snapshots_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (timestamp_utc)"
+    ))
+    conn.execute(sa.text(
+        "ALTER TABLE usage_snapshots ADD CONSTRAINT usage_snapshots_pkey PRIMARY KEY (id, timestamp_utc)"
+    ))
+    conn.execute(sa.text("CREATE INDEX ix_usage_snapshots_timestamp ON usage_snapshots (timestamp_utc)"))
+    conn.execute(sa.text(
+        "CREATE INDEX ix_usage_snapshots_location_time ON usage_snapshots "
+        "(location_name, timestamp_utc) INCLUDE (usage_percentage)"
+    ))
+    conn.execute(sa.text("CREATE TABLE usage_snapshots_default PARTITION OF usage_snapshots DEFAULT"))
+    
+    oldest = conn.execute(sa.text("SELECT MIN(timestamp_utc) FROM usage_snapshots_unpartitioned")).scalar()
+    this_month = date.today().replace(day=1)
+    month = oldest.date().replace(day=1) if oldest else this_month
+    while month <= _add_months(this_month, MONTHS_AHEAD):
+        end = _add_months(month, 1)
+        conn.execute(sa.text(
+            f'CREATE TABLE "usage_snapshots_y{month.year}m{month.month:02d}" PARTITION OF usage_snapshots '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        month = end
+    
+    conn.execute(sa.text("INSERT INTO usage_snapshots SELECT * FROM usage_snapshots_unpartitioned"))
+    # The id sequence is owned by the legacy column; move it before dropping that table
+    conn.execute(sa.text("ALTER SEQUENCE usage_snapshots_id_seq OWNED BY usage_snapshots.id"))
+    conn.execute(sa.text("DROP TABLE usage_snapshots_unpartitioned"))
+
+
+def _unpartition(conn) -> None:
+    """Inverse of _partition: copy rows back into a plain table."""
+    conn.execute(sa.text("ALTER TABLE usage_snapshots RENAME TO usage_snapshots_partitioned"))
+    conn.execute(sa.text(
+        "ALTER TABLE usage_snapshots_partitioned RENAME CONSTRAINT usage_snapshots_pkey TO usage_snapshots_partitioned_pkey"
+    ))
+    for index_name in ("ix_usage_snapshots_timestamp", "ix_usage_snapshots_location_time"):
+        conn.execute(sa.text(f"ALTER INDEX {index_name} RENAME TO {index_name}_partitioned"))
+    
+    conn.execute(sa.text("CREATE TABLE usage_snapshots (LIKE usage_snapshots_partitioned INCLUDING DEFAULTS)"))
+    conn.execute(sa.text("ALTER TABLE usage_snapshots ADD PRIMARY KEY (id)"))
+    conn.execute(sa.text("CREATE INDEX ix_usage_snapshots_timestamp ON usage_snapshots (timestamp_utc)"))
+    conn.execute(sa.text(
+        "CREATE INDEX ix_usage_snapshots_location_time ON usage_snapshots "
+        "(location_name, timestamp_utc) INCLUDE (usage_percentage)"
+    ))
+    conn.execute(sa.text("INSERT INTO usage_snapshots SELECT * FROM usage_snapshots_partitioned"))
+    conn.execute(sa.text("ALTER SEQUENCE usage_snapshots_id_seq OWNED BY usage_snapshots.id"))
+    conn.execute(sa.text("DROP TABLE usage_snapshots_partitioned CASCADE"))
+
+
+def upgrade() -> None:
+    # Covers the scraper dedup check and every per-facility time-range read;
+    # INCLUDE lets the analytics aggregates run as index-only scans.
+    op.create_index(
+        'ix_usage_snapshots_location_time',
+        'usage_snapshots',
+        ['location_name', 'timestamp_utc'],
+        postgresql_include=['usage_percentage'],
+    )
+    # Leading column of the composite index makes this one redundant
+    op.drop_index('ix_usage_snapshots_location', table_name='usage_snapshots')
+    
+    if _partitioning_requested():
+        _partition(op.get_bind())
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if _is_partitioned(conn):
+        _unpartition(conn)
+    op.create_index('ix_usage_snapshots_location', 'usage_snapshots', ['location_name'])
+    op.drop_index('ix_usage_snapshots_location_time', table_name='usage_snapshots')
@@ -0,0 +1,83 @@
+"""Unique (location_name, timestamp_utc) at minute precision
+
+Revision ID: 006_snapshot_unique_minute
+Revises: 005_snapshot_location_time_index
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '006_snapshot_unique_minute'
+down_revision: Union[str, None] = '005_snapshot_location_time_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    
+    # Older scrapes stored second-precision timestamps; normalise them to the minute
+    op.execute("""
+        UPDATE usage_snapshots SET timestamp_utc = date_trunc('minute', timestamp_utc)
+        WHERE timestamp_utc <> date_trunc('minute', timestamp_utc)
+    """)
+    
+    # Keep the first row of any (facility, minute) pair scraped more than once
+    removed = conn.execute(sa.text("""
+        DELETE FROM usage_snapshots a
+        USING usage_snapshots b
+        WHERE a.location_name = b.location_name
+          AND a.timestamp_utc = b.timestamp_utc
+          AND a.id > b.id
+    """)).rowcount
+    
+    if removed:
+        # Rollups counted the duplicates; rebuild them from the cleaned rows
+        op.execute("DELETE FROM usage_rollups")
+        op.execute("""
+            INSERT INTO usage_rollups
+                (location_name, local_date, bucket, weekday,
+                 usage_sum, sample_count, usage_min, usage_max)
+            SELECT location_name,
+                   local_ts::date,
+                   (EXTRACT(HOUR FROM local_ts)::int * 60 + EXTRACT(MINUTE FROM local_ts)::int) / 30,
+                   EXTRACT(ISODOW FROM local_ts)::int - 1,
+                   SUM(usage_percentage), COUNT(*),
+                   MIN(usage_percentage), MAX(usage_percentage)
+            FROM (
+                SELECT location_name, usage_percentage,
+                       timezone('America/Chicago', timezone('UTC', timestamp_utc)) AS local_ts
+                FROM usage_snapshots
+            ) s
+            GROUP BY 1, 2, 3, 4
+        """)
+    
+    op.create_check_constraint(
+        'ck_usage_snapshots_minute_precision',
+        'usage_snapshots',
+        "timestamp_utc = date_trunc('minute', timestamp_utc)",
+    )
+    # The unique index doubles as the covering (location_name, timestamp_utc) index from 005
+    op.create_index(
+        'uq_usage_snapshots_location_time',
+        'usage_snapshots',
+        ['location_name', 'timestamp_utc'],
+        unique=True,
+        postgresql_include=['usage_percentage'],
+    )
+    op.drop_index('ix_usage_snapshots_location_time', table_name='usage_snapshots')
+
+
+def downgrade() -> None:
+    op.create_index(
+        'ix_usage_snapshots_location_time',
+        'usage_snapshots',
+        ['location_name', 'timestamp_utc'],
+        postgresql_include=['usage_percentage'],
+    )
+    op.drop_index('uq_usage_snapshots_location_time', table_name='usage_snapshots')
+    op.drop_constraint('ck_usage_snapshots_minute_precision', 'usage_snapshots', type_='check')
@@ -0,0 +1,110 @@
+"""Facility dimension table; snapshots and rollups keyed by SMALLINT facility_id
+
+Revision ID: 007_facility_dimension
+Revises: 006_snapshot_unique_minute
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '007_facility_dimension'
+down_revision: Union[str, None] = '006_snapshot_unique_minute'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# app.constants.TTU_FACILITIES at the time of this migration, in display order
+SEED_FACILITIES = [
+    "Raider Power Zone",
+    "Front Courts",
+    "Indoor Soccer Court",
+    "Machine Weight Room",
+    "Free Weight Room",
+    "Back Courts",
+    "Main Level Cardio",
+    "Indoor Track",
+    "Track Level Cardio",
+]
+
+
+def upgrade() -> None:
+    facilities = op.create_table(
+        'facilities',
+        sa.Column('id', sa.SmallInteger(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('aliases', postgresql.ARRAY(sa.String()), server_default='{}', nullable=False),
+        sa.Column('display_order', sa.SmallInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name', name='uq_facilities_name'),
+    )
+    op.bulk_insert(facilities, [
+        {"name": name, "display_order": i + 1} for i, name in enumerate(SEED_FACILITIES)
+    ])
+    # Any other facility already in the history goes after the seeded ones
+    op.execute("""
+        INSERT INTO facilities (name, display_order)
+        SELECT name, (SELECT MAX(display_order) FROM facilities) + ROW_NUMBER() OVER (ORDER BY name)
+        FROM (
+            SELECT location_name AS name FROM usage_snapshots
+            UNION
+            SELECT location_name FROM usage_rollups
+        ) n
+        WHERE name NOT IN (SELECT name FROM facilities)
+    """)
+    
+    for table in ('usage_snapshots', 'usage_rollups'):
+        op.add_column(table, sa.Column('facility_id', sa.SmallInteger(), nullable=True))
+        op.execute(f"""
+            UPDATE {table} t SET facility_id = f.id
+            FROM facilities f WHERE f.name = t.location_name
+        """)
+        op.alter_column(table, 'facility_id', nullable=False)
+        op.create_foreign_key(
+            f'fk_{table}_facility', table, 'facilities', ['facility_id'], ['id']
+        )
+    
+    op.create_index(
+        'uq_usage_snapshots_facility_time',
+        'usage_snapshots',
+        ['facility_id', 'timestamp_utc'],
+        unique=True,
+        postgresql_include=['usage_percentage'],
+    )
+    op.drop_index('uq_usage_snapshots_location_time', table_name='usage_snapshots')
+    op.drop_column('usage_snapshots', 'location_name')
+    
+    op.drop_constraint('usage_rollups_pkey', 'usage_rollups', type_='primary')
+    op.create_primary_key('usage_rollups_pkey', 'usage_rollups', ['facility_id', 'local_date', 'bucket'])
+    op.drop_column('usage_rollups', 'location_name')
+
+
+def downgrade() -> None:
+    for table in ('usage_snapshots', 'usage_rollups'):
+        op.add_column(table, sa.Column('location_name', sa.String(), nullable=True))
+        op.execute(f"""
+            UPDATE {table} t SET location_name = f.name
+            FROM facilities f WHERE f.id = t.facility_id
+        """)
+        op.alter_column(table, 'location_name', nullable=False)
+    
+    op.drop_constraint('usage_rollups_pkey', 'usage_rollups', type_='primary')
+    op.create_primary_key('usage_rollups_pkey', 'usage_rollups', ['location_name', 'local_date', 'bucket'])
+    op.drop_constraint('fk_usage_rollups_facility', 'usage_rollups', type_='foreignkey')
+    op.drop_column('usage_rollups', 'facility_id')
+    
+    op.create_index(
+        'uq_usage_snapshots_location_time',
+        'usage_snapshots',
+        ['location_name', 'timestamp_utc'],
+        unique=True,
+        postgresql_include=['usage_percentage'],
+    )
+    op.drop_index('uq_usage_snapshots_facility_time', table_name='usage_snapshots')
+    op.drop_constraint('fk_usage_snapshots_facility', 'usage_snapshots', type_='foreignkey')
+    op.drop_column('usage_snapshots', 'facility_id')
+    
+    op.drop_table('facilities')
@@ -0,0 +1,118 @@
+"""Compact usage_snapshots layout: natural key, SMALLINT pct, parser_versions lookup
+
+Revision ID: 008_compact_snapshots
+Revises: 007_facility_dimension
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '008_compact_snapshots'
+down_revision: Union[str, None] = '007_facility_dimension'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _brin_requested() -> bool:
+    return os.getenv("SNAPSHOT_TIME_INDEX", "btree").lower() == "brin"
+
+
+def upgrade() -> None:
+    op.create_table(
+        'parser_versions',
+        sa.Column('id', sa.SmallInteger(), nullable=False),
+        sa.Column('version', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('version', name='uq_parser_versions_version'),
+    )
+    # '1.0' was the column default, so it is always present
+    op.execute("""
+        INSERT INTO parser_versions (version)
+        SELECT COALESCE(parser_version, '1.0') FROM usage_snapshots
+        UNION
+        SELECT '1.0'
+        ORDER BY 1
+    """)
+    
+    op.add_column('usage_snapshots', sa.Column('parser_version_id', sa.SmallInteger(), nullable=True))
+    op.execute("""
+        UPDATE usage_snapshots s SET parser_version_id = p.id
+        FROM parser_versions p WHERE p.version = COALESCE(s.parser_version, '1.0')
+    """)
+    op.alter_column('usage_snapshots', 'parser_version_id', nullable=False)
+    op.create_foreign_key(
+        'fk_usage_snapshots_parser_version', 'usage_snapshots', 'parser_versions',
+        ['parser_version_id'], ['id'],
+    )
+    
+    # scraped_at_utc only ever differed from timestamp_utc by the truncated seconds;
+    # the surrogate id goes too, (facility_id, timestamp_utc) is already unique
+    op.drop_column('usage_snapshots', 'parser_version')
+    op.drop_column('usage_snapshots', 'scraped_at_utc')
+    op.drop_column('usage_snapshots', 'id')
+    op.execute("""
+        ALTER TABLE usage_snapshots ADD CONSTRAINT usage_snapshots_pkey
+        PRIMARY KEY (facility_id, timestamp_utc) INCLUDE (usage_percentage)
+    """)
+    op.drop_index('uq_usage_snapshots_facility_time', table_name='usage_snapshots')
+    
+    # 0-100 fits in two bytes (rewrites the table)
+    op.alter_column(
+        'usage_snapshots', 'usage_percentage',
+        type_=sa.SmallInteger(), existing_type=sa.Integer(), existing_nullable=False,
+    )
+    
+    if _brin_requested():
+        # Rows arrive in time order, so block ranges map to narrow time ranges;
+        # a BRIN index is a few pages where the B-tree grows with the table
+        op.drop_index('ix_usage_snapshots_timestamp', table_name='usage_snapshots')
+        op.create_index(
+            'ix_usage_snapshots_timestamp_brin', 'usage_snapshots', ['timestamp_utc'],
+            postgresql_using='brin',
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if conn.execute(sa.text(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_usage_snapshots_timestamp_brin'"
+    )).scalar():
+        op.drop_index('ix_usage_snapshots_timestamp_brin', table_name='usage_snapshots')
+        op.create_index('ix_usage_snapshots_timestamp', 'usage_snapshots', ['timestamp_utc'])
+    
+    op.alter_column(
+        'usage_snapshots', 'usage_percentage',
+        type_=sa.Integer(), existing_type=sa.SmallInteger(), existing_nullable=False,
+    )
+    op.create_index(
+        'uq_usage_snapshots_facility_time',
+        'usage_snapshots',
+        ['facility_id', 'timestamp_utc'],
+        unique=True,
+        postgresql_include=['usage_percentage'],
+    )
+    op.drop_constraint('usage_snapshots_pkey', 'usage_snapshots', type_='primary')
+    
+    op.execute("ALTER TABLE usage_snapshots ADD COLUMN id SERIAL")
+    # Partitioned tables need the partition key in the primary key
+    partitioned = conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'usage_snapshots' AND pg_table_is_visible(c.oid)"
+    )).scalar()
+    pk_columns = ['id', 'timestamp_utc'] if partitioned else ['id']
+    op.create_primary_key('usage_snapshots_pkey', 'usage_snapshots', pk_columns)
+    
+    op.add_column('usage_snapshots', sa.Column('scraped_at_utc', sa.DateTime(), nullable=True))
+    op.add_column('usage_snapshots', sa.Column('parser_version', sa.String(), nullable=True))
+    op.execute("""
+        UPDATE usage_snapshots s SET scraped_at_utc = s.timestamp_utc, parser_version = p.version
+        FROM parser_versions p WHERE p.id = s.parser_version_id
+    """)
+    op.drop_constraint('fk_usage_snapshots_parser_version', 'usage_snapshots', type_='foreignkey')
+    op.drop_column('usage_snapshots', 'parser_version_id')
+    op.drop_table('parser_versions')
@@ -0,0 +1,28 @@
+"""Add alert_threshold_pct
+
+Revision ID: 009_alert_threshold
+Revises: 008_compact_snapshots
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '009_alert_threshold'
+down_revision: Union[str, None] = '008_compact_snapshots'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Low-usage alerts fire below this percentage; 30 was the old hard-coded value
+    op.add_column('user_preferences',
+        sa.Column('alert_threshold_pct', sa.Integer(), nullable=False, server_default='30')
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('user_preferences', 'alert_threshold_pct')
@@ -0,0 +1,65 @@
+"""Add usage_stats
+
+Revision ID: 011_usage_stats
+Revises: 010_email_outbox
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '011_usage_stats'
+down_revision: Union[str, None] = '010_email_outbox'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_stats',
+        sa.Column('facility_id', sa.SmallInteger(), sa.ForeignKey('facilities.id'), nullable=False),
+        sa.Column('weekday', sa.SmallInteger(), nullable=False),
+        sa.Column('bucket', sa.SmallInteger(), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('mean', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('m2', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('ewma', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text("timezone('UTC', now())")),
+        sa.PrimaryKeyConstraint('facility_id', 'weekday', 'bucket'),
+    )
+    
+    # Seed from the raw history (same statement as analytics.usage_stats.rebuild_usage_stats).
+    # Frozen at the default USAGE_STATS_EWMA_ALPHA of 0.4: migrations don't read settings.
+    # With another alpha configured, run `python -m cli rebuild-stats`, which applies it.
+    op.execute("""
+        INSERT INTO usage_stats (facility_id, weekday, bucket, sample_count, mean, m2, ewma)
+        SELECT facility_id, weekday, bucket,
+               COUNT(*), AVG(x), COALESCE(VAR_POP(x), 0) * COUNT(*),
+               SUM(x * CASE WHEN age >= 500 THEN 0
+                            WHEN age = n - 1 THEN power(0.6, age)
+                            ELSE 0.4 * power(0.6, age) END)
+        FROM (
+            SELECT facility_id, weekday, bucket, x,
+                   ROW_NUMBER() OVER w - 1 AS age,
+                   COUNT(*) OVER (PARTITION BY facility_id, weekday, bucket) AS n
+            FROM (
+                SELECT facility_id, timestamp_utc, usage_percentage::float8 AS x,
+                       EXTRACT(ISODOW FROM local_ts)::int - 1 AS weekday,
+                       (EXTRACT(HOUR FROM local_ts)::int * 60 + EXTRACT(MINUTE FROM local_ts)::int) / 30 AS bucket
+                FROM (
+                    SELECT facility_id, timestamp_utc, usage_percentage,
+                           timezone('America/Chicago', timezone('UTC', timestamp_utc)) AS local_ts
+                    FROM usage_snapshots
+                ) s
+            ) r
+            WINDOW w AS (PARTITION BY facility_id, weekday, bucket ORDER BY timestamp_utc DESC)
+        ) a
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('usage_stats')
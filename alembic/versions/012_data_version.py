@@ -0,0 +1,33 @@
+"""Add data_version
+
+Revision ID: 012_data_version
+Revises: 011_usage_stats
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '012_data_version'
+down_revision: Union[str, None] = '011_usage_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'data_version',
+        sa.Column('id', sa.SmallInteger(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('history', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.CheckConstraint('id = 1', name='ck_data_version_single_row'),
+    )
+    op.execute("INSERT INTO data_version (id) VALUES (1)")
+
+
+def downgrade() -> None:
+    op.drop_table('data_version')
@@ -0,0 +1,25 @@
+"""Add user_preferences.digest_sent_on
+
+Revision ID: 013_digest_sent_on
+Revises: 012_data_version
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '013_digest_sent_on'
+down_revision: Union[str, None] = '012_data_version'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_preferences', sa.Column('digest_sent_on', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_preferences', 'digest_sent_on')
@@ -1,3 +1,3 @@
-from .recommendations import get_recommendations, get_heatmap_data
+from .recommendations import get_recommendations, get_heatmap_data, recommendation_cache
 
-__all__ = ["get_recommendations", "get_heatmap_data"]
+__all__ = ["get_recommendations", "get_heatmap_data", "recommendation_cache"]
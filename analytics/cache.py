@@ -0,0 +1,86 @@
+"""
+Small thread-safe LRU cache with hit/miss counters.
+
+Used to memoise analytics results per process. Callers put a data version
+(see analytics.snapshots.data_version) in the key, so new data naturally
+misses and stale entries age out through LRU eviction. An optional `ttl`
+(seconds) also expires entries by age.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 256, name: str = "cache", ttl: float = None):
+        self.maxsize = maxsize
+        self.name = name
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def get_or_compute(self, key, compute):
+        """Return the cached value for `key`, computing and storing it on a miss.
+        
+        `compute` runs outside the lock, so two concurrent misses may both
+        compute; the last one wins, which is harmless for pure results.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+    
+    def keys(self) -> list:
+        """Snapshot of the current keys, least recently used first (may include expired ones)."""
+        with self._lock:
+            return list(self._data)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,95 @@
+"""
+Vectorized analytics core on compact NumPy arrays.
+
+Snapshots are held column-wise — epoch seconds (int64), a facility code (int16)
+and the usage percentage (uint8), about 11 bytes per reading instead of a full
+ORM object. Local-time fields, masks and group means are computed with array
+ops (`bincount`) rather than per-row Python loops.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+import numpy as np
+import pytz
+
+TZ_NAME = "America/Chicago"
+SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class SnapshotArrays:
+    epoch: np.ndarray  # int64 seconds since 1970-01-01 UTC
+    facility: np.ndarray  # int16 index into `facilities`
+    pct: np.ndarray  # uint8 usage percentage
+    facilities: list = field(default_factory=list)
+    
+    def __len__(self):
+        return len(self.epoch)
+    
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int16), np.empty(0, dtype=np.uint8), []
+        )
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (timestamp_utc, location_name, usage_percentage) tuples."""
+        rows = list(rows)
+        if not rows:
+            return cls.empty()
+        timestamps, names, pcts = zip(*rows)
+        facilities, codes = np.unique(np.array(names, dtype=object), return_inverse=True)
+        return cls(
+            epoch=np.array(timestamps, dtype="datetime64[s]").astype(np.int64),
+            facility=codes.astype(np.int16),
+            pct=np.array(pcts, dtype=np.uint8),
+            facilities=[str(f) for f in facilities],
+        )
+    
+    def select(self, mask: np.ndarray) -> "SnapshotArrays":
+        return SnapshotArrays(self.epoch[mask], self.facility[mask], self.pct[mask], self.facilities)
+
+
+def utc_offsets(epoch: np.ndarray, tz_name: str = TZ_NAME) -> np.ndarray:
+    """UTC offset in seconds for each timestamp.
+    
+    DST changes happen on the hour, so the offset is looked up once per distinct
+    UTC hour (≈8.8k per year of data) and broadcast back to every row.
+    """
+    if len(epoch) == 0:
+        return np.empty(0, dtype=np.int64)
+    tz = pytz.timezone(tz_name)
+    hours, inverse = np.unique(epoch // 3600, return_inverse=True)
+    offsets = np.array([
+        int(datetime.fromtimestamp(int(h) * 3600, pytz.UTC).astimezone(tz).utcoffset().total_seconds())
+        for h in hours
+    ], dtype=np.int64)
+    return offsets[inverse.reshape(-1)]
+
+
+def local_fields(epoch: np.ndarray, tz_name: str = TZ_NAME):
+    """Return (local_day, weekday, minute_of_day) arrays for UTC epoch seconds.
+    
+    local_day counts days since 1970-01-01 in local time; weekday is 0=Monday.
+    """
+    local = epoch + utc_offsets(epoch, tz_name)
+    local_day = local // SECONDS_PER_DAY
+    weekday = (local_day + 3) % 7  # 1970-01-01 was a Thursday
+    minute_of_day = (local % SECONDS_PER_DAY) // 60
+    return local_day, weekday, minute_of_day
+
+
+def grouped_mean(keys: np.ndarray, values: np.ndarray, size: int):
+    """Mean and count of `values` per integer key in [0, size)."""
+    counts = np.bincount(keys, minlength=size)
+    sums = np.bincount(keys, weights=values.astype(np.float64), minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return means, counts
+
+
+def mean_dict(keys: np.ndarray, values: np.ndarray, size: int) -> dict:
+    """{key: (mean, count)} for every key that has at least one value."""
+    means, counts = grouped_mean(keys, values, size)
+    return {int(k): (float(means[k]), int(counts[k])) for k in np.flatnonzero(counts)}
+
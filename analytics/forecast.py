@@ -0,0 +1,323 @@
+"""
+Per-facility occupancy forecasts for the next 24-72 hours, in half-hour steps.
+
+Series come from the half-hourly rollups: one value per facility per slot
+(the bucket mean), NaN where nothing was scraped, e.g. while a facility is
+closed. Slots are numbered from a fixed epoch, so `slot % SEASON` is the
+slot's place in the week. Every model keeps one value per facility per
+week-slot:
+
+- seasonal_naive: the last value observed in that week-slot.
+- seasonal_ewma: an exponentially weighted mean of that week-slot across
+  weeks.
+- holt_winters: additive Holt-Winters with a damped trend and a weekly
+  season, updated reading by reading. Slots with no reading are skipped.
+
+All three are fitted together as (facilities x week-slots) NumPy arrays, so
+an update costs the same handful of array operations however many
+facilities there are. The fitted state is cached per process. When new
+scrapes arrive, only the slots completed since the last fit are fed in
+rather than refitting the history; the last REFRESH_OVERLAP_SLOTS are
+re-read each time, so readings that land in a slot late still count. A
+week-slot that has never had a reading (closed hours) is not forecast.
+
+`backtest` replays recent days through the same incremental path and
+reports each model's MAE.
+"""
+import threading
+import warnings
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
+import numpy as np
+import pytz
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from app.facilities import facility_index
+from analytics.snapshots import data_version
+
+TZ_NAME = "America/Chicago"
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SEASON = 7 * SLOTS_PER_DAY  # weekly seasonality, in slots
+MODELS = ("seasonal_naive", "seasonal_ewma", "holt_winters")
+MAX_HOURS = 72
+
+EWMA_ALPHA = 0.3  # weight of the newest week in seasonal_ewma
+HW_ALPHA = 0.2  # level
+HW_BETA = 0.01  # trend
+HW_GAMMA = 0.3  # season
+HW_PHI = 0.98  # trend damping per step
+
+
+@dataclass
+class ForecastState:
+    facility_ids: tuple
+    end_slot: int  # every slot before this has been fed in
+    naive: np.ndarray  # (F, SEASON) last observed value, NaN = never observed
+    ewma: np.ndarray  # (F, SEASON)
+    level: np.ndarray  # (F,) Holt-Winters level, NaN until the first reading
+    trend: np.ndarray  # (F,)
+    season: np.ndarray  # (F, SEASON) additive seasonal offsets
+
+
+def slot_of(local_date: date, bucket: int) -> int:
+    return local_date.toordinal() * SLOTS_PER_DAY + bucket
+
+
+def slot_start_local(slot: int) -> datetime:
+    """Aware local datetime at which `slot` begins."""
+    day, bucket = divmod(slot, SLOTS_PER_DAY)
+    naive = datetime.combine(date.fromordinal(day), datetime.min.time()) + timedelta(minutes=bucket * SLOT_MINUTES)
+    return pytz.timezone(TZ_NAME).localize(naive)
+
+
+def current_slot(now: datetime = None) -> int:
+    """The slot `now` (default: now) falls in; it is still being filled."""
+    now = (now or datetime.now(pytz.UTC)).astimezone(pytz.timezone(TZ_NAME))
+    return slot_of(now.date(), (now.hour * 60 + now.minute) // SLOT_MINUTES)
+
+
+def load_slot_matrix(db: Session, first_slot: int, end_slot: int, facility_ids) -> np.ndarray:
+    """(F, end_slot - first_slot) bucket means from the rollups, NaN where there is no reading.
+    
+    Days already folded to hourly buckets (see app.retention) fill both
+    half-hours of each hour with the hourly mean. Whether a facility's day
+    is folded is read from its rows (no odd buckets), not from the
+    retention settings, so days the fold hasn't reached yet stay half-hourly.
+    """
+    n = end_slot - first_slot
+    values = np.full((len(facility_ids), max(n, 0)), np.nan)
+    if n <= 0 or not facility_ids:
+        return values
+    
+    r = models.UsageRollup
+    rows = db.query(r.facility_id, r.local_date, r.bucket, r.usage_sum, r.sample_count).filter(
+        r.local_date >= date.fromordinal(first_slot // SLOTS_PER_DAY),
+        r.local_date <= date.fromordinal((end_slot - 1) // SLOTS_PER_DAY),
+        r.facility_id.in_(facility_ids),
+        r.sample_count > 0,
+    ).all()
+    if not rows:
+        return values
+    
+    fid, day, bucket, total, count = (np.array(col) for col in zip(*rows))
+    day = np.array([d.toordinal() for d in day], dtype=np.int64)
+    ids = np.asarray(facility_ids)
+    order = np.argsort(ids)
+    row_index = order[np.searchsorted(ids, fid, sorter=order)]
+    col = day * SLOTS_PER_DAY + bucket.astype(np.int64) - first_slot
+    mean = total.astype(np.float64) / count
+    
+    facility_day = row_index * (day.max() - day.min() + 1) + (day - day.min())
+    hourly = ~np.isin(facility_day, facility_day[bucket % 2 == 1])
+    folded = hourly & (bucket % 2 == 0) & (col + 1 < n) & (col + 1 >= 0)
+    values[row_index[folded], col[folded] + 1] = mean[folded]
+    inside = (col >= 0) & (col < n)
+    values[row_index[inside], col[inside]] = mean[inside]
+    return values
+
+
+def _update(state: ForecastState, values: np.ndarray) -> ForecastState:
+    """A new state with the slots in `values` (F, n), starting at state.end_slot, fed in."""
+    naive, ewma, season = state.naive.copy(), state.ewma.copy(), state.season.copy()
+    level, trend = state.level.copy(), state.trend.copy()
+    n = values.shape[1]
+    phases = (state.end_slot + np.arange(n)) % SEASON
+    observed = ~np.isnan(values)
+    
+    # Seasonal profiles: up to one week of columns at a time (phases in a chunk are distinct)
+    with np.errstate(invalid="ignore"):
+        for start in range(0, n, SEASON):
+            block, seen, ph = values[:, start:start + SEASON], observed[:, start:start + SEASON], phases[start:start + SEASON]
+            naive[:, ph] = np.where(seen, block, naive[:, ph])
+            prev = ewma[:, ph]
+            smoothed = np.where(np.isnan(prev), block, prev + EWMA_ALPHA * (block - prev))
+            ewma[:, ph] = np.where(seen, smoothed, prev)
+        
+        # Holt-Winters is a recurrence, so it walks the slots, but only those with readings
+        for j in np.flatnonzero(observed.any(axis=0)):
+            y, seen, p = values[:, j], observed[:, j], phases[j]
+            s = season[:, p]
+            predicted = np.where(np.isnan(level), y - s, level + HW_PHI * trend)
+            new_level = HW_ALPHA * (y - s) + (1 - HW_ALPHA) * predicted
+            new_trend = np.where(np.isnan(level), 0.0,
+                                 HW_BETA * (new_level - level) + (1 - HW_BETA) * HW_PHI * trend)
+            season[:, p] = np.where(seen, HW_GAMMA * (y - new_level) + (1 - HW_GAMMA) * s, s)
+            trend = np.where(seen, new_trend, trend)
+            level = np.where(seen, new_level, level)
+    
+    return replace(state, end_slot=state.end_slot + n, naive=naive, ewma=ewma,
+                   level=level, trend=trend, season=season)
+
+
+def fit(values: np.ndarray, first_slot: int, facility_ids) -> ForecastState:
+    """Fit all models on `values` (F, n) covering slots first_slot .. first_slot + n."""
+    f, n = values.shape
+    offset = first_slot % SEASON
+    weeks = -(-(offset + n) // SEASON)
+    # Start Holt-Winters from the average weekly profile, so the first weeks aren't spent learning it
+    padded = np.full((f, weeks * SEASON), np.nan)
+    padded[:, offset:offset + n] = values
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN slices (closed hours) are expected
+        level = np.nanmean(values, axis=1) if n else np.full(f, np.nan)
+        profile = np.nanmean(padded.reshape(f, weeks, SEASON), axis=1) if weeks else np.full((f, SEASON), np.nan)
+    season = np.nan_to_num(profile - level[:, None])
+    empty = np.full((f, SEASON), np.nan)
+    state = ForecastState(
+        facility_ids=tuple(facility_ids),
+        end_slot=first_slot,
+        naive=empty,
+        ewma=empty.copy(),
+        level=np.full(f, np.nan),
+        trend=np.zeros(f),
+        season=season,
+    )
+    return _update(state, values)
+
+
+def predict(state: ForecastState, start_slot: int, steps: int, model: str) -> np.ndarray:
+    """(F, steps) forecasts for slots start_slot .. start_slot + steps; NaN where never open."""
+    if model not in MODELS:
+        raise ValueError(f"Unknown forecast model {model!r}; choose from {', '.join(MODELS)}")
+    slots = start_slot + np.arange(steps)
+    ph = slots % SEASON
+    if model == "seasonal_naive":
+        out = state.naive[:, ph]
+    elif model == "seasonal_ewma":
+        out = state.ewma[:, ph]
+    else:
+        ahead = np.maximum(slots - state.end_slot + 1, 1)
+        damping = HW_PHI * (1 - HW_PHI ** ahead) / (1 - HW_PHI)
+        out = state.level[:, None] + damping * state.trend[:, None] + state.season[:, ph]
+    return np.where(np.isnan(state.naive[:, ph]), np.nan, np.clip(out, 0, 100))
+
+
+# A scrape that commits after its slot was fed in would be missed, so the
+# last few slots are held back from the cached base state and re-read on
+# every update, the way usage_stats re-reads its REFRESH_OVERLAP
+REFRESH_OVERLAP_SLOTS = 4
+
+_base = None  # fitted through end_slot - REFRESH_OVERLAP_SLOTS of the last update
+_state = None  # _base with the overlap slots fed in
+_state_version = None  # data_version() when _state was built
+_state_lock = threading.Lock()
+_stats = {"full_fits": 0, "incremental_updates": 0, "slots_fed": 0}
+
+
+def _feed(base: ForecastState, values: np.ndarray, end_slot: int) -> tuple:
+    """(new base, state): `values` from base.end_slot to end_slot, split at the overlap."""
+    split = max(end_slot - REFRESH_OVERLAP_SLOTS - base.end_slot, 0)
+    base = _update(base, values[:, :split])
+    return base, _update(base, values[:, split:])
+
+
+def fitted_state(db: Session, now: datetime = None) -> ForecastState:
+    """The cached fitted models, brought up to the last completed slot."""
+    global _base, _state, _state_version
+    end_slot = current_slot(now)
+    facility_ids = tuple(sorted(facility_index(db).names))
+    history = settings.forecast_history_weeks * SEASON
+    version = data_version(db)
+    with _state_lock:
+        base, state = _base, _state
+        # Imports, rebuilds and retention rewrite slots already fed in
+        if (base is None or base.facility_ids != facility_ids or end_slot - base.end_slot > history
+                or version[1] != _state_version[1]):
+            first_slot = end_slot - history
+            values = load_slot_matrix(db, first_slot, end_slot, facility_ids)
+            split = max(history - REFRESH_OVERLAP_SLOTS, 0)
+            base = fit(values[:, :split], first_slot, facility_ids)
+            state = _update(base, values[:, split:])
+            _stats["full_fits"] += 1
+            _stats["slots_fed"] += history
+        elif state.end_slot < end_slot or version != _state_version:
+            _stats["incremental_updates"] += 1
+            _stats["slots_fed"] += max(end_slot - base.end_slot, 0)
+            base, state = _feed(base, load_slot_matrix(db, base.end_slot, end_slot, facility_ids), end_slot)
+        _base, _state, _state_version = base, state, version
+        return state
+
+
+def invalidate_forecasts() -> None:
+    """Drop the fitted models, e.g. after rollups were rebuilt."""
+    global _base, _state
+    with _state_lock:
+        _base = _state = None
+
+
+def forecast_stats() -> dict:
+    with _state_lock:
+        return {**_stats, "fitted_through": slot_start_local(_state.end_slot).isoformat() if _state else None}
+
+
+def forecast(db: Session, hours: int = 24, model: str = None, facility_ids=None, now: datetime = None) -> list:
+    """Forecasts for the next `hours` (at most 72) starting with the current slot.
+    
+    Returns [{"facility_id", "facility", "points": [(local datetime, pct), ...]}]
+    in display order; slots a facility has never been open are left out.
+    `facility_ids` None means all facilities.
+    """
+    state = fitted_state(db, now)
+    start = current_slot(now)
+    steps = min(hours, MAX_HOURS) * 60 // SLOT_MINUTES
+    values = predict(state, start, steps, model or settings.forecast_model)
+    times = [slot_start_local(start + i) for i in range(steps)]
+    index = facility_index(db, state.facility_ids)
+    wanted = set(state.facility_ids if facility_ids is None else facility_ids)
+    results = []
+    for row, facility_id in enumerate(state.facility_ids):
+        if facility_id not in wanted:
+            continue
+        points = [(times[i], round(float(v), 1)) for i, v in enumerate(values[row]) if not np.isnan(v)]
+        if points:
+            results.append({"facility_id": facility_id, "facility": index.name(facility_id), "points": points})
+    order = {name: i for i, name in enumerate(index.ordered_names)}
+    return sorted(results, key=lambda r: (order.get(r["facility"], len(order)), r["facility_id"]))
+
+
+def hourly_outlook(db: Session, hours: int = 24, model: str = None, facility_ids=None, now: datetime = None) -> list:
+    """[(local hour start, mean forecast pct)] across `facility_ids`, one entry per hour with any forecast."""
+    totals = {}
+    for item in forecast(db, hours, model, facility_ids, now):
+        for when, pct in item["points"]:
+            hour = when.replace(minute=0)
+            total, count = totals.get(hour, (0.0, 0))
+            totals[hour] = (total + pct, count + 1)
+    return [(hour, round(total / count, 1)) for hour, (total, count) in sorted(totals.items())]
+
+
+def backtest(db: Session, days: int = 14, horizon_hours: int = 24, history_weeks: int = None,
+             now: datetime = None) -> dict:
+    """Walk-forward MAE per model over the last `days` complete days.
+    
+    Fits on the `history_weeks` before the test period, then for each day:
+    forecasts the next `horizon_hours` from local midnight, scores the slots
+    that had readings, and feeds the day in incrementally (the same path as
+    live updates). Returns {model: {"mae": ..., "points": ...}}.
+    """
+    history = (history_weeks or settings.forecast_history_weeks) * SEASON
+    facility_ids = tuple(sorted(facility_index(db).names))
+    end_slot = current_slot(now) // SLOTS_PER_DAY * SLOTS_PER_DAY  # today's local midnight
+    test_start = end_slot - days * SLOTS_PER_DAY
+    first_slot = test_start - history
+    values = load_slot_matrix(db, first_slot, end_slot, facility_ids)
+    state = fit(values[:, :history], first_slot, facility_ids)
+    
+    steps = min(horizon_hours, MAX_HOURS) * 60 // SLOT_MINUTES
+    abs_error = {m: 0.0 for m in MODELS}
+    points = {m: 0 for m in MODELS}
+    for cut in range(test_start, end_slot, SLOTS_PER_DAY):
+        offset = cut - first_slot
+        actual = values[:, offset:offset + steps]
+        for model in MODELS:
+            predicted = predict(state, cut, actual.shape[1], model)
+            scored = ~np.isnan(actual) & ~np.isnan(predicted)
+            abs_error[model] += float(np.abs(predicted - actual)[scored].sum())
+            points[model] += int(scored.sum())
+        state = _update(state, values[:, offset:offset + SLOTS_PER_DAY])
+    return {
+        m: {"mae": round(abs_error[m] / points[m], 2) if points[m] else None, "points": points[m]}
+        for m in MODELS
+    }
@@ -1,14 +1,142 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
+from sqlalchemy import func, cast, Integer
 from app import models
+from app.config import settings
+from app.facilities import facility_ids_for
+from analytics.cache import LRUCache
+from analytics.core import local_fields, mean_dict
+from analytics.rollups import rollup_interval_usage, rollups_backfilled
+from analytics.snapshots import data_version, load_snapshot_arrays
+from analytics.usage_stats import usage_stats
+from analytics.windows import best_windows, forward_fill, format_minutes
 import pytz
 
+TZ_NAME = "America/Chicago"
+
+recommendation_cache = LRUCache(maxsize=settings.recommendation_cache_size, name="recommendations")
+
+
+def _interval_usage_sql(db: Session, since_utc: datetime, weekday: int,
+                        start_minutes: int, end_minutes: int, facility_ids, bucket_minutes: int = 30):
+    """Aggregate fixed-size intervals inside Postgres.
+    
+    Does the timezone conversion, weekday filter and bucketing in a single
+    GROUP BY so only (bucket, avg, count) rows leave the database.
+    """
+    snap = models.UsageSnapshot
+    # timestamp_utc is naive UTC: tag it as UTC, then render it as Texas wall time
+    local_ts = func.timezone(TZ_NAME, func.timezone("UTC", snap.timestamp_utc))
+    hour = cast(func.extract("hour", local_ts), Integer)
+    minute = cast(func.extract("minute", local_ts), Integer)
+    minute_of_day = hour * 60 + minute
+    bucket = (minute_of_day // bucket_minutes).label("bucket")
+    
+    query = db.query(
+        bucket,
+        func.avg(snap.usage_percentage),
+        func.count(snap.usage_percentage),
+    ).filter(
+        snap.timestamp_utc >= since_utc,
+        # isodow is 1=Monday … 7=Sunday, Python's weekday() is 0=Monday
+        cast(func.extract("isodow", local_ts), Integer) == weekday + 1,
+        minute_of_day >= start_minutes,
+        minute_of_day < end_minutes,
+    )
+    if facility_ids is not None:
+        query = query.filter(snap.facility_id.in_(facility_ids))
+    
+    return {
+        b: (float(avg), count)
+        for b, avg, count in query.group_by(bucket).all()
+    }
+
+
+def _interval_usage_python(db: Session, since_utc: datetime, weekday: int,
+                           start_minutes: int, end_minutes: int, facility_ids, bucket_minutes: int = 30):
+    """Aggregate fixed-size intervals with NumPy (fallback for non-Postgres backends)."""
+    arrays = load_snapshot_arrays(db, since_utc, facility_ids)
+    _day, snap_weekday, minute_of_day = local_fields(arrays.epoch)
+    mask = (snap_weekday == weekday) & (minute_of_day >= start_minutes) & (minute_of_day < end_minutes)
+    return mean_dict(minute_of_day[mask] // bucket_minutes, arrays.pct[mask], 24 * 60 // bucket_minutes)
+
+
+def _interval_usage(db: Session, since: datetime, weekday: int,
+                    start_minutes: int, end_minutes: int, facility_ids, bucket_minutes: int, version=None):
+    """{bucket: (avg, count)} for one local weekday.
+    
+    At 30-minute resolution this comes from the in-memory usage stats, which
+    cost the same however long the history is. Rollups since `since` (aware,
+    local time) stand in while the stats table is empty, and raw snapshots
+    while the rollups haven't been backfilled yet, or for finer buckets. An
+    empty window from a populated source (e.g. a facility closed all day)
+    is an answer, not a reason to scan the next one. The two sources weigh
+    readings differently:
+    
+    - stats: each facility's EWMA for the bucket, averaged with every
+      facility counting once. Scraping every 30 minutes puts one reading
+      a week in each cell, so with the default alpha of 0.4 the reading
+      from k weeks back weighs 0.6**k as much as the newest;
+    - rollups and raw snapshots: the plain mean of every reading since
+      `since`, so facilities count by sample count (equally when each
+      was scraped every time).
+    
+    On steady usage, with every facility scraped each time, both give the
+    same average. `count` is the number of readings behind it either way.
+    """
+    if bucket_minutes == 30:
+        stats = usage_stats(db, version)
+        if stats.samples():
+            return stats.interval_usage(weekday, start_minutes, end_minutes, facility_ids)
+        if rollups_backfilled(db):
+            return rollup_interval_usage(db, since.date(), weekday, start_minutes, end_minutes, facility_ids)
+    
+    if db.get_bind().dialect.name == "postgresql":
+        aggregate = _interval_usage_sql
+    else:
+        aggregate = _interval_usage_python
+    since_utc = since.astimezone(pytz.UTC).replace(tzinfo=None)
+    return aggregate(db, since_utc, weekday, start_minutes, end_minutes, facility_ids, bucket_minutes)
+
+
+def get_data_version(db: Session):
+    """Version of the stored usage data; changes with every scrape, import, rebuild and retention run."""
+    return data_version(db)
+
+
+def prefs_fingerprint(prefs) -> tuple:
+    """The preference fields that determine a recommendation result."""
+    return (
+        prefs.preferred_start_time_local or None,
+        prefs.preferred_end_time_local or None,
+        prefs.workout_duration_minutes or 60,
+        prefs.crowd_tolerance_pct or 100,
+        tuple(sorted(prefs.areas_of_interest or [])),
+    )
+
+
 def get_recommendations(db: Session, prefs: models.UserPreferences):
-    """Get recommended time ranges for today based on last 2 weeks of data.
-    Returns time windows matching the user's workout duration."""
+    """Get recommended time ranges for today from recent weeks of the same weekday.
+    Returns time windows matching the user's workout duration.
+    
+    Results are cached per (weekday, preferences, data version),
+    so repeated dashboard loads between scrapes skip the aggregation.
+    """
+    # Always use Texas time (America/Chicago)
+    now = datetime.now(pytz.timezone(TZ_NAME))
+    version = get_data_version(db)
+    key = (now.weekday(), prefs_fingerprint(prefs), version)
+    windows = recommendation_cache.get_or_compute(
+        key, lambda: tuple(_compute_recommendations(db, prefs, now, version=version))
+    )
+    return list(windows)
+
+
+def _compute_recommendations(db: Session, prefs: models.UserPreferences, now: datetime, k: int = 3,
+                             version=None):
     # Get workout duration in minutes
     workout_duration = prefs.workout_duration_minutes or 60
-    workout_hours = workout_duration / 60.0  # Convert to hours (e.g., 90 min = 1.5 hours)
+    bucket_minutes = settings.recommendation_bucket_minutes
     
     # Default to all day if not set
     if not prefs.preferred_start_time_local:
@@ -23,146 +151,118 @@ def get_recommendations(db: Session, prefs: models.UserPreferences):
     else:
         end_hour, end_min = map(int, prefs.preferred_end_time_local.split(":"))
     
-    # Always use Texas time (America/Chicago)
-    tz = pytz.timezone("America/Chicago")
-    now = datetime.now(tz)
+    start_minutes_total = start_hour * 60 + start_min
+    end_minutes_total = end_hour * 60 + end_min
+    day_minutes = 24 * 60
     
-    # Get data from last 2 weeks for same weekday
+    # Recent usage for the same weekday (two weeks when reading rollups or raw snapshots).
+    # A window ending at or before its start (e.g. 22:00-02:00) runs into tomorrow,
+    # so tomorrow's weekday fills the buckets after midnight.
     weekday = now.weekday()
     two_weeks_ago = now - timedelta(days=14)
-    
-    # If no areas specified, use all facilities
-    query = db.query(models.UsageSnapshot).filter(
-        models.UsageSnapshot.timestamp_utc >= two_weeks_ago.astimezone(pytz.UTC).replace(tzinfo=None)
-    )
-    if prefs.areas_of_interest:
-        query = query.filter(models.UsageSnapshot.location_name.in_(prefs.areas_of_interest))
-    
-    snapshots = query.all()
-    
-    if not snapshots:
-        return []
-    
-    # Group by 30-minute intervals for more granular analysis
-    interval_usage = {}  # Key: (hour, half_hour), Value: list of percentages
-    for snap in snapshots:
-        snap_dt = pytz.UTC.localize(snap.timestamp_utc).astimezone(tz)
-        if snap_dt.weekday() == weekday:
-            hour = snap_dt.hour
-            minute = snap_dt.minute
-            half_hour = 0 if minute < 30 else 1
-            interval_key = (hour, half_hour)
-            
-            # Convert to minutes since start of day
-            time_minutes = hour * 60 + minute
-            start_minutes = start_hour * 60 + start_min
-            end_minutes = end_hour * 60 + end_min
-            
-            if start_minutes <= time_minutes < end_minutes:
-                interval_usage.setdefault(interval_key, []).append(snap.usage_percentage)
+    # If no areas specified, use all facilities (None)
+    facility_ids = facility_ids_for(db, prefs.areas_of_interest)
+    if end_minutes_total > start_minutes_total:
+        interval_usage = _interval_usage(
+            db, two_weeks_ago, weekday, start_minutes_total, end_minutes_total, facility_ids, bucket_minutes,
+            version,
+        )
+    else:
+        interval_usage = _interval_usage(
+            db, two_weeks_ago, weekday, start_minutes_total, day_minutes, facility_ids, bucket_minutes, version,
+        )
+        buckets_per_day = day_minutes // bucket_minutes
+        after_midnight = _interval_usage(
+            db, two_weeks_ago, (weekday + 1) % 7, 0, end_minutes_total, facility_ids, bucket_minutes, version,
+        )
+        for bucket, stats in after_midnight.items():
+            interval_usage[bucket + buckets_per_day] = stats
+        end_minutes_total += day_minutes
     
     if not interval_usage:
         return []
     
-    # Calculate average usage per 30-minute interval
+    # Dense per-bucket array; buckets finer than the scrape interval inherit the
+    # preceding reading, and intervals over the user's crowd tolerance count as missing
     tolerance = prefs.crowd_tolerance_pct or 100
-    interval_averages = {}
-    for interval_key, vals in interval_usage.items():
-        avg = sum(vals) / len(vals)
-        if avg <= tolerance:
-            interval_averages[interval_key] = avg
-    
-    if not interval_averages:
-        return []
+    bucket_values = [None] * (max(interval_usage) + 1)
+    for bucket, (avg, _count) in interval_usage.items():
+        bucket_values[bucket] = avg
+    fill = max(0, settings.scrape_interval_minutes // bucket_minutes - 1)
+    bucket_values = [
+        avg if avg is not None and avg <= tolerance else None
+        for avg in forward_fill(bucket_values, fill)
+    ]
     
-    # Find best time windows of the specified duration
-    # Convert workout duration to number of 30-minute intervals
-    num_intervals = int(workout_duration / 30)  # e.g., 90 min = 3 intervals
-    
-    # Generate all possible time windows of the specified duration
-    windows = []
-    start_minutes_total = start_hour * 60 + start_min
-    end_minutes_total = end_hour * 60 + end_min
-    
-    # Try every 30-minute interval as a potential start time
-    for start_minutes in range(start_minutes_total, end_minutes_total - workout_duration + 1, 30):
-        end_minutes = start_minutes + workout_duration
-        
-        # Check if we have data for all intervals in this window
-        window_intervals = []
-        window_usage = []
-        
-        current_minutes = start_minutes
-        valid_window = True
-        
-        while current_minutes < end_minutes:
-            hour = current_minutes // 60
-            minute = current_minutes % 60
-            half_hour = 0 if minute < 30 else 1
-            interval_key = (hour, half_hour)
-            
-            if interval_key in interval_averages:
-                window_intervals.append(interval_key)
-                window_usage.append(interval_averages[interval_key])
-            else:
-                # If we don't have data for an interval, skip this window
-                valid_window = False
-                break
-            
-            current_minutes += 30
-        
-        if valid_window and window_usage:
-            # Calculate average usage for this window
-            avg_usage = sum(window_usage) / len(window_usage)
-            
-            # Format time range
-            start_h = start_minutes // 60
-            start_m = start_minutes % 60
-            end_h = end_minutes // 60
-            end_m = end_minutes % 60
-            
-            if start_m == 0:
-                start_str = f"{start_h}:00"
-            else:
-                start_str = f"{start_h}:{start_m:02d}"
-            
-            if end_m == 0:
-                end_str = f"{end_h}:00"
-            else:
-                end_str = f"{end_h}:{end_m:02d}"
-            
-            time_str = f"{start_str}-{end_str}"
-            windows.append((time_str, avg_usage, start_minutes))
-    
-    if not windows:
-        return []
-    
-    # Sort by average usage (lowest first)
-    windows.sort(key=lambda x: x[1])
-    
-    # Return top 3 windows
-    return [(time_str, avg) for time_str, avg, _ in windows[:3]]
+    # Lowest-usage windows of the workout duration, by prefix sums over the buckets
+    windows = best_windows(
+        bucket_values, bucket_minutes, workout_duration,
+        start_minutes_total, end_minutes_total, k=k,
+    )
+    return [
+        (f"{format_minutes(start)}-{format_minutes(end)}", avg)
+        for start, end, avg in windows
+    ]
+
+def _heatmap_cells_sql(db: Session, since_utc: datetime, facility_ids):
+    """Aggregate (weekday, hour) cells inside Postgres over a bounded time window."""
+    snap = models.UsageSnapshot
+    local_ts = func.timezone(TZ_NAME, func.timezone("UTC", snap.timestamp_utc))
+    day = (cast(func.extract("isodow", local_ts), Integer) - 1).label("day")
+    hour = cast(func.extract("hour", local_ts), Integer).label("hour")
+    query = db.query(
+        day, hour, func.sum(snap.usage_percentage), func.count(snap.usage_percentage)
+    ).filter(snap.timestamp_utc >= since_utc)
+    if facility_ids is not None:
+        query = query.filter(snap.facility_id.in_(facility_ids))
+    return query.group_by(day, hour).all()
+
 
-def get_heatmap_data(db: Session, prefs: models.UserPreferences):
-    """Get day x hour heatmap data for selected area."""
-    # If no areas specified, use all facilities
-    query = db.query(models.UsageSnapshot)
-    if prefs.areas_of_interest:
-        query = query.filter(models.UsageSnapshot.location_name.in_(prefs.areas_of_interest))
+def _heatmap_cells_python(db: Session, since_utc: datetime, facility_ids):
+    """Aggregate (weekday, hour) cells with NumPy (fallback for non-Postgres backends)."""
+    arrays = load_snapshot_arrays(db, since_utc, facility_ids)
+    _day, weekday, minute_of_day = local_fields(arrays.epoch)
+    cells = mean_dict(weekday * 24 + minute_of_day // 60, arrays.pct, 7 * 24)
+    return [(key // 24, key % 24, avg * count, count) for key, (avg, count) in cells.items()]
+
+
+def get_heatmap_data(db: Session, prefs: models.UserPreferences, weeks: int = None, all_history: bool = False):
+    """Get day x hour heatmap data for selected area over the last `weeks` weeks (default HEATMAP_WEEKS).
+    Returns {(weekday, hour): (average_pct, sample_count, std_dev)}; std_dev is None from rollups.
     
-    snapshots = query.limit(2000).all()
+    With `all_history`, every reading in the usage stats is read from memory
+    instead, with the spread per cell (rollups still stand in while the
+    stats table is empty).
+    """
+    # If no areas specified, use all facilities.
+    facility_ids = facility_ids_for(db, prefs.areas_of_interest)
+    if all_history:
+        cells = usage_stats(db).heatmap(facility_ids)
+        if cells:
+            return cells
+    weeks = weeks or settings.heatmap_weeks
     
-    if not snapshots:
-        return {}
+    # Always use Texas time (America/Chicago); window starts at a local midnight
+    tz = pytz.timezone(TZ_NAME)
+    since_date = datetime.now(tz).date() - timedelta(weeks=weeks)
+    since_local = tz.localize(datetime.combine(since_date, datetime.min.time()))
+    since_utc = since_local.astimezone(pytz.UTC).replace(tzinfo=None)
     
-    # Always use Texas time (America/Chicago)
-    tz = pytz.timezone("America/Chicago")
-    heatmap = {}
+    # Rollups cost O(weeks x buckets) whatever the snapshot table size.
+    r = models.UsageRollup
+    hour = r.bucket // 2
+    rollup_query = db.query(
+        r.weekday, hour, func.sum(r.usage_sum), func.sum(r.sample_count)
+    ).filter(r.local_date >= since_date)
+    if facility_ids is not None:
+        rollup_query = rollup_query.filter(r.facility_id.in_(facility_ids))
+    cells = rollup_query.group_by(r.weekday, hour).all()
     
-    for snap in snapshots:
-        snap_dt = pytz.UTC.localize(snap.timestamp_utc).astimezone(tz)
-        key = (snap_dt.weekday(), snap_dt.hour)
-        heatmap.setdefault(key, []).append(snap.usage_percentage)
+    if not cells:
+        if db.get_bind().dialect.name == "postgresql":
+            cells = _heatmap_cells_sql(db, since_utc, facility_ids)
+        else:
+            cells = _heatmap_cells_python(db, since_utc, facility_ids)
     
     # Average per cell
-    return {k: sum(v) / len(v) for k, v in heatmap.items()}
+    return {(day, h): (total / count, count, None) for day, h, total, count in cells if count}
@@ -0,0 +1,194 @@
+"""
+Half-hourly usage rollups maintained at ingest time.
+
+Each row of `usage_rollups` holds sum/count/min/max of the snapshots that fell
+into one 30-minute bucket of one local (Texas) day for one facility (by id). The scraper
+folds new snapshots in as it stores them, so dashboards, digests and agent tools
+read O(buckets) rows instead of re-aggregating the raw snapshot history.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app import models
+from analytics.snapshots import bump_data_version
+import pytz
+
+TZ_NAME = "America/Chicago"
+
+# Aggregates any relation with (facility_id, timestamp_utc, usage_percentage)
+# columns into rollup rows; shared by the backfill and the bulk loader.
+ROLLUP_SELECT_SQL = """
+    SELECT facility_id,
+           local_ts::date,
+           (EXTRACT(HOUR FROM local_ts)::int * 60 + EXTRACT(MINUTE FROM local_ts)::int) / 30,
+           EXTRACT(ISODOW FROM local_ts)::int - 1,
+           SUM(usage_percentage), COUNT(*),
+           MIN(usage_percentage), MAX(usage_percentage)
+    FROM (
+        SELECT facility_id, usage_percentage,
+               timezone(:tz, timezone('UTC', timestamp_utc)) AS local_ts
+        FROM {source}
+    ) s
+    GROUP BY 1, 2, 3, 4
+"""
+
+ROLLUP_INSERT_SQL = """
+    INSERT INTO usage_rollups
+        (facility_id, local_date, bucket, weekday,
+         usage_sum, sample_count, usage_min, usage_max)
+"""
+
+# Merge aggregated rows into existing buckets instead of replacing them
+ROLLUP_MERGE_SQL = """
+    ON CONFLICT (facility_id, local_date, bucket) DO UPDATE SET
+        usage_sum = usage_rollups.usage_sum + EXCLUDED.usage_sum,
+        sample_count = usage_rollups.sample_count + EXCLUDED.sample_count,
+        usage_min = LEAST(usage_rollups.usage_min, EXCLUDED.usage_min),
+        usage_max = GREATEST(usage_rollups.usage_max, EXCLUDED.usage_max)
+"""
+
+_BACKFILL_SQL = ROLLUP_INSERT_SQL + ROLLUP_SELECT_SQL.format(
+    source="usage_snapshots WHERE timestamp_utc >= :since_utc"
+)
+
+
+def local_midnight_utc(local_date: date) -> datetime:
+    """Naive UTC timestamp of local (Texas) midnight starting `local_date`."""
+    tz = pytz.timezone(TZ_NAME)
+    return tz.localize(datetime.combine(local_date, datetime.min.time())).astimezone(pytz.UTC).replace(tzinfo=None)
+
+
+def local_bucket(timestamp_utc: datetime):
+    """Return (local_date, weekday, bucket) for a naive UTC timestamp."""
+    local_dt = pytz.UTC.localize(timestamp_utc).astimezone(pytz.timezone(TZ_NAME))
+    bucket = (local_dt.hour * 60 + local_dt.minute) // 30
+    return local_dt.date(), local_dt.weekday(), bucket
+
+
+def apply_snapshots(db: Session, rows) -> int:
+    """Fold newly inserted snapshots into the rollups.
+    
+    `rows` is an iterable of (facility_id, timestamp_utc, usage_percentage).
+    Runs inside the caller's transaction so rollups commit together with the
+    snapshots they summarise. Returns the number of rollup rows touched.
+    """
+    deltas = {}
+    for facility_id, timestamp_utc, pct in rows:
+        local_date, weekday, bucket = local_bucket(timestamp_utc)
+        key = (facility_id, local_date, bucket)
+        if key in deltas:
+            d = deltas[key]
+            d["usage_sum"] += pct
+            d["sample_count"] += 1
+            d["usage_min"] = min(d["usage_min"], pct)
+            d["usage_max"] = max(d["usage_max"], pct)
+        else:
+            deltas[key] = {
+                "facility_id": facility_id,
+                "local_date": local_date,
+                "bucket": bucket,
+                "weekday": weekday,
+                "usage_sum": pct,
+                "sample_count": 1,
+                "usage_min": pct,
+                "usage_max": pct,
+            }
+    
+    if not deltas:
+        return 0
+    
+    if db.get_bind().dialect.name == "postgresql":
+        table = models.UsageRollup.__table__
+        stmt = pg_insert(table).values(list(deltas.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["facility_id", "local_date", "bucket"],
+            set_={
+                "usage_sum": table.c.usage_sum + stmt.excluded.usage_sum,
+                "sample_count": table.c.sample_count + stmt.excluded.sample_count,
+                "usage_min": func.least(table.c.usage_min, stmt.excluded.usage_min),
+                "usage_max": func.greatest(table.c.usage_max, stmt.excluded.usage_max),
+            },
+        )
+        db.execute(stmt)
+    else:
+        for key, d in deltas.items():
+            existing = db.get(models.UsageRollup, key)
+            if existing:
+                existing.usage_sum += d["usage_sum"]
+                existing.sample_count += d["sample_count"]
+                existing.usage_min = min(existing.usage_min, d["usage_min"])
+                existing.usage_max = max(existing.usage_max, d["usage_max"])
+            else:
+                db.add(models.UsageRollup(**d))
+    return len(deltas)
+
+
+def backfill_rollups(db: Session, days: int = None) -> int:
+    """Rebuild rollups from raw snapshots, for the last `days` local days or all history.
+    
+    Whole local days are deleted and recomputed so the result is idempotent.
+    Days older than the oldest raw snapshot are left alone: their raw rows
+    were purged by the retention job and the rollups are all that is left.
+    Does not commit; the caller owns the transaction.
+    """
+    oldest = db.query(func.min(models.UsageSnapshot.timestamp_utc)).scalar()
+    if oldest is None:
+        return 0
+    since_date = local_bucket(oldest)[0]
+    if days is not None:
+        since_date = max(since_date, datetime.now(pytz.timezone(TZ_NAME)).date() - timedelta(days=days))
+    since_utc = local_midnight_utc(since_date)
+    
+    db.query(models.UsageRollup).filter(
+        models.UsageRollup.local_date >= since_date
+    ).delete(synchronize_session=False)
+    
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(_BACKFILL_SQL), {"tz": TZ_NAME, "since_utc": since_utc})
+    else:
+        rows = db.query(
+            models.UsageSnapshot.facility_id,
+            models.UsageSnapshot.timestamp_utc,
+            models.UsageSnapshot.usage_percentage,
+        ).filter(models.UsageSnapshot.timestamp_utc >= since_utc).all()
+        apply_snapshots(db, rows)
+    bump_data_version(db, history=True)
+    
+    return db.query(func.count()).select_from(models.UsageRollup).filter(
+        models.UsageRollup.local_date >= since_date
+    ).scalar()
+
+
+def rollups_backfilled(db: Session) -> bool:
+    """True once usage_rollups has any rows; ingest keeps it current from then on."""
+    return db.query(models.UsageRollup.facility_id).limit(1).first() is not None
+
+
+def rollup_interval_usage(db: Session, since_date: date, weekday: int,
+                          start_minutes: int, end_minutes: int, facility_ids=None):
+    """Read 30-minute interval averages for one weekday from the rollups.
+    
+    Returns {bucket: (avg, count)} like the raw-snapshot aggregations in
+    analytics.recommendations. Buckets that overlap [start_minutes, end_minutes)
+    are included whole. `facility_ids` None means all facilities.
+    """
+    r = models.UsageRollup
+    query = db.query(
+        r.bucket,
+        func.sum(r.usage_sum),
+        func.sum(r.sample_count),
+    ).filter(
+        r.weekday == weekday,
+        r.local_date >= since_date,
+        r.bucket >= start_minutes // 30,
+        r.bucket * 30 < end_minutes,
+    )
+    if facility_ids is not None:
+        query = query.filter(r.facility_id.in_(facility_ids))
+    
+    return {
+        b: (total / count, count)
+        for b, total, count in query.group_by(r.bucket).all()
+        if count
+    }
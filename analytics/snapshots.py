@@ -0,0 +1,126 @@
+"""
+Shared read path for raw usage snapshots.
+
+Selects only the columns a caller needs (never whole ORM entities) and streams
+them with `yield_per`, which uses a server-side cursor on Postgres, so memory
+stays bounded by the chunk size however many rows match. Callers get plain
+tuples or a compact SnapshotArrays. Facilities are filtered and returned by
+id; app.facilities maps ids to names.
+"""
+from datetime import datetime
+from sqlalchemy import select, func, update
+from sqlalchemy.orm import Session
+from app import models
+from app.facilities import facility_index
+from analytics.core import SnapshotArrays
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 10_000
+READING_COLUMNS = ("timestamp_utc", "facility_id", "usage_percentage")
+
+
+def _filtered(stmt, since_utc=None, until_utc=None, facility_ids=None):
+    snap = models.UsageSnapshot
+    if since_utc is not None:
+        stmt = stmt.where(snap.timestamp_utc >= since_utc)
+    if until_utc is not None:
+        stmt = stmt.where(snap.timestamp_utc < until_utc)
+    if facility_ids is not None:
+        stmt = stmt.where(snap.facility_id.in_(facility_ids))
+    return stmt
+
+
+def iter_snapshot_chunks(db: Session, columns=READING_COLUMNS, since_utc: datetime = None,
+                         until_utc: datetime = None, facility_ids=None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yield lists of row tuples (in `columns` order), at most `chunk_size` per list."""
+    snap = models.UsageSnapshot
+    stmt = _filtered(
+        select(*(getattr(snap, c) for c in columns)), since_utc, until_utc, facility_ids,
+    )
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+
+def iter_snapshot_rows(db: Session, columns=READING_COLUMNS, **filters):
+    """Stream matching snapshots as tuples, one at a time."""
+    for chunk in iter_snapshot_chunks(db, columns, **filters):
+        yield from chunk
+
+
+def load_snapshot_arrays(db: Session, since_utc: datetime = None, facility_ids=None,
+                         until_utc: datetime = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> SnapshotArrays:
+    """Stream (timestamp, facility_id, pct) into compact arrays, one chunk of tuples at a time.
+    
+    The facility codes are the facility ids themselves; `facilities` maps them to names.
+    """
+    epochs, facility_codes, pcts = [], [], []
+    for chunk in iter_snapshot_chunks(
+        db, READING_COLUMNS, since_utc=since_utc, until_utc=until_utc,
+        facility_ids=facility_ids, chunk_size=chunk_size,
+    ):
+        timestamps, ids, values = zip(*chunk)
+        epochs.append(np.array(timestamps, dtype="datetime64[s]").astype(np.int64))
+        facility_codes.append(np.array(ids, dtype=np.int16))
+        pcts.append(np.array(values, dtype=np.uint8))
+    
+    if not epochs:
+        return SnapshotArrays.empty()
+    facility = np.concatenate(facility_codes)
+    ids = np.unique(facility).tolist()
+    return SnapshotArrays(
+        epoch=np.concatenate(epochs),
+        facility=facility,
+        pct=np.concatenate(pcts),
+        facilities=facility_index(db, ids).names_by_id(ids),
+    )
+
+
+def latest_readings(db: Session, since_utc: datetime, facility_ids=None, limit: int = None):
+    """(timestamp_utc, facility_id, usage_percentage) since `since_utc`, newest first."""
+    snap = models.UsageSnapshot
+    stmt = _filtered(
+        select(snap.timestamp_utc, snap.facility_id, snap.usage_percentage),
+        since_utc, None, facility_ids,
+    ).order_by(snap.timestamp_utc.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [tuple(row) for row in db.execute(stmt)]
+
+
+def latest_timestamp(db: Session, facility_ids=None):
+    """Newest snapshot timestamp, optionally for some facilities only."""
+    snap = models.UsageSnapshot
+    stmt = _filtered(select(func.max(snap.timestamp_utc)), facility_ids=facility_ids)
+    return db.execute(stmt).scalar()
+
+
+def data_version(db: Session) -> tuple:
+    """(version, history) of the stored usage data, for keying caches on.
+    
+    `version` moves with every committed write to the snapshots, rollups or
+    usage stats. `history` moves only when existing history is rewritten
+    (bulk imports, rebuilds, retention), which calls for a full reload
+    rather than picking up the newest rows. One primary-key lookup.
+    """
+    dv = models.DataVersion
+    row = db.execute(select(dv.version, dv.history).where(dv.id == 1)).first()
+    return tuple(row) if row is not None else (0, 0)
+
+
+def bump_data_version(db: Session, history: bool = False) -> None:
+    """Advance the data version in the caller's transaction.
+    
+    Readers see the new version exactly when they can see the data behind
+    it, in every process. Concurrent writers wait on the row until the
+    first one commits.
+    """
+    dv = models.DataVersion
+    values = {"version": dv.version + 1}
+    if history:
+        values["history"] = dv.history + 1
+    if not db.execute(update(dv).where(dv.id == 1).values(**values)).rowcount:
+        db.add(dv(id=1, version=1, history=int(history)))
+        db.flush()
@@ -0,0 +1,317 @@
+"""
+Online per-facility statistics by weekday and half-hour.
+
+`usage_stats` holds one row per (facility, weekday, bucket):
+- the count and mean of every reading in that cell;
+- M2, the sum of squared deviations, so the variance is M2 / count;
+- an exponentially weighted mean, in which each new reading gets weight
+  USAGE_STATS_EWMA_ALPHA, so recent weeks dominate.
+
+Ingest folds each new reading in with Welford's update, which is O(1) per
+snapshot, in the same transaction as the snapshot; bulk loads merge each
+batch's per-cell aggregates in the statement that inserts the batch. Rows outlive the
+retention purge of raw snapshots.
+
+Readers don't query the table per request. Each process keeps the whole
+table in memory as NumPy arrays indexed by [facility_id, weekday, bucket],
+loaded at startup or on first use. Whenever the data version moves, it
+pulls only the rows updated since its last load, or reloads the whole
+table when history was rewritten (imports, rebuilds, retention). Recommendations
+and the heatmap are then array lookups, however long the history is.
+"""
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from analytics.rollups import TZ_NAME, local_bucket
+from analytics.snapshots import bump_data_version, data_version, iter_snapshot_rows
+
+BUCKETS = 48
+# Rows committed by a transaction that started before the last refresh can
+# carry an older updated_at, so each refresh re-reads a little of the past
+REFRESH_OVERLAP = timedelta(minutes=5)
+# Readings older than this many newer ones weigh less than 1e-100 in the EWMA
+_EWMA_HORIZON = 500
+
+# Per-cell count, mean, M2 and EWMA of a {source} of (facility_id, timestamp_utc,
+# usage_percentage) rows; `oldest` is the cell's earliest reading, which
+# STATS_MERGE_SQL needs to chain the EWMA onto an existing one
+STATS_SELECT_SQL = """
+    SELECT facility_id, weekday, bucket,
+           COUNT(*) AS sample_count, AVG(x) AS mean, COALESCE(VAR_POP(x), 0) * COUNT(*) AS m2,
+           SUM(x * CASE WHEN age >= :horizon THEN 0
+                        WHEN age = n - 1 THEN power(1 - :alpha, age)
+                        ELSE :alpha * power(1 - :alpha, age) END) AS ewma,
+           MAX(CASE WHEN age = n - 1 THEN x END) AS oldest
+    FROM (
+        SELECT facility_id, weekday, bucket, x,
+               ROW_NUMBER() OVER w - 1 AS age,
+               COUNT(*) OVER (PARTITION BY facility_id, weekday, bucket) AS n
+        FROM (
+            SELECT facility_id, timestamp_utc, usage_percentage::float8 AS x,
+                   EXTRACT(ISODOW FROM local_ts)::int - 1 AS weekday,
+                   (EXTRACT(HOUR FROM local_ts)::int * 60 + EXTRACT(MINUTE FROM local_ts)::int) / 30 AS bucket
+            FROM (
+                SELECT facility_id, timestamp_utc, usage_percentage,
+                       timezone(:tz, timezone('UTC', timestamp_utc)) AS local_ts
+                FROM {source}
+            ) s
+        ) r
+        WINDOW w AS (PARTITION BY facility_id, weekday, bucket ORDER BY timestamp_utc DESC)
+    ) a
+    GROUP BY 1, 2, 3
+"""
+
+# Fold the cells of a `{cells}` CTE (STATS_SELECT_SQL) into usage_stats.
+# Counts, means and M2s combine exactly (Chan et al.), whatever the order of
+# the readings. The EWMA treats the new readings as the latest ones, as a
+# scrape would: the old EWMA stands in for the oldest new reading's
+# initial weight. Set expressions see the row as it was before the update.
+STATS_MERGE_SQL = """
+    INSERT INTO usage_stats (facility_id, weekday, bucket, sample_count, mean, m2, ewma)
+    SELECT facility_id, weekday, bucket, sample_count, mean, m2, ewma FROM {cells}
+    ON CONFLICT (facility_id, weekday, bucket) DO UPDATE SET
+        sample_count = usage_stats.sample_count + EXCLUDED.sample_count,
+        mean = usage_stats.mean + (EXCLUDED.mean - usage_stats.mean) * EXCLUDED.sample_count
+               / (usage_stats.sample_count + EXCLUDED.sample_count),
+        m2 = usage_stats.m2 + EXCLUDED.m2 + (EXCLUDED.mean - usage_stats.mean) ^ 2
+             * usage_stats.sample_count * EXCLUDED.sample_count / (usage_stats.sample_count + EXCLUDED.sample_count),
+        ewma = CASE WHEN usage_stats.ewma IS NULL THEN EXCLUDED.ewma
+                    ELSE EXCLUDED.ewma + power(1 - :alpha, LEAST(EXCLUDED.sample_count, :horizon)) * (
+                        usage_stats.ewma - (SELECT c.oldest FROM {cells} c
+                                            WHERE c.facility_id = EXCLUDED.facility_id
+                                              AND c.weekday = EXCLUDED.weekday AND c.bucket = EXCLUDED.bucket))
+               END,
+        updated_at = timezone('UTC', now())
+"""
+
+# Rebuild every cell from the raw history in one statement (see migration 011)
+_REBUILD_SQL = f"""
+    INSERT INTO usage_stats (facility_id, weekday, bucket, sample_count, mean, m2, ewma)
+    SELECT facility_id, weekday, bucket, sample_count, mean, m2, ewma
+    FROM ({STATS_SELECT_SQL.format(source="usage_snapshots")}) c
+"""
+
+
+def stats_params() -> dict:
+    """Bind parameters for STATS_SELECT_SQL and STATS_MERGE_SQL."""
+    return {"tz": TZ_NAME, "alpha": settings.usage_stats_ewma_alpha, "horizon": _EWMA_HORIZON}
+
+
+def welford(count: int, mean: float, m2: float, ewma, x: float, alpha: float) -> tuple:
+    """(count, mean, m2, ewma) after one more reading `x`."""
+    count += 1
+    delta = x - mean
+    mean += delta / count
+    m2 += delta * (x - mean)
+    ewma = x if ewma is None else ewma + alpha * (x - ewma)
+    return count, mean, m2, ewma
+
+
+def apply_readings(db: Session, rows) -> int:
+    """Fold newly inserted snapshots into usage_stats.
+    
+    `rows` is an iterable of (facility_id, timestamp_utc, usage_percentage),
+    as returned by ingestion.storage.insert_snapshots. Runs inside the
+    caller's transaction; the touched rows stay locked until it commits,
+    so concurrent scrapers apply their readings one after the other.
+    Returns the number of cells updated.
+    """
+    readings = {}
+    for facility_id, timestamp_utc, pct in sorted(rows, key=lambda r: r[1]):
+        _date, weekday, bucket = local_bucket(timestamp_utc)
+        readings.setdefault((facility_id, weekday, bucket), []).append(float(pct))
+    if not readings:
+        return 0
+    
+    alpha = settings.usage_stats_ewma_alpha
+    stat = models.UsageStat
+    now = datetime.utcnow()
+    if db.get_bind().dialect.name == "postgresql":
+        keys = [{"facility_id": f, "weekday": w, "bucket": b} for f, w, b in readings]
+        db.execute(pg_insert(stat.__table__).values(keys).on_conflict_do_nothing())
+        current = db.execute(
+            select(stat.facility_id, stat.weekday, stat.bucket, stat.sample_count, stat.mean, stat.m2, stat.ewma)
+            .where(tuple_(stat.facility_id, stat.weekday, stat.bucket).in_(list(readings)))
+            .with_for_update()
+        ).all()
+        updates = []
+        for f, w, b, count, mean, m2, ewma in current:
+            for x in readings[(f, w, b)]:
+                count, mean, m2, ewma = welford(count, mean, m2, ewma, x, alpha)
+            updates.append({"facility_id": f, "weekday": w, "bucket": b, "sample_count": count,
+                            "mean": mean, "m2": m2, "ewma": ewma, "updated_at": now})
+        db.execute(update(stat), updates)
+    else:
+        for key, values in readings.items():
+            row = db.get(stat, key)
+            if row is None:
+                row = stat(facility_id=key[0], weekday=key[1], bucket=key[2], sample_count=0, mean=0.0, m2=0.0)
+                db.add(row)
+            count, mean, m2, ewma = row.sample_count, row.mean, row.m2, row.ewma
+            for x in values:
+                count, mean, m2, ewma = welford(count, mean, m2, ewma, x, alpha)
+            row.sample_count, row.mean, row.m2, row.ewma, row.updated_at = count, mean, m2, ewma, now
+    return len(readings)
+
+
+def rebuild_usage_stats(db: Session) -> int:
+    """Recompute every cell from the raw snapshots still stored; returns the number of cells.
+    
+    Readings whose raw rows were purged by retention drop out, so this is
+    only for repairs (`python -m cli rebuild-stats`); bulk loads fold their
+    rows in with STATS_MERGE_SQL instead. Does not commit.
+    """
+    db.query(models.UsageStat).delete(synchronize_session=False)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(_REBUILD_SQL), stats_params())
+    else:
+        apply_readings(db, list(iter_snapshot_rows(db, ("facility_id", "timestamp_utc", "usage_percentage"))))
+    bump_data_version(db, history=True)
+    return db.query(models.UsageStat).count()
+
+
+class UsageStats:
+    """In-memory copy of usage_stats as (facility_id, weekday, bucket) arrays."""
+    
+    def __init__(self, size: int = 0):
+        self.count = np.zeros((size, 7, BUCKETS), dtype=np.int64)
+        self.mean = np.zeros((size, 7, BUCKETS))
+        self.m2 = np.zeros((size, 7, BUCKETS))
+        self.ewma = np.full((size, 7, BUCKETS), np.nan)
+    
+    def with_rows(self, rows) -> "UsageStats":
+        """A copy with `rows` of (facility_id, weekday, bucket, count, mean, m2, ewma) written in."""
+        rows = list(rows)
+        size = max([len(self.count)] + [r[0] + 1 for r in rows])
+        new = UsageStats(size)
+        n = len(self.count)
+        new.count[:n], new.mean[:n], new.m2[:n], new.ewma[:n] = self.count, self.mean, self.m2, self.ewma
+        if rows:
+            f, w, b, count, mean, m2, ewma = (np.array(col) for col in zip(*rows))
+            new.count[f, w, b] = count
+            new.mean[f, w, b] = mean
+            new.m2[f, w, b] = m2
+            new.ewma[f, w, b] = np.array(ewma, dtype=np.float64)  # None -> NaN
+        return new
+    
+    def _rows(self, facility_ids):
+        """Index for the selected facilities (None = all); ids we hold no stats for are skipped."""
+        if facility_ids is None:
+            return slice(None)
+        return np.array([i for i in facility_ids if 0 <= i < len(self.count)], dtype=np.int64)
+    
+    def samples(self, facility_ids=None) -> int:
+        return int(self.count[self._rows(facility_ids)].sum())
+    
+    def interval_usage(self, weekday: int, start_minutes: int, end_minutes: int, facility_ids=None) -> dict:
+        """{bucket: (avg, count)} from the recency-weighted means, like rollups.rollup_interval_usage.
+        
+        Each bucket averages the EWMA of the selected facilities that have
+        readings there, so every facility counts equally.
+        """
+        lo, hi = start_minutes // 30, min(-(-end_minutes // 30), BUCKETS)
+        if hi <= lo:
+            return {}
+        rows = self._rows(facility_ids)
+        ewma = self.ewma[rows, weekday, lo:hi]
+        count = self.count[rows, weekday, lo:hi]
+        seen = count > 0
+        facilities = seen.sum(axis=0)
+        total = np.where(seen, ewma, 0.0).sum(axis=0)
+        samples = count.sum(axis=0)
+        return {
+            lo + i: (float(total[i] / facilities[i]), int(samples[i]))
+            for i in np.flatnonzero(facilities)
+        }
+    
+    def heatmap(self, facility_ids=None) -> dict:
+        """{(weekday, hour): (mean, sample count, std dev)} over all readings of the selected facilities."""
+        rows = self._rows(facility_ids)
+        count = self.count[rows].reshape(-1, 7, 24, 2)
+        mean = self.mean[rows].reshape(-1, 7, 24, 2)
+        m2 = self.m2[rows].reshape(-1, 7, 24, 2)
+        n = count.sum(axis=(0, 3))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pooled = (count * mean).sum(axis=(0, 3)) / n
+            # Chan et al.: pooled M2 = sum of M2s + n_i * (mean_i - pooled mean)^2
+            spread = (m2 + count * (mean - pooled[None, :, :, None]) ** 2).sum(axis=(0, 3))
+            std = np.sqrt(spread / n)
+        return {
+            (day, hour): (float(pooled[day, hour]), int(n[day, hour]), float(std[day, hour]))
+            for day, hour in zip(*np.nonzero(n))
+        }
+
+
+_stats = None
+_stats_lock = threading.Lock()
+_state = {"version": None, "loaded_through": None, "full_loads": 0, "refreshes": 0, "rows_refreshed": 0}
+
+
+def _load_rows(db: Session, since: datetime = None):
+    stat = models.UsageStat
+    query = select(stat.facility_id, stat.weekday, stat.bucket, stat.sample_count, stat.mean, stat.m2, stat.ewma)
+    if since is not None:
+        query = query.where(stat.updated_at >= since)
+    return db.execute(query).all()
+
+
+def usage_stats(db: Session, version=None) -> UsageStats:
+    """The process-wide UsageStats, refreshed when the data has changed since the last read.
+    
+    `version` is the data version if the caller already has it (see
+    analytics.snapshots.data_version).
+    """
+    global _stats
+    version = version if version is not None else data_version(db)
+    with _stats_lock:
+        if _stats is not None and version == _state["version"]:
+            return _stats
+        started = datetime.utcnow()
+        if _stats is None or version[1] != _state["version"][1]:
+            stats = UsageStats().with_rows(_load_rows(db))
+            _state["full_loads"] += 1
+        else:
+            rows = _load_rows(db, _state["loaded_through"] - REFRESH_OVERLAP)
+            stats = _stats.with_rows(rows)
+            _state["refreshes"] += 1
+            _state["rows_refreshed"] += len(rows)
+        _stats = stats
+        _state["version"] = version
+        _state["loaded_through"] = started
+        return _stats
+
+
+def invalidate_usage_stats() -> None:
+    """Drop the in-memory copy, e.g. after rebuild_usage_stats."""
+    global _stats
+    with _stats_lock:
+        _stats = None
+
+
+def warm_up() -> None:
+    """Load the table at startup so the first page view doesn't pay for it."""
+    from app.db import SessionLocal
+    db = SessionLocal()
+    try:
+        usage_stats(db)
+    except Exception as e:
+        print(f"[STATS] Could not load usage_stats: {e}")
+    finally:
+        db.close()
+
+
+def usage_stats_info() -> dict:
+    """Counters for /metrics."""
+    with _stats_lock:
+        return {
+            "cells": int((_stats.count > 0).sum()) if _stats is not None else 0,
+            "samples": int(_stats.count.sum()) if _stats is not None else 0,
+            "full_loads": _state["full_loads"],
+            "refreshes": _state["refreshes"],
+            "rows_refreshed": _state["rows_refreshed"],
+        }
@@ -0,0 +1,72 @@
+"""
+Best-window search over a dense per-day bucket array.
+
+Prefix sums make every candidate window O(1), so scanning all start times is
+O(buckets) regardless of window length, and a heap keeps only the top k.
+Arrays may extend past 24h (e.g. tonight's buckets followed by tomorrow
+morning's) so windows that cross midnight are just longer arrays.
+"""
+import heapq
+
+SUPPORTED_BUCKET_MINUTES = (5, 10, 15, 30)
+
+
+def best_windows(bucket_values, bucket_minutes: int, window_minutes: int,
+                 first_start: int, last_end: int, k: int = 3):
+    """Return the k windows with the lowest mean bucket value.
+
+    `bucket_values[i]` is the average for minutes [i*bucket_minutes, (i+1)*bucket_minutes),
+    or None when there is no usable data. A window qualifies only if every bucket
+    it covers has a value; buckets are weighted equally. Windows start on bucket
+    boundaries with first_start <= start and start + window_minutes <= last_end.
+
+    Returns [(start_minute, end_minute, average)] sorted by average, then start.
+    """
+    if bucket_minutes not in SUPPORTED_BUCKET_MINUTES:
+        raise ValueError(f"bucket_minutes must be one of {SUPPORTED_BUCKET_MINUTES}, got {bucket_minutes}")
+    
+    n = -(-window_minutes // bucket_minutes)  # buckets per window, rounded up
+    sums = [0.0]
+    present = [0]
+    for value in bucket_values:
+        sums.append(sums[-1] + (value if value is not None else 0.0))
+        present.append(present[-1] + (value is not None))
+    
+    first_bucket = -(-first_start // bucket_minutes)
+    candidates = []
+    for b in range(first_bucket, len(bucket_values) - n + 1):
+        start = b * bucket_minutes
+        if start + window_minutes > last_end:
+            break
+        if present[b + n] - present[b] == n:
+            candidates.append(((sums[b + n] - sums[b]) / n, start))
+    
+    return [
+        (start, start + window_minutes, avg)
+        for avg, start in heapq.nsmallest(k, candidates)
+    ]
+
+
+def forward_fill(bucket_values, limit: int):
+    """Carry each value into up to `limit` following empty buckets.
+
+    A scrape reading stands for the whole scrape interval, so with buckets
+    finer than that interval the buckets between readings take the last value.
+    """
+    filled = list(bucket_values)
+    last, gap = None, 0
+    for i, value in enumerate(filled):
+        if value is not None:
+            last, gap = value, 0
+        elif last is not None and gap < limit:
+            filled[i] = last
+            gap += 1
+        else:
+            last = None
+    return filled
+
+
+def format_minutes(minutes: int) -> str:
+    """Minutes since midnight → 'H:MM' (wrapping past midnight)."""
+    minutes %= 24 * 60
+    return f"{minutes // 60}:{minutes % 60:02d}"
@@ -9,6 +9,10 @@ Flow per question:
   5. Gemini SYNTHESIZES a natural language answer
   6. Repeat steps 2-5 if Gemini needs more data (max 5 iterations)
 
+Tool calls requested in the same turn run concurrently, each in a worker
+thread with its own DB session. The Gemini model is built once per process
+and warmed at startup.
+
 Why this matters for the JD:
   - "multi-agent systems using frameworks like ReAct" → this IS the ReAct loop
   - "connecting agents to enterprise knowledge bases" → PostgreSQL is the knowledge base
@@ -18,13 +22,29 @@ Why this matters for the JD:
 import os
 import json
 import uuid
+import asyncio
 import tempfile
+import threading
 from sqlalchemy.orm import Session
 
-from app.tools import get_current_usage, get_best_times, query_gym_data
+from analytics.cache import LRUCache
+from analytics.recommendations import get_data_version
+from app.answer_cache import answer_cache
+from app.config import settings
+from app.db import SessionLocal
+from app.tools import get_current_usage, get_best_times, get_forecast, query_gym_data
 
 GCP_PROJECT = os.getenv("GCP_PROJECT_ID", "")
 GCP_REGION = os.getenv("GCP_REGION", "us-central1")
+MAX_STEPS = 5
+NO_ANSWER = "I was unable to generate a response. Please try again."
+MAX_STEPS_ANSWER = "I reached the maximum reasoning steps. Please try rephrasing your question."
+
+# get_best_times is left out: it depends on today's weekday and the saved
+# preferences, and already hits the recommendation cache. get_forecast
+# starts at the current half hour and reads the fitted-model cache.
+CACHED_TOOLS = {"get_current_usage", "query_gym_data"}
+tool_cache = LRUCache(maxsize=settings.agent_tool_cache_size, name="agent_tools")
 
 
 def _setup_gcp_credentials():
@@ -102,6 +122,30 @@ TOOL_SPECS = [
             },
         },
     },
+    {
+        "name": "get_forecast",
+        "description": (
+            "Get predicted usage percentages, hour by hour, for the next 24-72 "
+            "hours. Use this when the user asks how busy the gym will be later "
+            "today, tonight, tomorrow or over the next few days."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "facility": {
+                    "type": "string",
+                    "description": (
+                        "Optional facility name to filter "
+                        "(e.g. 'Raider Power Zone'). Leave empty for all facilities."
+                    ),
+                },
+                "hours": {
+                    "type": "integer",
+                    "description": "How many hours ahead to forecast (default 24, max 72).",
+                },
+            },
+        },
+    },
     {
         "name": "query_gym_data",
         "description": (
@@ -128,16 +172,53 @@ TOOL_SPECS = [
                     "type": "integer",
                     "description": "End hour 24h format exclusive (e.g. 10 = up to 10am).",
                 },
+                "lookback_days": {
+                    "type": "integer",
+                    "description": (
+                        "Only use the last N days of history (e.g. 28 for recent "
+                        "weeks). Leave empty for all history."
+                    ),
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of facility/hour rows to return.",
+                },
             },
         },
     },
 ]
 
 
+def _normalize_args(args: dict) -> tuple:
+    """Hashable, order- and case-insensitive form of a tool call's arguments."""
+    normalized = []
+    for key, value in args.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = value.strip().lower()
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        normalized.append((key, value))
+    return tuple(sorted(normalized))
+
+
 def _execute_tool(name: str, args: dict, db: Session, trace_id: str) -> str:
-    """Execute a tool by name and return the result as a JSON string."""
+    """Execute a tool by name and return the result as a JSON string.
+    
+    Results of the data-only tools are cached per data version, so repeated
+    questions within one scrape cycle skip the database work.
+    """
     print(f"[AGENT:{trace_id}] → tool={name} args={args}")
-
+    
+    cache_key = None
+    if name in CACHED_TOOLS:
+        cache_key = (name, _normalize_args(args), get_data_version(db))
+        cached = tool_cache.get(cache_key)
+        if cached is not None:
+            print(f"[AGENT:{trace_id}] ← tool={name} (cached)")
+            return cached
+    
     if name == "get_current_usage":
         result = get_current_usage(db, facility=args.get("facility"))
     elif name == "get_best_times":
@@ -146,6 +227,12 @@ def _execute_tool(name: str, args: dict, db: Session, trace_id: str) -> str:
             workout_duration_minutes=int(args.get("workout_duration_minutes", 60)),
             weekday=args.get("weekday"),
         )
+    elif name == "get_forecast":
+        result = get_forecast(
+            db,
+            facility=args.get("facility"),
+            hours=int(args.get("hours") or 24),
+        )
     elif name == "query_gym_data":
         result = query_gym_data(
             db,
@@ -153,26 +240,47 @@ def _execute_tool(name: str, args: dict, db: Session, trace_id: str) -> str:
             weekday=args.get("weekday"),
             start_hour=args.get("start_hour"),
             end_hour=args.get("end_hour"),
+            lookback_days=args.get("lookback_days"),
+            limit=int(args["limit"]) if args.get("limit") else None,
         )
     else:
         result = {"error": f"Unknown tool: {name}"}
-
+    
     result_str = json.dumps(result)
+    if cache_key is not None:
+        tool_cache.set(cache_key, result_str)
     print(f"[AGENT:{trace_id}] ← tool={name} result_preview={result_str[:120]}")
     return result_str
 
 
-def ask(question: str, db: Session) -> str:
-    """
-    Main agentic entry point.
+class AgentUnavailable(Exception):
+    """The LLM backend is not installed or configured; the message is user-facing."""
 
-    Sends the question to Gemini with tool definitions, handles the
-    function-calling loop (ReAct), and returns a natural language answer.
-    Each call gets a unique trace_id for debugging across microservices.
+
+class VertexChat:
+    """Adapter over a Vertex AI chat session.
+    
+    The ReAct loop only needs `send_message` and a way to wrap tool results,
+    so a scripted fake (app.fake_llm.ScriptedChat) can stand in for Gemini.
     """
-    trace_id = str(uuid.uuid4())[:8]
-    print(f"[AGENT:{trace_id}] question={question!r}")
+    
+    def __init__(self, chat, part_cls):
+        self._chat = chat
+        self._part_cls = part_cls
+    
+    def send_message(self, content):
+        return self._chat.send_message(content)
+    
+    def function_response(self, name: str, response: dict):
+        return self._part_cls.from_function_response(name=name, response=response)
+
+
+_model = None
+_model_lock = threading.Lock()
 
+
+def _build_model():
+    """Initialise Vertex AI and build the Gemini model with our tools (blocking)."""
     # ── Guard: check dependencies and config ──────────────────────────────────
     try:
         import vertexai
@@ -183,80 +291,181 @@ def ask(question: str, db: Session) -> str:
             Part,
         )
     except ImportError:
-        return (
+        raise AgentUnavailable(
             "AI assistant unavailable: google-cloud-aiplatform is not installed. "
             "Run: pip install google-cloud-aiplatform"
         )
-
+    
     if not GCP_PROJECT:
-        return (
+        raise AgentUnavailable(
             "AI assistant not configured: set the GCP_PROJECT_ID environment variable. "
             "See the setup guide in infrastructure/GCP_SETUP.md"
         )
+    
+    # ── Initialise Vertex AI SDK ──────────────────────────────────────────────
+    vertexai.init(project=GCP_PROJECT, location=GCP_REGION)
+    
+    # Build Gemini Tool object from our spec list
+    declarations = [
+        FunctionDeclaration(
+            name=spec["name"],
+            description=spec["description"],
+            parameters=spec["parameters"],
+        )
+        for spec in TOOL_SPECS
+    ]
+    tools = [Tool(function_declarations=declarations)]
+    
+    model = GenerativeModel(
+        model_name="gemini-2.5-flash",
+        system_instruction=SYSTEM_PROMPT,
+        tools=tools,
+    )
+    return model, Part
+
+
+def _gemini_model():
+    """The process-wide (model, Part) pair, built on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _build_model()
+    return _model
+
+
+def warm_up() -> bool:
+    """Build the Gemini model ahead of the first /ask. Returns False if unavailable."""
+    try:
+        _gemini_model()
+        return True
+    except AgentUnavailable as exc:
+        print(f"[AGENT] {exc}")
+    except Exception as exc:
+        print(f"[AGENT] warm-up failed: {exc}")
+    return False
+
+
+def _vertex_chat() -> VertexChat:
+    """Start a new chat session on the shared Gemini model."""
+    model, part_cls = _gemini_model()
+    return VertexChat(model.start_chat(), part_cls)
+
+
+def _execute_tool_in_session(name: str, args: dict, trace_id: str, cancelled: threading.Event) -> str:
+    """Run one tool on a worker thread with its own DB session."""
+    if cancelled.is_set():
+        return json.dumps({"error": "Request cancelled"})
+    db = SessionLocal()
+    try:
+        return _execute_tool(name, args, db, trace_id)
+    finally:
+        db.close()
 
+
+def _current_data_version():
+    db = SessionLocal()
     try:
-        # ── Initialise Vertex AI SDK ──────────────────────────────────────────
-        vertexai.init(project=GCP_PROJECT, location=GCP_REGION)
-
-        # Build Gemini Tool object from our spec list
-        declarations = [
-            FunctionDeclaration(
-                name=spec["name"],
-                description=spec["description"],
-                parameters=spec["parameters"],
+        return get_data_version(db)
+    finally:
+        db.close()
+
+
+async def _react_loop(chat, question: str, trace_id: str, cancelled: threading.Event) -> str:
+    response = await asyncio.to_thread(chat.send_message, question)
+    
+    # ── ReAct loop ────────────────────────────────────────────────────────────
+    # Gemini returns either tool calls OR a final text answer.
+    # We keep looping until we get a text answer (max 5 steps).
+    for iteration in range(MAX_STEPS):
+        candidate = response.candidates[0]
+        
+        # Collect any function calls Gemini wants to make
+        function_calls = [
+            part.function_call
+            for part in candidate.content.parts
+            if hasattr(part, "function_call") and part.function_call and part.function_call.name
+        ]
+        
+        if not function_calls:
+            # No tool calls → Gemini has a final answer
+            for part in candidate.content.parts:
+                if hasattr(part, "text") and part.text:
+                    print(f"[AGENT:{trace_id}] done after {iteration} tool call(s)")
+                    return part.text
+            return NO_ANSWER
+        
+        # Run every tool Gemini requested this turn concurrently, each on its
+        # own thread and DB session, and keep the results in request order
+        results = await asyncio.gather(*(
+            asyncio.to_thread(
+                _execute_tool_in_session, fc.name, dict(fc.args), trace_id, cancelled
             )
-            for spec in TOOL_SPECS
+            for fc in function_calls
+        ))
+        tool_response_parts = [
+            chat.function_response(fc.name, {"result": json.loads(result_str)})
+            for fc, result_str in zip(function_calls, results)
         ]
-        tools = [Tool(function_declarations=declarations)]
-
-        model = GenerativeModel(
-            model_name="gemini-2.5-flash",
-            system_instruction=SYSTEM_PROMPT,
-            tools=tools,
-        )
+        
+        # Send tool results back → Gemini reasons again
+        response = await asyncio.to_thread(chat.send_message, tool_response_parts)
+    
+    return MAX_STEPS_ANSWER
 
-        chat = model.start_chat()
-        response = chat.send_message(question)
-
-        # ── ReAct loop ────────────────────────────────────────────────────────
-        # Gemini returns either tool calls OR a final text answer.
-        # We keep looping until we get a text answer (max 5 steps).
-        for iteration in range(5):
-            candidate = response.candidates[0]
-
-            # Collect any function calls Gemini wants to make
-            function_calls = [
-                part.function_call
-                for part in candidate.content.parts
-                if hasattr(part, "function_call") and part.function_call and part.function_call.name
-            ]
-
-            if not function_calls:
-                # No tool calls → Gemini has a final answer
-                for part in candidate.content.parts:
-                    if hasattr(part, "text") and part.text:
-                        print(f"[AGENT:{trace_id}] done after {iteration} tool call(s)")
-                        return part.text
-                return "I was unable to generate a response. Please try again."
-
-            # Execute each tool Gemini requested and collect responses
-            tool_response_parts = []
-            for fc in function_calls:
-                result_str = _execute_tool(fc.name, dict(fc.args), db, trace_id)
-                tool_response_parts.append(
-                    Part.from_function_response(
-                        name=fc.name,
-                        response={"result": json.loads(result_str)},
-                    )
-                )
-
-            # Send tool results back → Gemini reasons again
-            response = chat.send_message(tool_response_parts)
-
-        return "I reached the maximum reasoning steps. Please try rephrasing your question."
 
+async def ask_async(question: str, chat_factory=None, timeout: float = None,
+                    use_cache: bool = True) -> str:
+    """
+    Main agentic entry point.
+    
+    Sends the question to Gemini with tool definitions, handles the
+    function-calling loop (ReAct), and returns a natural language answer.
+    Blocking LLM and DB calls run in worker threads so the event loop stays
+    free. The whole request is bounded by `timeout` (AGENT_TIMEOUT_SECONDS);
+    on timeout or cancellation, tool calls that have not started are skipped.
+    `chat_factory` returns the chat backend (default: Vertex AI Gemini).
+    Answers are cached per question and data version (see app.answer_cache).
+    Each call gets a unique trace_id for debugging across microservices.
+    """
+    trace_id = str(uuid.uuid4())[:8]
+    print(f"[AGENT:{trace_id}] question={question!r}")
+    timeout = settings.agent_timeout_seconds if timeout is None else timeout
+    cancelled = threading.Event()
+    
+    try:
+        if use_cache:
+            data_version = await asyncio.to_thread(_current_data_version)
+            cached = answer_cache.get(question, data_version)
+            if cached is not None:
+                print(f"[AGENT:{trace_id}] answered from cache")
+                return cached
+        
+        chat = await asyncio.to_thread(chat_factory or _vertex_chat)
+        answer = await asyncio.wait_for(
+            _react_loop(chat, question, trace_id, cancelled), timeout
+        )
+        if use_cache and answer not in (NO_ANSWER, MAX_STEPS_ANSWER):
+            answer_cache.set(question, data_version, answer)
+        return answer
+    
+    except AgentUnavailable as exc:
+        return str(exc)
+    
+    except asyncio.TimeoutError:
+        print(f"[AGENT:{trace_id}] timed out after {timeout}s")
+        return "The assistant took too long to answer. Please try again."
+    
     except Exception as exc:
         import traceback
-
+        
         traceback.print_exc()
         return f"An error occurred while processing your question: {exc}"
+    
+    finally:
+        cancelled.set()
+
+
+def ask(question: str, chat_factory=None, timeout: float = None) -> str:
+    """Synchronous wrapper around ask_async for scripts and the CLI."""
+    return asyncio.run(ask_async(question, chat_factory=chat_factory, timeout=timeout))
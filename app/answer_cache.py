@@ -0,0 +1,139 @@
+"""
+Answer cache for /ask.
+
+Answers are keyed by the normalized question and the data version (see
+analytics.snapshots.data_version), and expire after one scrape interval. An optional matcher
+lets paraphrases ("how busy is it now" / "how busy is it right now") reuse an
+answer cached for the same data version. A paraphrase is only reused when
+it asks about exactly the same weekday, times/numbers and facilities, so
+"Tuesday 5-7 pm" never gets the answer cached for "Monday 5-7 pm".
+Matchers are plain objects with `best_match(question, candidates)`, so a
+TF-IDF or embedding matcher can be swapped in without touching the agent.
+"""
+import re
+from analytics.cache import LRUCache
+from app.config import settings
+from app.constants import TTU_FACILITIES
+
+_NON_WORD = re.compile(r"[^a-z0-9%]+")
+
+# Filler words that don't change what is being asked
+STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "it", "its", "i", "me", "my", "to", "of",
+    "at", "in", "on", "for", "be", "do", "does", "can", "could", "would",
+    "please", "right", "currently", "like", "so", "very", "gym", "rec",
+})
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_NON_WORD.sub(" ", question.lower().replace("'", "")).split())
+
+
+# Words that change the answer however similar the rest of the question is
+_WEEKDAY = re.compile(r"^(mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(day)?s?$")
+TIME_WORDS = frozenset({
+    "today", "tomorrow", "tonight", "yesterday", "now", "morning", "afternoon",
+    "evening", "night", "noon", "midnight", "am", "pm", "weekend", "weekends",
+    "weekday", "weekdays", "week", "month", "hour", "hours", "minute", "minutes",
+    "before", "after", "until", "last", "next",
+})
+FACILITY_WORDS = frozenset(
+    word for name in TTU_FACILITIES for word in normalize_question(name).split()
+) | {"pool", "court", "cardio", "weights", "weight", "track", "soccer", "climbing", "wall"}
+
+
+def parameter_tokens(tokens) -> frozenset:
+    """The weekday, number/time and facility tokens of a question."""
+    return frozenset(
+        t for t in tokens
+        if any(c.isdigit() for c in t) or _WEEKDAY.match(t) or t in TIME_WORDS or t in FACILITY_WORDS
+    )
+
+
+class TokenSetMatcher:
+    """Jaccard similarity over content words, with the parameter tokens required to match exactly."""
+    
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+    
+    @staticmethod
+    def tokens(normalized: str) -> frozenset:
+        return frozenset(t for t in normalized.split() if t not in STOPWORDS)
+    
+    def best_match(self, question: str, candidates):
+        """The most similar candidate at or above the threshold with the same parameters, else None."""
+        target = self.tokens(question)
+        if not target:
+            return None
+        parameters = parameter_tokens(target)
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            other = self.tokens(candidate)
+            if parameter_tokens(other) != parameters:
+                continue
+            score = len(target & other) / len(target | other)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+
+MATCHERS = {
+    "none": lambda: None,
+    "token_set": lambda: TokenSetMatcher(settings.answer_cache_similarity),
+}
+
+
+class AnswerCache:
+    def __init__(self, maxsize: int = 512, ttl: float = None, matcher=None):
+        self._cache = LRUCache(maxsize=maxsize, name="agent_answers", ttl=ttl)
+        self.matcher = matcher
+        self.lookups = 0
+        self.exact_hits = 0
+        self.similar_hits = 0
+    
+    def get(self, question: str, data_version):
+        """Cached answer for this question (or a close paraphrase) at this data version."""
+        self.lookups += 1
+        normalized = normalize_question(question)
+        answer = self._cache.get((normalized, data_version))
+        if answer is not None:
+            self.exact_hits += 1
+            return answer
+        if self.matcher is None:
+            return None
+        
+        candidates = [q for q, version in self._cache.keys() if version == data_version]
+        match = self.matcher.best_match(normalized, candidates)
+        if match is None:
+            return None
+        answer = self._cache.get((match, data_version))
+        if answer is not None:
+            self.similar_hits += 1
+        return answer
+    
+    def set(self, question: str, data_version, answer: str) -> None:
+        self._cache.set((normalize_question(question), data_version), answer)
+    
+    def clear(self) -> None:
+        self._cache.clear()
+    
+    def stats(self) -> dict:
+        """Hit counts per /ask lookup; a paraphrase hit counts once, not as a miss plus a hit."""
+        stats = self._cache.stats()
+        hits = self.exact_hits + self.similar_hits
+        stats.update(
+            hits=hits,
+            misses=self.lookups - hits,
+            exact_hits=self.exact_hits,
+            similar_hits=self.similar_hits,
+            hit_rate=round(hits / self.lookups, 3) if self.lookups else 0.0,
+        )
+        return stats
+
+
+answer_cache = AnswerCache(
+    maxsize=settings.answer_cache_size,
+    ttl=settings.scrape_interval_minutes * 60,
+    matcher=MATCHERS[settings.answer_cache_matcher](),
+)
@@ -6,10 +6,41 @@ class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL", "")
     email_api_key: str = ""
     email_from: str = ""
+    email_api_base_url: str = "https://api.resend.com"  # point at notifications.fake_email locally
+    email_batch_size: int = 100  # digest emails per Resend batch request (max 100)
+    email_concurrency: int = 4  # batch requests in flight
+    email_http_attempts: int = 3  # tries per request on connection errors, 429 and 5xx
+    email_breaker_failures: int = 5  # consecutive failed requests that open the circuit
+    email_breaker_reset_seconds: int = 60
+    outbox_max_attempts: int = 12  # sends per email before it is marked dead
+    outbox_interval_seconds: int = 60  # how often serve-jobs retries pending email
+    outbox_keep_days: int = 14  # sent emails are purged from the outbox after this
+    dashboard_url: str = "http://localhost:8000"  # linked from emails
     scrape_interval_minutes: int = 30
+    heatmap_weeks: int = 8  # weeks of rollups the dashboard heatmap covers
+    usage_stats_ewma_alpha: float = 0.4  # weight of each new reading in the per-weekday/half-hour EWMA
+    forecast_model: str = "seasonal_ewma"  # seasonal_naive, seasonal_ewma or holt_winters
+    forecast_history_weeks: int = 8  # history the forecast models are fitted on
+    forecast_hours: int = 24  # outlook shown on the dashboard (max 72)
+    recommendation_cache_size: int = 256
+    recommendation_bucket_minutes: int = 30  # 5, 10, 15 or 30
+    digest_time_local: str = "07:00"  # used when no digest time is saved on the dashboard
+    digest_interval_seconds: int = 300  # how often serve-jobs sends the digests that have come due
+    retention_time_local: str = "03:30"  # nightly retention in serve-jobs; empty disables it
+    job_jitter_seconds: int = 30
+    raw_retention_days: int = 90  # raw snapshots older than this are purged (min 14)
+    rollup_hourly_after_days: int = 180  # older half-hourly rollups are folded into hourly ones
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    web_threadpool_size: int = 15  # worker threads for sync handlers; match the DB pool
     gcp_project_id: str = ""
     gcp_region: str = "us-central1"
     google_application_credentials: str = ""
+    agent_timeout_seconds: float = 60.0
+    agent_tool_cache_size: int = 256
+    answer_cache_size: int = 512
+    answer_cache_matcher: str = "token_set"  # token_set or none (exact questions only)
+    answer_cache_similarity: float = 0.8
 
     class Config:
         env_file = ".env"
@@ -30,8 +30,8 @@ try:
         database_url,
         pool_pre_ping=True,  # Verify connections before using
         echo=False,
-        pool_size=5,
-        max_overflow=10
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow
     )
     SessionLocal = sessionmaker(bind=engine)
     Base = declarative_base()
@@ -0,0 +1,155 @@
+"""
+Facility dimension: name ↔ id resolution and free-text facility filters.
+
+Snapshots and rollups store a SMALLINT facility_id. This module keeps the
+small `facilities` table in memory (refreshed every few minutes, or at once
+when a new facility is added) so the scraper, analytics, tools and email
+turn names into ids without a join, and every facility filter becomes an
+integer `facility_id IN (...)`.
+"""
+import threading
+import time
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app import models
+
+# New facilities only appear when the scraper sees them, and that path
+# invalidates the cache itself; the TTL just picks up edits made elsewhere
+FACILITY_CACHE_TTL_SECONDS = 600
+# Another process (the scrape worker) may add facilities this one hasn't
+# loaded yet; a lookup of an unknown id reloads at most this often
+MISS_RELOAD_SECONDS = 5
+
+_index = None
+_index_loaded_at = 0.0
+_index_lock = threading.Lock()
+
+
+class FacilityIndex:
+    """In-memory copy of the facilities table."""
+    
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda r: (r.display_order, r.name))
+        self.names = {r.id: r.name for r in rows}
+        self.ordered_names = [r.name for r in rows]
+        # Canonical names and aliases, case-insensitively
+        self.ids = {}
+        for r in rows:
+            for alias in r.aliases or []:
+                self.ids.setdefault(alias.lower(), r.id)
+        for r in rows:
+            self.ids[r.name.lower()] = r.id
+    
+    def name(self, facility_id: int) -> str:
+        """Name for an id, or a placeholder for an id this index doesn't know."""
+        return self.names.get(facility_id) or f"Facility {facility_id}"
+    
+    def names_by_id(self, ids=()) -> list:
+        """Names indexed by facility id, covering at least `ids` (None where no facility has that id)."""
+        ids = set(ids)
+        size = max(max(self.names, default=0), max(ids, default=0)) + 1
+        return [self.name(i) if i in ids else self.names.get(i) for i in range(size)]
+
+
+def facility_index(db: Session, ids=()) -> FacilityIndex:
+    """The cached FacilityIndex, reloaded from `db` when stale or when it lacks one of `ids`.
+    
+    Pass the ids about to be looked up, so facilities added by another
+    process are picked up (at most one reload per MISS_RELOAD_SECONDS);
+    ids still unknown after that get FacilityIndex.name's placeholder.
+    """
+    global _index, _index_loaded_at
+    with _index_lock:
+        age = time.monotonic() - _index_loaded_at
+        stale = _index is None or age > FACILITY_CACHE_TTL_SECONDS
+        if not stale and ids and age > MISS_RELOAD_SECONDS:
+            stale = any(i not in _index.names for i in ids)
+        if stale:
+            _index = FacilityIndex(db.query(models.Facility).all())
+            _index_loaded_at = time.monotonic()
+        return _index
+
+
+def invalidate_facilities() -> None:
+    """Drop the cached table, e.g. after facilities were added in bulk and committed."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def invalidate_facilities_after_transaction(db: Session) -> None:
+    """Drop the cached table once `db`'s transaction commits or rolls back.
+    
+    Invalidating straight after an insert would let a reload (possibly on
+    this very session) cache a facility that is then rolled back, or miss
+    one that commits a moment later.
+    """
+    db.info["invalidate_facilities"] = True
+    for name in ("after_commit", "after_rollback"):
+        if not event.contains(db, name, _invalidate_on_transaction_end):
+            event.listen(db, name, _invalidate_on_transaction_end)
+
+
+def _invalidate_on_transaction_end(session) -> None:
+    if session.info.pop("invalidate_facilities", False):
+        invalidate_facilities()
+
+def facility_names(db: Session) -> list:
+    """All facility names in display order."""
+    return facility_index(db).ordered_names
+
+
+def facility_ids_for(db: Session, names):
+    """Ids for a list of facility names, or None when `names` is empty (= all facilities).
+    
+    Unknown names are dropped, so a filter on unknown facilities matches nothing.
+    """
+    if not names:
+        return None
+    ids = facility_index(db).ids
+    return [ids[n.lower()] for n in names if n.lower() in ids]
+
+
+def get_or_create_facility_id(db: Session, name: str) -> int:
+    """Id for a scraped facility name, adding it to the dimension if it is new.
+    
+    Runs in the caller's transaction; concurrent scrapers adding the same
+    facility are safe on Postgres (ON CONFLICT DO NOTHING).
+    """
+    facility_id = facility_index(db).ids.get(name.lower())
+    if facility_id is not None:
+        return facility_id
+    
+    fac = models.Facility
+    next_order = select(func.coalesce(func.max(fac.display_order), 0) + 1).scalar_subquery()
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            pg_insert(fac.__table__)
+            .values(name=name, display_order=next_order)
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+    else:
+        db.add(fac(name=name, display_order=db.execute(select(next_order)).scalar()))
+        db.flush()
+    invalidate_facilities_after_transaction(db)
+    return db.execute(select(fac.id).where(fac.name == name)).scalar_one()
+
+
+def resolve_facilities(db: Session, facility: str) -> list:
+    """Ids of the facilities matching a free-text filter, case-insensitively.
+    
+    An exact name or alias wins; otherwise every facility whose name or alias
+    contains the text, and failing that every one containing all of its words
+    ("power zone" → Raider Power Zone).
+    """
+    needle = " ".join(facility.lower().split())
+    index = facility_index(db)
+    if needle in index.ids:
+        return [index.ids[needle]]
+    matches = [fid for key, fid in index.ids.items() if needle in key]
+    if not matches:
+        words = needle.split()
+        matches = [fid for key, fid in index.ids.items() if all(w in key for w in words)]
+    # One id per facility, in display order
+    return [fid for fid in index.names if fid in set(matches)]
@@ -0,0 +1,49 @@
+"""
+Scripted stand-in for the Gemini chat, for exercising the agent loop offline.
+
+    chat = ScriptedChat([
+        [("query_gym_data", {"weekday": "Monday"}), ("get_current_usage", {})],
+        "Mondays are quietest before 8am.",
+    ])
+    answer = asyncio.run(ask_async("When is it quiet?", chat_factory=lambda: chat))
+
+Each script step is either a list of (tool name, args) calls — one model turn
+asking for those tools — or the final text answer. Responses mirror the shape
+of Vertex AI responses (candidates[0].content.parts). Every message the loop
+sends is kept in `sent` so a test can assert on tool results.
+"""
+import time
+from types import SimpleNamespace
+
+
+def _response(parts):
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+
+
+def _call_part(name: str, args: dict):
+    return SimpleNamespace(function_call=SimpleNamespace(name=name, args=args), text=None)
+
+
+def _text_part(text: str):
+    return SimpleNamespace(function_call=None, text=text)
+
+
+class ScriptedChat:
+    def __init__(self, script, delay: float = 0.0):
+        self.script = list(script)
+        self.delay = delay  # seconds per send_message, to simulate a slow model
+        self.sent = []
+
+    def send_message(self, content):
+        self.sent.append(content)
+        if self.delay:
+            time.sleep(self.delay)
+        if not self.script:
+            return _response([_text_part("")])
+        step = self.script.pop(0)
+        if isinstance(step, str):
+            return _response([_text_part(step)])
+        return _response([_call_part(name, args) for name, args in step])
+
+    def function_response(self, name: str, response: dict):
+        return {"name": name, "response": response}
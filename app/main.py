@@ -1,15 +1,18 @@
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Depends, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from typing import List
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import inspect, text
 from app.db import get_db, engine, Base
 from app import models
-from app.constants import TTU_FACILITIES
+from app.facilities import facility_ids_for, facility_names
+from app.config import settings
+import anyio
 import traceback
 import os
 
@@ -93,7 +96,7 @@ def run_migrations_if_needed():
                 command.upgrade(alembic_cfg, "head")
                 
                 print("✅ Migrations completed successfully!")
-                
+            
             finally:
                 os.chdir(original_cwd)
             
@@ -108,7 +111,7 @@ def run_migrations_if_needed():
             else:
                 print("⚠️  Migrations ran but tables still missing!")
                 return False
-                
+    
     except Exception as e:
         print(f"❌ Migration check failed!")
         print(f"   Error: {str(e)}")
@@ -128,6 +131,16 @@ templates = Jinja2Templates(directory="app/templates")
 async def startup_event():
     """Startup event - migrations already run at module import."""
     print(f"🚀 FastAPI startup - Migrations status: {'✅ Complete' if _migrations_complete else '❌ Failed'}")
+    # Page and agent handlers are plain `def`s that FastAPI runs in this threadpool,
+    # so blocking DB work never stalls the event loop. Size it to the DB pool.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.web_threadpool_size
+    
+    # Build the Gemini model once up front so the first /ask doesn't pay for it
+    from app.agent import warm_up
+    await anyio.to_thread.run_sync(warm_up)
+    # Recommendations and the heatmap read the usage stats from memory
+    from analytics.usage_stats import warm_up as warm_up_usage_stats
+    await anyio.to_thread.run_sync(warm_up_usage_stats)
     if not _migrations_complete:
         print("⚠️  WARNING: Migrations failed during module import. Database operations may fail.")
 
@@ -147,8 +160,10 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 @app.get("/", response_class=HTMLResponse)
-async def root(request: Request, db: Session = Depends(get_db)):
+def root(request: Request, heatmap: str = "recent", db: Session = Depends(get_db)):
+    """Dashboard; `?heatmap=all` shows the all-time heatmap from the usage stats."""
     from analytics import get_recommendations, get_heatmap_data
+    from analytics.forecast import hourly_outlook
     
     prefs = db.query(models.UserPreferences).first()
     if not prefs:
@@ -166,84 +181,102 @@ async def root(request: Request, db: Session = Depends(get_db)):
         db.add(prefs)
         db.commit()
     
-    # Get list of available facilities from database, or use default TTU facilities
-    available_facilities = db.query(models.UsageSnapshot.location_name).distinct().all()
-    available_facilities = [f[0] for f in available_facilities if f[0]]
-    if not available_facilities:
-        # Use default TTU facilities if no data yet
-        available_facilities = TTU_FACILITIES
-    else:
-        # Merge with default facilities to ensure all are shown
-        available_facilities = sorted(list(set(available_facilities + TTU_FACILITIES)))
+    # Facilities seen in the data merged with the default TTU list (cached)
+    available_facilities = facility_names(db)
+    heatmap_all = heatmap == "all"
     
     try:
         recommendations = get_recommendations(db, prefs)
-        heatmap = get_heatmap_data(db, prefs)
+        heatmap = get_heatmap_data(db, prefs, all_history=heatmap_all)
+        forecast = hourly_outlook(db, hours=settings.forecast_hours,
+                                  facility_ids=facility_ids_for(db, prefs.areas_of_interest))
     except Exception as e:
         print(f"Error generating dashboard data: {e}")
         import traceback
         traceback.print_exc()
         recommendations = []
         heatmap = {}
+        forecast = []
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "prefs": prefs,
         "recommendations": recommendations,
         "heatmap": heatmap,
+        "heatmap_all": heatmap_all,
+        "heatmap_weeks": settings.heatmap_weeks,
+        "forecast": forecast,
+        "forecast_hours": settings.forecast_hours,
         "available_facilities": available_facilities
     })
 
 @app.post("/", response_class=HTMLResponse)
-async def save_and_show(request: Request, db: Session = Depends(get_db)):
+def save_and_show(
+    request: Request,
+    email: str = Form(""),
+    start_time: str = Form("06:00"),
+    end_time: str = Form("22:00"),
+    digest_time: str = Form("07:00"),
+    workout_duration: int = Form(60),
+    alert_threshold: int = Form(30),
+    areas: List[str] = Form([]),
+    db: Session = Depends(get_db),
+):
     from analytics import get_recommendations, get_heatmap_data
+    from analytics.forecast import hourly_outlook
     
-    form = await request.form()
     prefs = db.query(models.UserPreferences).first()
     if not prefs:
         prefs = models.UserPreferences(id=1, timezone="America/Chicago")
         db.add(prefs)
     
     # Save settings (timezone is always America/Chicago for Texas)
-    new_email = (form.get("email", "") or "").strip()
+    new_email = (email or "").strip()
     # Privacy: email field renders empty by default; don't erase stored email unless user provides one.
     if new_email:
         prefs.email = new_email
     prefs.timezone = "America/Chicago"  # Fixed to Texas time
-    prefs.preferred_start_time_local = form.get("start_time", "06:00")
-    prefs.preferred_end_time_local = form.get("end_time", "22:00")
-    prefs.digest_send_time_local = form.get("digest_time", "07:00")
-    prefs.workout_duration_minutes = int(form.get("workout_duration", 60))
+    prefs.preferred_start_time_local = start_time
+    prefs.preferred_end_time_local = end_time
+    # Stored zero-padded; anything else falls back to DIGEST_TIME_LOCAL
+    from notifications.digest import normalize_send_time
+    prefs.digest_send_time_local = normalize_send_time(digest_time)
+    prefs.workout_duration_minutes = workout_duration
+    prefs.alert_threshold_pct = max(1, min(alert_threshold, 100))
     
-    # Parse areas of interest from checkboxes
-    areas = form.getlist("areas")  # Get all checked checkboxes
+    # Areas of interest come from the checked checkboxes
     prefs.areas_of_interest = areas if areas else []  # Empty list = all areas
     
     db.commit()
+    # Agent answers about best times depend on the saved areas
+    from app.answer_cache import answer_cache
+    answer_cache.clear()
+    from notifications.alerts import invalidate_alert_index
+    invalidate_alert_index()
     
-    # Get list of available facilities from database, or use default TTU facilities
-    available_facilities = db.query(models.UsageSnapshot.location_name).distinct().all()
-    available_facilities = [f[0] for f in available_facilities if f[0]]
-    if not available_facilities:
-        # Use default TTU facilities if no data yet
-        available_facilities = TTU_FACILITIES
-    else:
-        # Merge with default facilities to ensure all are shown
-        available_facilities = sorted(list(set(available_facilities + TTU_FACILITIES)))
+    # Facilities seen in the data merged with the default TTU list (cached)
+    available_facilities = facility_names(db)
     
     try:
         recommendations = get_recommendations(db, prefs)
         heatmap = get_heatmap_data(db, prefs)
+        forecast = hourly_outlook(db, hours=settings.forecast_hours,
+                                  facility_ids=facility_ids_for(db, prefs.areas_of_interest))
     except Exception as e:
         print(f"Error generating dashboard data: {e}")
         recommendations = []
         heatmap = {}
+        forecast = []
     
     return templates.TemplateResponse("index.html", {
         "request": request,
         "prefs": prefs,
         "recommendations": recommendations,
         "heatmap": heatmap,
+        "heatmap_all": False,
+        "heatmap_weeks": settings.heatmap_weeks,
+        "forecast": forecast,
+        "forecast_hours": settings.forecast_hours,
         "available_facilities": available_facilities,
         "saved": True
     })
@@ -260,7 +293,29 @@ class AskRequest(BaseModel):
 
 
 @app.post("/ask")
-async def ask_agent(body: AskRequest, db: Session = Depends(get_db)):
-    from app.agent import ask
-    answer = ask(body.question, db)
+async def ask_agent(body: AskRequest):
+    from app.agent import ask_async
+    # LLM round-trips and tool queries run in worker threads; tools open their own sessions
+    answer = await ask_async(body.question)
     return {"answer": answer}
+
+
+@app.get("/metrics")
+def metrics(db: Session = Depends(get_db)):
+    """In-process cache, forecast and email counters (per worker), plus the shared email outbox."""
+    from analytics import recommendation_cache
+    from app.agent import tool_cache
+    from app.answer_cache import answer_cache
+    from analytics.forecast import forecast_stats
+    from analytics.usage_stats import usage_stats_info
+    from notifications.outbox import outbox_stats
+    from notifications.transport import transport_stats
+    return {
+        "recommendation_cache": recommendation_cache.stats(),
+        "agent_tool_cache": tool_cache.stats(),
+        "agent_answer_cache": answer_cache.stats(),
+        "forecast": forecast_stats(),
+        "usage_stats": usage_stats_info(),
+        "email_transport": transport_stats(),
+        "email_outbox": outbox_stats(db),
+    }
@@ -1,16 +1,73 @@
-from sqlalchemy import Column, Integer, String, DateTime, ARRAY
-from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, Float, String, Text, Date, DateTime, ARRAY, CheckConstraint, ForeignKey, Index, text
 from app.db import Base
 
+class Facility(Base):
+    """Facility dimension; snapshots and rollups reference it by a small integer id."""
+    __tablename__ = "facilities"
+    
+    id = Column(SmallInteger, primary_key=True)
+    name = Column(String, nullable=False, unique=True)  # Canonical name as scraped
+    aliases = Column(ARRAY(String), nullable=False, default=list, server_default="{}")
+    display_order = Column(SmallInteger, nullable=False, default=0)
+
+class ParserVersion(Base):
+    """Lookup for scraper parser versions, so snapshots carry a 2-byte id instead of a string."""
+    __tablename__ = "parser_versions"
+    
+    id = Column(SmallInteger, primary_key=True)
+    version = Column(String, nullable=False, unique=True)
+
 class UsageSnapshot(Base):
+    # Natural key: one reading per facility per minute, so no surrogate id.
+    # The Postgres PK also INCLUDEs usage_percentage (see migration 008) so
+    # analytics reads are index-only scans.
     __tablename__ = "usage_snapshots"
     
-    id = Column(Integer, primary_key=True)
-    timestamp_utc = Column(DateTime, nullable=False)
-    location_name = Column(String, nullable=False)
-    usage_percentage = Column(Integer, nullable=False)
-    scraped_at_utc = Column(DateTime, default=datetime.utcnow)
-    parser_version = Column(String, default="1.0")
+    facility_id = Column(SmallInteger, ForeignKey("facilities.id"), primary_key=True)
+    timestamp_utc = Column(DateTime, primary_key=True)
+    usage_percentage = Column(SmallInteger, nullable=False)  # 0-100
+    parser_version_id = Column(SmallInteger, ForeignKey("parser_versions.id"), nullable=False)
+    
+    __table_args__ = (
+        CheckConstraint("timestamp_utc = date_trunc('minute', timestamp_utc)",
+                        name="ck_usage_snapshots_minute_precision"),
+    )
+
+class UsageRollup(Base):
+    """Per-facility usage aggregated into 30-minute buckets of a local (Texas) day."""
+    __tablename__ = "usage_rollups"
+    
+    facility_id = Column(SmallInteger, ForeignKey("facilities.id"), primary_key=True)
+    local_date = Column(Date, primary_key=True)
+    # 0-47, half-hours since local midnight. Days older than ROLLUP_HOURLY_AFTER_DAYS
+    # are folded to hourly: only even buckets, each covering the whole hour.
+    bucket = Column(SmallInteger, primary_key=True)
+    weekday = Column(SmallInteger, nullable=False, index=True)  # 0=Monday … 6=Sunday
+    usage_sum = Column(Integer, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    usage_min = Column(SmallInteger, nullable=False)
+    usage_max = Column(SmallInteger, nullable=False)
+
+class UsageStat(Base):
+    """Running per-facility statistics for one weekday and half-hour (see analytics.usage_stats)."""
+    __tablename__ = "usage_stats"
+    
+    facility_id = Column(SmallInteger, ForeignKey("facilities.id"), primary_key=True)
+    weekday = Column(SmallInteger, primary_key=True)  # 0=Monday … 6=Sunday
+    bucket = Column(SmallInteger, primary_key=True)  # 0-47, half-hours since local midnight
+    sample_count = Column(Integer, nullable=False, default=0, server_default="0")
+    mean = Column(Float, nullable=False, default=0.0, server_default="0")
+    m2 = Column(Float, nullable=False, default=0.0, server_default="0")  # sum of squared deviations from the mean
+    ewma = Column(Float, nullable=True)  # exponentially weighted mean, None until the first reading
+    updated_at = Column(DateTime, nullable=False, server_default=text("timezone('UTC', now())"))
+
+class DataVersion(Base):
+    """Single row of counters that caches key derived data on (see analytics.snapshots.data_version)."""
+    __tablename__ = "data_version"
+    
+    id = Column(SmallInteger, primary_key=True, default=1)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")  # every write to the usage history
+    history = Column(BigInteger, nullable=False, default=0, server_default="0")  # rewrites of existing history only
 
 class UserPreferences(Base):
     __tablename__ = "user_preferences"
@@ -24,5 +81,31 @@ class UserPreferences(Base):
     areas_of_interest = Column(ARRAY(String))
     crowd_tolerance_pct = Column(Integer, default=50)
     digest_send_time_local = Column(String)
+    digest_sent_on = Column(Date, nullable=True)  # local date of the last digest queued
     workout_duration_minutes = Column(Integer, default=60, server_default='60')  # Duration in minutes
     last_alert_sent_date = Column(DateTime, nullable=True)  # Track when alert was last sent
+    alert_threshold_pct = Column(Integer, default=30, server_default='30', nullable=False)  # Alert when usage drops below this
+
+class EmailOutbox(Base):
+    """Outbound emails, written before sending and kept until delivered (see notifications.outbox)."""
+    __tablename__ = "email_outbox"
+    
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)  # "digest", "alert", ...
+    from_email = Column(String, nullable=False)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending", server_default="pending")  # pending, sent, dead
+    attempts = Column(SmallInteger, nullable=False, default=0, server_default="0")
+    # Due time for pending rows; also pushed forward as a lease while a worker sends
+    next_attempt_at = Column(DateTime, nullable=False, server_default=text("timezone('UTC', now())"))
+    last_error = Column(String, nullable=True)
+    provider_id = Column(String, nullable=True)  # Resend's email id
+    created_at = Column(DateTime, nullable=False, server_default=text("timezone('UTC', now())"))
+    sent_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'sent', 'dead')", name="ck_email_outbox_status"),
+        Index("ix_email_outbox_due", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+    )
@@ -0,0 +1,133 @@
+"""
+Optional monthly range partitioning of usage_snapshots (Postgres only).
+
+Partitioning is opt-in: migration 005 converts the table when
+PARTITION_USAGE_SNAPSHOTS=1 is set, and `python -m cli create-partitions`
+keeps a few months of empty partitions ready ahead of the scraper. Rows
+for a month without a partition land in the DEFAULT partition and are
+moved into the month's partition when it is created. Old months
+are dropped as whole partitions by the retention job (app.retention) instead
+of row-by-row DELETEs.
+"""
+import re
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+PARENT_TABLE = "usage_snapshots"
+DEFAULT_PARTITION = "usage_snapshots_default"
+_MONTH_SUFFIX = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """True if usage_snapshots is a partitioned (parent) table."""
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": PARENT_TABLE}).scalar())
+
+
+def existing_partitions(conn: Connection) -> list:
+    """Names of the partitions currently attached to usage_snapshots."""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND pg_table_is_visible(p.oid) "
+        "ORDER BY c.relname"
+    ), {"name": PARENT_TABLE})
+    return [r[0] for r in rows]
+
+
+def partitions_ending_before(conn: Connection, cutoff_utc: datetime) -> list:
+    """Monthly partitions whose whole range lies before `cutoff_utc`, oldest first.
+    
+    Returns (name, first_day, end_day) tuples; the default partition is never included.
+    """
+    expired = []
+    for name in existing_partitions(conn):
+        match = _MONTH_SUFFIX.search(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        end = _add_months(month, 1)
+        if datetime.combine(end, datetime.min.time()) <= cutoff_utc:
+            expired.append((name, month, end))
+    return expired
+
+
+def drop_partition(conn: Connection, name: str, lock_timeout: str = "5s") -> None:
+    """Detach and drop one partition.
+    
+    Detaching briefly locks the parent, so a lock timeout makes the call fail
+    fast instead of queueing every scrape behind a long-running query.
+    """
+    conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    conn.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+    conn.execute(text(f'DROP TABLE "{name}"'))
+
+
+def _create_partition(conn: Connection, month: date, has_default: bool, lock_timeout: str) -> str:
+    """Create the partition for `month`, moving in any of its rows that went to the default partition.
+    
+    Postgres refuses a new partition while the default one holds rows in its
+    range, so those rows are copied into the new table and deleted from the
+    default before it is attached, with the default locked throughout so no
+    scrape can add more in between.
+    """
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    in_range = f"timestamp_utc >= '{month.isoformat()}' AND timestamp_utc < '{_add_months(month, 1).isoformat()}'"
+    if has_default:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        conn.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+    if not has_default or not conn.execute(text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range} LIMIT 1")).scalar():
+        conn.execute(text(f'CREATE TABLE "{name}" PARTITION OF {PARENT_TABLE} FOR VALUES {bounds}'))
+        return name
+    columns = ", ".join(f'"{c}"' for c in conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = :name AND table_schema = current_schema() ORDER BY ordinal_position"
+    ), {"name": PARENT_TABLE}).scalars())
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    conn.execute(text(f'INSERT INTO "{name}" ({columns}) SELECT {columns} FROM {DEFAULT_PARTITION} WHERE {in_range}'))
+    conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+    # Indexes and foreign keys come from the parent on attach
+    conn.execute(text(f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION "{name}" FOR VALUES {bounds}'))
+    return name
+
+
+def create_monthly_partitions(conn: Connection, first_month: date, last_month: date,
+                              lock_timeout: str = "5s") -> list:
+    """Create any missing monthly partitions in [first_month, last_month]. Returns created names.
+    
+    Rows a month already has in the default partition are moved into its
+    new partition (see _create_partition). Does not commit.
+    """
+    existing = set(existing_partitions(conn))
+    created = []
+    month = _month_start(first_month)
+    while month <= last_month:
+        if partition_name(month) not in existing:
+            created.append(_create_partition(conn, month, DEFAULT_PARTITION in existing, lock_timeout))
+        month = _add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(conn: Connection, months_ahead: int = 3, today: date = None) -> list:
+    """Create partitions for the current month and the next `months_ahead` months."""
+    this_month = _month_start(today or date.today())
+    return create_monthly_partitions(conn, this_month, _add_months(this_month, months_ahead))
@@ -0,0 +1,209 @@
+"""
+Retention for raw usage snapshots and downsampling of old rollups (Postgres only).
+
+Raw snapshots are only read over short windows: recommendations fall back to
+the last 14 days for buckets finer than the usage stats, while the heatmap and
+the agent tools read usage_stats and usage_rollups. Past
+RAW_RETENTION_DAYS the raw rows are deleted a few local days at a time, each
+batch in its own short transaction, or dropped as whole monthly partitions
+when the table is partitioned. Each day's rollups are checked against its raw
+rows first and rebuilt if they hold fewer samples, so no history is lost.
+
+Past ROLLUP_HOURLY_AFTER_DAYS the half-hourly rollups are folded into hourly
+ones (each odd bucket merged into the even bucket before it), which is all
+the heatmap and query_gym_data need. Long-term history then costs 24 rows per
+facility per day.
+
+Run it nightly with `python -m cli retention`.
+"""
+from datetime import date, datetime, timedelta
+import pytz
+from sqlalchemy import func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app import models
+from app.partitions import is_partitioned, partitions_ending_before, drop_partition
+from analytics.rollups import (
+    TZ_NAME, ROLLUP_INSERT_SQL, ROLLUP_SELECT_SQL, ROLLUP_MERGE_SQL,
+    local_bucket, local_midnight_utc,
+)
+from analytics.snapshots import bump_data_version
+
+# Recommendations with buckets finer than 30 minutes read 14 days of raw snapshots
+MIN_RETENTION_DAYS = 14
+
+# Local days in [lo_date, hi_date) whose rollups hold fewer samples than the raw rows
+_SHORT_DAYS_SQL = """
+    SELECT raw.local_date
+    FROM (
+        SELECT timezone(:tz, timezone('UTC', timestamp_utc))::date AS local_date, COUNT(*) AS n
+        FROM usage_snapshots
+        WHERE timestamp_utc >= :lo AND timestamp_utc < :hi
+        GROUP BY 1
+    ) raw
+    LEFT JOIN (
+        SELECT local_date, SUM(sample_count) AS n
+        FROM usage_rollups
+        WHERE local_date >= :lo_date AND local_date < :hi_date
+        GROUP BY 1
+    ) r USING (local_date)
+    WHERE COALESCE(r.n, 0) < raw.n
+"""
+
+_REBUILD_SQL = ROLLUP_INSERT_SQL + ROLLUP_SELECT_SQL.format(
+    source="usage_snapshots WHERE timestamp_utc >= :lo AND timestamp_utc < :hi"
+)
+
+# Moves every odd (second half-hour) bucket into the even bucket of the same hour
+_FOLD_TO_HOURLY_SQL = f"""
+    WITH odd AS (
+        DELETE FROM usage_rollups
+        WHERE local_date >= :lo_date AND local_date < :hi_date AND bucket % 2 = 1
+        RETURNING facility_id, local_date, bucket, weekday,
+                  usage_sum, sample_count, usage_min, usage_max
+    ),
+    folded AS (
+        {ROLLUP_INSERT_SQL}
+        SELECT facility_id, local_date, bucket - 1, weekday,
+               usage_sum, sample_count, usage_min, usage_max
+        FROM odd
+        {ROLLUP_MERGE_SQL}
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM odd
+"""
+
+
+def _require_postgres(db: Session):
+    if db.get_bind().dialect.name != "postgresql":
+        raise RuntimeError("Retention uses Postgres-specific SQL and requires PostgreSQL")
+
+
+def _check_days(name: str, days: int):
+    if days < MIN_RETENTION_DAYS:
+        raise ValueError(f"{name} must be at least {MIN_RETENTION_DAYS} days (got {days})")
+
+
+def _local_today() -> date:
+    return datetime.now(pytz.timezone(TZ_NAME)).date()
+
+
+def repair_rollups(db: Session, first_day: date, end_day: date) -> int:
+    """Rebuild the rollups of local days in [first_day, end_day) that miss raw samples.
+    
+    Days whose rollups hold at least as many samples as the raw rows are left
+    alone, so days already partly purged are never rebuilt from what is left.
+    Returns the number of days rebuilt.
+    """
+    params = {
+        "tz": TZ_NAME,
+        "lo": local_midnight_utc(first_day),
+        "hi": local_midnight_utc(end_day),
+        "lo_date": first_day,
+        "hi_date": end_day,
+    }
+    short_days = [d for (d,) in db.execute(text(_SHORT_DAYS_SQL), params)]
+    for day in short_days:
+        db.query(models.UsageRollup).filter(
+            models.UsageRollup.local_date == day
+        ).delete(synchronize_session=False)
+        db.execute(text(_REBUILD_SQL), {
+            "tz": TZ_NAME,
+            "lo": local_midnight_utc(day),
+            "hi": local_midnight_utc(day + timedelta(days=1)),
+        })
+    return len(short_days)
+
+
+def purge_raw_snapshots(db: Session, keep_days: int, batch_days: int = 7, dry_run: bool = False) -> dict:
+    """Delete raw snapshots older than `keep_days` local days.
+    
+    Expired monthly partitions are detached and dropped whole; remaining rows
+    go `batch_days` local days per DELETE, committing after each batch so locks
+    and WAL stay small. With `dry_run` nothing is changed and the counts are
+    what would be deleted.
+    """
+    _require_postgres(db)
+    _check_days("Raw retention", keep_days)
+    cutoff_date = _local_today() - timedelta(days=keep_days)
+    cutoff_utc = local_midnight_utc(cutoff_date)
+    snap = models.UsageSnapshot
+    result = {"cutoff_date": cutoff_date, "snapshots_deleted": 0, "partitions_dropped": [], "days_repaired": 0}
+    
+    partitioned = is_partitioned(db.connection())
+    if dry_run:
+        result["snapshots_deleted"] = db.query(func.count()).select_from(snap).filter(
+            snap.timestamp_utc < cutoff_utc
+        ).scalar()
+        if partitioned:
+            result["partitions_dropped"] = [
+                name for name, _first, _end in partitions_ending_before(db.connection(), cutoff_utc)
+            ]
+        db.rollback()
+        return result
+    
+    if partitioned:
+        for name, first_month, end_month in partitions_ending_before(db.connection(), cutoff_utc):
+            # Partitions are UTC months; local days straddle their edges
+            result["days_repaired"] += repair_rollups(
+                db, first_month - timedelta(days=1), end_month + timedelta(days=1)
+            )
+            rows = db.execute(text(f'SELECT COUNT(*) FROM "{name}"')).scalar()
+            drop_partition(db.connection(), name)
+            bump_data_version(db, history=True)
+            db.commit()
+            result["partitions_dropped"].append(name)
+            result["snapshots_deleted"] += rows
+    
+    oldest = db.query(func.min(snap.timestamp_utc)).scalar()
+    day = local_bucket(oldest)[0] if oldest is not None else cutoff_date
+    while day < cutoff_date:
+        end = min(day + timedelta(days=batch_days), cutoff_date)
+        repaired = repair_rollups(db, day, end)
+        deleted = db.query(snap).filter(
+            snap.timestamp_utc >= local_midnight_utc(day),
+            snap.timestamp_utc < local_midnight_utc(end),
+        ).delete(synchronize_session=False)
+        if repaired or deleted:
+            bump_data_version(db, history=True)
+        db.commit()
+        result["days_repaired"] += repaired
+        result["snapshots_deleted"] += deleted
+        day = end
+    return result
+
+
+def fold_rollups_to_hourly(db: Session, after_days: int, batch_days: int = 31, dry_run: bool = False) -> int:
+    """Fold half-hourly rollups older than `after_days` local days into hourly ones.
+    
+    Commits after every `batch_days` local days. Returns the number of
+    half-hour rows folded away (or that would be, with `dry_run`).
+    """
+    _require_postgres(db)
+    _check_days("Hourly rollup age", after_days)
+    cutoff_date = _local_today() - timedelta(days=after_days)
+    r = models.UsageRollup
+    pending = db.query(r).filter(r.local_date < cutoff_date, r.bucket % 2 == 1)
+    if dry_run:
+        count = pending.count()
+        db.rollback()
+        return count
+    
+    day = pending.with_entities(func.min(r.local_date)).scalar()
+    folded = 0
+    while day is not None and day < cutoff_date:
+        end = min(day + timedelta(days=batch_days), cutoff_date)
+        batch = db.execute(text(_FOLD_TO_HOURLY_SQL), {"lo_date": day, "hi_date": end}).scalar()
+        if batch:
+            bump_data_version(db, history=True)
+        db.commit()
+        folded += batch
+        day = end
+    return folded
+
+
+def vacuum_history(engine: Engine) -> None:
+    """VACUUM (ANALYZE) the history tables so freed pages are reused right away."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in ("usage_snapshots", "usage_rollups"):
+            conn.execute(text(f"VACUUM (ANALYZE) {table}"))
@@ -0,0 +1,226 @@
+"""
+In-process job scheduler behind `python -m cli serve-jobs`.
+
+One long-running worker replaces the cron-launched `ingest`, `alert` and
+`digest` processes, so imports, settings, the database pool and the
+scraper's HTTP client and browser are set up once per process instead of
+once per run. Each job runs either every N seconds or daily at a local
+(Texas) time. Every run gets random jitter, a job never overlaps itself
+(a run that comes due while the previous one is still going is skipped and
+counted), and run counts and durations are kept per job.
+"""
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytz
+from app.config import settings
+
+TZ = pytz.timezone("America/Chicago")
+
+
+def seconds_until_local(hhmm: str, now: datetime = None) -> float:
+    """Seconds from `now` (aware; default: now) until the next local HH:MM."""
+    now = now or datetime.now(TZ)
+    hour, minute = map(int, hhmm.split(":"))
+    day = now.astimezone(TZ).date()
+    target = TZ.localize(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+    if target <= now:
+        target = TZ.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()).replace(hour=hour, minute=minute))
+    return (target - now).total_seconds()
+
+
+class Job:
+    """A named callable run every `interval_seconds`, or daily at a local HH:MM.
+    
+    `daily_at` may be a string or a callable returning one, evaluated each
+    time the next run is scheduled (e.g. a time read from user preferences).
+    Interval jobs first run `start_after_seconds` after startup (default: one
+    full interval), which also sets their phase relative to other jobs.
+    `close` is called on shutdown, on the same thread as the runs.
+    """
+    
+    def __init__(self, name: str, func, interval_seconds: float = None, daily_at=None,
+                 jitter_seconds: float = 0.0, start_after_seconds: float = None, close=None):
+        if (interval_seconds is None) == (daily_at is None):
+            raise ValueError(f"Job {name!r} needs exactly one of interval_seconds or daily_at")
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.daily_at = daily_at
+        self.jitter_seconds = jitter_seconds
+        self.start_after_seconds = start_after_seconds
+        self.close = close
+        self.next_run = None  # time.monotonic() deadline
+        self._due = None  # next_run without jitter, so intervals don't drift
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.overlaps_skipped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = None
+        self.last_error = None
+    
+    def _jitter(self) -> float:
+        return random.uniform(0, self.jitter_seconds) if self.jitter_seconds else 0.0
+    
+    def start(self, now: float) -> None:
+        """Schedule the first run."""
+        if self.start_after_seconds is not None and self.daily_at is None:
+            self._due = now + self.start_after_seconds
+            self.next_run = self._due + self._jitter()
+        else:
+            self.schedule_next(now)
+    
+    def schedule_next(self, now: float) -> None:
+        if self.daily_at is not None:
+            daily_at = self.daily_at() if callable(self.daily_at) else self.daily_at
+            self._due = now + seconds_until_local(daily_at)
+        else:
+            # Fixed rate from the previous due time; if we fell behind, from now
+            due = (self._due or now) + self.interval_seconds
+            self._due = due if due > now else now
+        self.next_run = self._due + self._jitter()
+    
+    def try_claim(self) -> bool:
+        """Take the job's run lock; False if the previous run is still going."""
+        if self._lock.acquire(blocking=False):
+            return True
+        self.overlaps_skipped += 1
+        return False
+    
+    def run_claimed(self) -> None:
+        """Run once (the lock must be held via try_claim) and record the duration."""
+        started = time.perf_counter()
+        ok = True
+        try:
+            self.func()
+        except Exception as e:
+            ok = False
+            self.failures += 1
+            self.last_error = repr(e)
+            traceback.print_exc()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.runs += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            self.last_seconds = elapsed
+            self._lock.release()
+        print(f"[JOBS] {self.name} {'ok' if ok else 'failed'} in {elapsed:.2f}s "
+              f"(runs {self.runs}, avg {self.total_seconds / self.runs:.2f}s, max {self.max_seconds:.2f}s)")
+    
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "overlaps_skipped": self.overlaps_skipped,
+            "last_seconds": round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            "avg_seconds": round(self.total_seconds / self.runs, 3) if self.runs else None,
+            "max_seconds": round(self.max_seconds, 3),
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    """Runs jobs until `stop` is set.
+    
+    Each job gets its own worker thread, so a slow digest never delays a
+    scrape, and a job's resources stay on one thread (Playwright's sync API
+    must be used from the thread that started it).
+    """
+    
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+    
+    def run_forever(self, stop: threading.Event) -> None:
+        workers = {job.name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"job-{job.name}")
+                   for job in self.jobs}
+        now = time.monotonic()
+        for job in self.jobs:
+            job.start(now)
+        try:
+            while not stop.is_set():
+                job = min(self.jobs, key=lambda j: j.next_run)
+                delay = job.next_run - time.monotonic()
+                if delay > 0:
+                    stop.wait(delay)
+                    continue
+                if job.try_claim():
+                    workers[job.name].submit(job.run_claimed)
+                else:
+                    print(f"[JOBS] {job.name} still running; skipping this run")
+                job.schedule_next(time.monotonic())
+        finally:
+            # Let running jobs finish, then release their resources on their own threads
+            for job in self.jobs:
+                if job.close is not None:
+                    workers[job.name].submit(job.close)
+                workers[job.name].shutdown(wait=True)
+    
+    def stats(self) -> dict:
+        return {job.name: job.stats() for job in self.jobs}
+
+
+def _run_retention() -> None:
+    from app.db import SessionLocal
+    from app.retention import purge_raw_snapshots, fold_rollups_to_hourly
+    from notifications.outbox import purge_sent
+    db = SessionLocal()
+    try:
+        purge_raw_snapshots(db, settings.raw_retention_days)
+        fold_rollups_to_hourly(db, settings.rollup_hourly_after_days)
+        purge_sent(db, settings.outbox_keep_days)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _deliver_outbox() -> None:
+    """Retry queued email that is due; logs only when there was something to send."""
+    import json
+    from app.db import SessionLocal
+    from notifications.outbox import deliver_pending
+    from notifications.transport import transport_stats
+    db = SessionLocal()
+    try:
+        stats = deliver_pending(db)
+        if stats["requests"] or stats["retrying"]:
+            print(f"[OUTBOX] {json.dumps(stats)} transport: {json.dumps(transport_stats())}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def default_jobs(client=None) -> list:
+    """Scrape (and alert), digests and outbox retries on intervals, retention daily.
+    
+    The scrape job keeps one browser (started only if the HTTP fast path
+    fails) and uses `client`, an httpx.Client the caller keeps open.
+    """
+    from ingestion.scraper import HOURS_URL, BrowserScraper, scrape
+    from notifications.email import send_digest
+    jitter = settings.job_jitter_seconds
+    browser = BrowserScraper()
+    jobs = [
+        # Low-usage alerts are evaluated by the scrape itself, on the new readings
+        Job("scrape", lambda: scrape(HOURS_URL, browser=browser, client=client),
+            interval_seconds=settings.scrape_interval_minutes * 60, jitter_seconds=jitter,
+            start_after_seconds=0, close=browser.close),
+        # Each subscriber's digest goes out on the first check after their own digest time
+        Job("digest", lambda: send_digest(verbose=False), interval_seconds=settings.digest_interval_seconds,
+            jitter_seconds=min(jitter, settings.digest_interval_seconds / 2), start_after_seconds=0),
+        # Emails whose first send failed; digests and alerts deliver their own right away
+        Job("outbox", _deliver_outbox, interval_seconds=settings.outbox_interval_seconds,
+            jitter_seconds=min(jitter, settings.outbox_interval_seconds / 2)),
+    ]
+    if settings.retention_time_local:
+        jobs.append(Job("retention", _run_retention, daily_at=settings.retention_time_local, jitter_seconds=jitter))
+    return jobs
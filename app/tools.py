@@ -4,15 +4,20 @@ Tool functions exposed to Gemini via function calling.
 Each function queries PostgreSQL and returns structured data
 that Gemini can reason over to produce a natural language answer.
 
-Why 3 tools?
+Why 4 tools?
   - get_current_usage   → "how busy is it RIGHT NOW"
   - get_best_times      → "WHEN should I go" (uses existing analytics)
+  - get_forecast        → "how busy WILL it be" (next 24-72 hours)
   - query_gym_data      → "show me PATTERNS" (arbitrary day/hour/facility filters)
 """
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, cast, Integer
 from app import models
+from app.facilities import facility_index, facility_names, resolve_facilities
+from analytics.core import local_fields, mean_dict
+from analytics.snapshots import latest_readings, latest_timestamp, load_snapshot_arrays
+import numpy as np
 import pytz
 
 TZ = pytz.timezone("America/Chicago")
@@ -21,36 +26,37 @@ WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturd
 
 def get_current_usage(db: Session, facility: str = None) -> dict:
     """Return the most recent usage snapshot for one or all facilities."""
-    query = db.query(models.UsageSnapshot)
-    if facility:
-        query = query.filter(models.UsageSnapshot.location_name.ilike(f"%{facility}%"))
-
-    latest_time = query.with_entities(func.max(models.UsageSnapshot.timestamp_utc)).scalar()
+    facility_ids = resolve_facilities(db, facility) if facility else None
+    if facility and not facility_ids:
+        return {
+            "facilities": [],
+            "message": f"No facility matches {facility!r}.",
+            "known_facilities": facility_names(db),
+        }
+    
+    latest_time = latest_timestamp(db, facility_ids=facility_ids)
     if not latest_time:
         return {"facilities": [], "message": "No usage data available yet."}
-
+    
     # Pull everything within one scrape cycle of the latest timestamp
     cutoff = latest_time - timedelta(minutes=35)
-    snapshots = (
-        query.filter(models.UsageSnapshot.timestamp_utc >= cutoff)
-        .order_by(models.UsageSnapshot.timestamp_utc.desc())
-        .all()
-    )
-
+    readings = latest_readings(db, cutoff, facility_ids=facility_ids)
+    index = facility_index(db, {facility_id for _ts, facility_id, _pct in readings})
+    
     results = []
     seen: set = set()
-    for snap in snapshots:
-        if snap.location_name not in seen:
-            seen.add(snap.location_name)
-            local_dt = pytz.UTC.localize(snap.timestamp_utc).astimezone(TZ)
+    for timestamp_utc, facility_id, usage_percentage in readings:
+        if facility_id not in seen:
+            seen.add(facility_id)
+            local_dt = pytz.UTC.localize(timestamp_utc).astimezone(TZ)
             results.append(
                 {
-                    "facility": snap.location_name,
-                    "usage_percentage": snap.usage_percentage,
+                    "facility": index.name(facility_id),
+                    "usage_percentage": usage_percentage,
                     "as_of": local_dt.strftime("%I:%M %p CST"),
                 }
             )
-
+    
     return {
         "facilities": results,
         "data_as_of": results[0]["as_of"] if results else "unknown",
@@ -64,9 +70,9 @@ def get_best_times(
 ) -> dict:
     """Return the top 3 least-crowded workout windows from historical data."""
     from analytics.recommendations import get_recommendations
-
+    
     prefs = db.query(models.UserPreferences).first()
-
+    
     # Build a temporary prefs-like object so we can reuse the existing analytics
     class _TempPrefs:
         preferred_start_time_local = "06:00"
@@ -74,14 +80,14 @@ def get_best_times(
         crowd_tolerance_pct = 100  # No filter — return all windows ranked
         areas_of_interest = []
         timezone = "America/Chicago"
-
+    
     temp = _TempPrefs()
     temp.workout_duration_minutes = workout_duration_minutes
     if prefs and prefs.areas_of_interest:
         temp.areas_of_interest = prefs.areas_of_interest
-
+    
     recommendations = get_recommendations(db, temp)
-
+    
     return {
         "best_times": [
             {"time_range": time_range, "average_usage_pct": round(pct, 1)}
@@ -92,23 +98,59 @@ def get_best_times(
     }
 
 
+def get_forecast(db: Session, facility: str = None, hours: int = 24) -> dict:
+    """Hourly usage forecast for the next `hours` (max 72), averaged over the matching facilities."""
+    from analytics.forecast import MAX_HOURS, hourly_outlook
+    from app.config import settings
+    
+    facility_ids = resolve_facilities(db, facility) if facility else None
+    if facility and not facility_ids:
+        return {
+            "forecast": [],
+            "message": f"No facility matches {facility!r}.",
+            "known_facilities": facility_names(db),
+        }
+    
+    hours = max(1, min(int(hours or 24), MAX_HOURS))
+    outlook = hourly_outlook(db, hours=hours, facility_ids=facility_ids)
+    if not outlook:
+        return {"forecast": [], "message": "Not enough usage history to forecast yet."}
+    
+    points = [
+        {"time": when.strftime("%a %I:%M %p"), "predicted_usage_pct": pct}
+        for when, pct in outlook
+    ]
+    return {
+        "facilities": [facility_index(db, facility_ids).name(i) for i in facility_ids] if facility_ids else "all",
+        "model": settings.forecast_model,
+        "forecast": points,
+        "quietest_hours": sorted(points, key=lambda p: p["predicted_usage_pct"])[:3],
+    }
+
+
 def query_gym_data(
     db: Session,
     facility: str = None,
     weekday: str = None,
     start_hour: int = None,
     end_hour: int = None,
+    lookback_days: int = None,
+    limit: int = None,
 ) -> dict:
-    """Query aggregated historical usage filtered by facility, weekday, and/or hour range."""
-    # Query all history — no date filter so older data is included
-    query = db.query(models.UsageSnapshot)
-    if facility:
-        query = query.filter(
-            models.UsageSnapshot.location_name.ilike(f"%{facility}%")
-        )
-
-    snapshots = query.all()
-
+    """Query aggregated historical usage filtered by facility, weekday, and/or hour range.
+    
+    All filters run in SQL. `lookback_days` limits history to recent local days
+    (default: all history); `limit` caps the number of (facility, hour) rows.
+    """
+    filters = {
+        "facility": facility,
+        "weekday": weekday,
+        "start_hour": start_hour,
+        "end_hour": end_hour,
+        "lookback_days": lookback_days,
+        "limit": limit,
+    }
+    
     # Resolve weekday name → integer (0=Mon … 6=Sun)
     # Use explicit None check instead of `or` so that Monday (0) doesn't evaluate as falsy
     target_weekday = None
@@ -119,35 +161,134 @@ def query_gym_data(
         if resolved is None:
             resolved = short_map.get(weekday.lower()[:3])
         target_weekday = resolved
+    
+    # Free text → facility ids, so the facility filter is an integer IN list
+    facility_ids = None
+    if facility:
+        facility_ids = resolve_facilities(db, facility)
+        if not facility_ids:
+            return {
+                "results": [],
+                "filters_applied": filters,
+                "message": f"No facility matches {facility!r}.",
+                "known_facilities": facility_names(db),
+            }
+    
+    since_date = None
+    if lookback_days:
+        since_date = datetime.now(TZ).date() - timedelta(days=int(lookback_days))
+    
+    # History comes from the half-hourly rollups — one row per bucket, not per snapshot
+    hour_buckets = _rollup_hour_buckets(
+        db, facility_ids, target_weekday, start_hour, end_hour, since_date, limit
+    )
+    if not hour_buckets:
+        # Rollups not backfilled yet — aggregate the raw snapshots instead
+        if db.get_bind().dialect.name == "postgresql":
+            aggregate = _snapshot_hour_buckets_sql
+        else:
+            aggregate = _snapshot_hour_buckets_python
+        hour_buckets = aggregate(
+            db, facility_ids, target_weekday, start_hour, end_hour, since_date, limit
+        )
+    
+    index = facility_index(db, {facility_id for facility_id, _hour in hour_buckets})
+    return _format_query_results(hour_buckets, index, filters)
+
+
+def _since_utc(since_date):
+    if since_date is None:
+        return None
+    local_midnight = TZ.localize(datetime.combine(since_date, datetime.min.time()))
+    return local_midnight.astimezone(pytz.UTC).replace(tzinfo=None)
 
-    hour_buckets: dict = {}
-    for snap in snapshots:
-        snap_local = pytz.UTC.localize(snap.timestamp_utc).astimezone(TZ)
-        if target_weekday is not None and snap_local.weekday() != target_weekday:
-            continue
-        if start_hour is not None and snap_local.hour < start_hour:
-            continue
-        if end_hour is not None and snap_local.hour >= end_hour:
-            continue
-        key = (snap.location_name, snap_local.hour)
-        hour_buckets.setdefault(key, []).append(snap.usage_percentage)
 
+def _rollup_hour_buckets(db: Session, facility_ids, target_weekday, start_hour, end_hour,
+                         since_date=None, limit=None) -> dict:
+    """Sum rollup buckets into {(facility_id, hour): (usage_sum, sample_count)}."""
+    r = models.UsageRollup
+    hour = r.bucket // 2
+    query = db.query(
+        r.facility_id, hour, func.sum(r.usage_sum), func.sum(r.sample_count)
+    )
+    if facility_ids is not None:
+        query = query.filter(r.facility_id.in_(facility_ids))
+    if target_weekday is not None:
+        query = query.filter(r.weekday == target_weekday)
+    if start_hour is not None:
+        query = query.filter(r.bucket >= start_hour * 2)
+    if end_hour is not None:
+        query = query.filter(r.bucket < end_hour * 2)
+    if since_date is not None:
+        query = query.filter(r.local_date >= since_date)
+    
+    query = query.group_by(r.facility_id, hour).order_by(r.facility_id, hour)
+    if limit:
+        query = query.limit(limit)
+    return {(fac, h): (total, count) for fac, h, total, count in query.all()}
+
+
+def _snapshot_hour_buckets_sql(db: Session, facility_ids, target_weekday, start_hour, end_hour,
+                               since_date=None, limit=None) -> dict:
+    """Same as _rollup_hour_buckets but straight from raw snapshots, grouped in Postgres."""
+    snap = models.UsageSnapshot
+    # timestamp_utc is naive UTC: tag it as UTC, then render it as Texas wall time
+    local_ts = func.timezone(TZ.zone, func.timezone("UTC", snap.timestamp_utc))
+    hour = cast(func.extract("hour", local_ts), Integer)
+    query = db.query(
+        snap.facility_id, hour, func.sum(snap.usage_percentage), func.count(snap.usage_percentage)
+    )
+    if facility_ids is not None:
+        query = query.filter(snap.facility_id.in_(facility_ids))
+    if target_weekday is not None:
+        # isodow is 1=Monday … 7=Sunday
+        query = query.filter(cast(func.extract("isodow", local_ts), Integer) == target_weekday + 1)
+    if start_hour is not None:
+        query = query.filter(hour >= start_hour)
+    if end_hour is not None:
+        query = query.filter(hour < end_hour)
+    if since_date is not None:
+        query = query.filter(snap.timestamp_utc >= _since_utc(since_date))
+    
+    query = query.group_by(snap.facility_id, hour).order_by(snap.facility_id, hour)
+    if limit:
+        query = query.limit(limit)
+    return {(fac, h): (total, count) for fac, h, total, count in query.all()}
+
+
+def _snapshot_hour_buckets_python(db: Session, facility_ids, target_weekday, start_hour, end_hour,
+                                  since_date=None, limit=None) -> dict:
+    """NumPy fallback for non-Postgres backends."""
+    arrays = load_snapshot_arrays(db, since_utc=_since_utc(since_date), facility_ids=facility_ids)
+    _day, snap_weekday, minute_of_day = local_fields(arrays.epoch)
+    snap_hour = minute_of_day // 60
+    mask = np.ones(len(arrays), dtype=bool)
+    if target_weekday is not None:
+        mask &= snap_weekday == target_weekday
+    if start_hour is not None:
+        mask &= snap_hour >= start_hour
+    if end_hour is not None:
+        mask &= snap_hour < end_hour
+    
+    keys = arrays.facility[mask].astype(np.int64) * 24 + snap_hour[mask]
+    cells = mean_dict(keys, arrays.pct[mask], len(arrays.facilities) * 24)
+    # Keys are facility_id * 24 + hour, so key order is (facility_id, hour) order
+    rows = list(cells.items())[:limit] if limit else cells.items()
+    return {(key // 24, key % 24): (avg * count, count) for key, (avg, count) in rows}
+
+
+def _format_query_results(hour_buckets: dict, index, filters: dict) -> dict:
     results = [
         {
-            "facility": fac,
+            "facility": index.name(facility_id),
             "hour": f"{hour}:00",
-            "average_usage_pct": round(sum(vals) / len(vals), 1),
-            "data_points": len(vals),
+            "average_usage_pct": round(total / count, 1),
+            "data_points": count,
         }
-        for (fac, hour), vals in sorted(hour_buckets.items())
+        for (facility_id, hour), (total, count) in hour_buckets.items()
     ]
-
+    
     return {
         "results": results,
-        "filters_applied": {
-            "facility": facility,
-            "weekday": weekday,
-            "start_hour": start_hour,
-            "end_hour": end_hour,
-        },
+        "filters_applied": filters,
     }
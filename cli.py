@@ -9,13 +9,29 @@ def cli():
     pass
 
 @cli.command()
-def ingest():
+@click.option("--source", default=None, help="URL or saved HTML file to scrape (default: the live hours.php).")
+@click.option("--no-http", is_flag=True, help="Skip the HTTP fast path and render the page with Playwright.")
+@click.option("--dry-run", is_flag=True, help="Print the readings without storing them.")
+def ingest(source, no_http, dry_run):
     """Run ingestion job."""
-    scrape()
+    from ingestion.scraper import HOURS_URL
+    scrape(source or HOURS_URL, use_http=not no_http, dry_run=dry_run)
+
+@cli.command()
+@click.option("--interval", type=int, default=None, help="Minutes between scrapes (default: SCRAPE_INTERVAL_MINUTES).")
+@click.option("--source", default=None, help="URL or saved HTML file to scrape (default: the live hours.php).")
+@click.option("--no-http", is_flag=True, help="Skip the HTTP fast path and render the page with Playwright.")
+def scrape_daemon(interval, source, no_http):
+    """Scrape on an interval in one long-running process (reuses the browser)."""
+    from ingestion.scraper import HOURS_URL, run_daemon
+    try:
+        run_daemon(interval, source or HOURS_URL, use_http=not no_http)
+    except KeyboardInterrupt:
+        print("Stopped")
 
 @cli.command()
 def digest():
-    """Send daily email digest."""
+    """Send the daily digest to subscribers whose digest time has passed and who haven't had it today."""
     from notifications.email import send_digest
     send_digest()
 
@@ -26,10 +42,192 @@ def alert():
     check_and_send_alert()
 
 @cli.command()
-def sample_data():
+@click.option("--days", type=int, default=None, help="Only rebuild the last N local days (default: all history).")
+def backfill_rollups(days):
+    """Rebuild the half-hourly usage rollups from raw snapshots."""
+    from app.db import SessionLocal
+    from analytics.rollups import backfill_rollups as rebuild
+    db = SessionLocal()
+    try:
+        count = rebuild(db, days=days)
+        db.commit()
+        print(f"Rebuilt {count} rollup rows")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@cli.command()
+def rebuild_stats():
+    """Recompute the per-weekday/half-hour usage stats from the raw snapshots still stored."""
+    from app.db import SessionLocal
+    from analytics.usage_stats import rebuild_usage_stats
+    db = SessionLocal()
+    try:
+        count = rebuild_usage_stats(db)
+        db.commit()
+        print(f"Rebuilt {count} usage stat cells")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@cli.command()
+@click.option("--hours", type=int, default=24, show_default=True, help="Hours ahead to forecast (max 72).")
+@click.option("--facility", default=None, help="Facility name filter (default: all facilities).")
+@click.option("--model", type=click.Choice(["seasonal_naive", "seasonal_ewma", "holt_winters"]), default=None,
+              help="Default: FORECAST_MODEL.")
+@click.option("--backtest", is_flag=True, help="Instead, score every model on recent days and print the MAE.")
+@click.option("--days", type=int, default=14, show_default=True, help="Days scored by --backtest.")
+def forecast(hours, facility, model, backtest, days):
+    """Print the hourly usage forecast, or backtest the forecast models."""
+    import time
+    from app.db import SessionLocal
+    from app.facilities import resolve_facilities
+    from analytics.forecast import backtest as run_backtest, hourly_outlook
+    db = SessionLocal()
+    try:
+        if backtest:
+            started = time.perf_counter()
+            scores = run_backtest(db, days=days, horizon_hours=hours)
+            print(f"Walk-forward backtest over {days} day(s), {hours}h horizon "
+                  f"({time.perf_counter() - started:.2f} s):")
+            for name, score in sorted(scores.items(), key=lambda item: (item[1]["mae"] is None, item[1]["mae"] or 0)):
+                mae = f"{score['mae']:.2f}" if score["mae"] is not None else "n/a"
+                print(f"  {name:<15} MAE {mae:>6} pct points over {score['points']} slots")
+            return
+        facility_ids = resolve_facilities(db, facility) if facility else None
+        if facility and not facility_ids:
+            raise click.BadParameter(f"No facility matches {facility!r}", param_hint="--facility")
+        for when, pct in hourly_outlook(db, hours=hours, model=model, facility_ids=facility_ids):
+            print(f"{when.strftime('%a %I:%M %p')}  {pct:5.1f}%")
+    finally:
+        db.close()
+
+@cli.command()
+@click.option("--months-ahead", type=int, default=3, show_default=True, help="Months of empty partitions to keep ready.")
+def create_partitions(months_ahead):
+    """Create upcoming monthly partitions of usage_snapshots."""
+    from app.db import engine
+    from app.partitions import is_partitioned, ensure_future_partitions
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            print("usage_snapshots is not partitioned (set PARTITION_USAGE_SNAPSHOTS=1 before migrating)")
+            return
+        created = ensure_future_partitions(conn, months_ahead=months_ahead)
+    print(f"Created {len(created)} partition(s): {', '.join(created) if created else 'none needed'}")
+
+@cli.command()
+def serve_jobs():
+    """Run scrape (with alerts), outbox retries, digest and retention in one long-running process."""
+    import json
+    import signal
+    import threading
+    from app.scheduler import Scheduler, default_jobs
+    from ingestion.scraper import http_client
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    from notifications.transport import close_transport, transport_stats
+    with http_client() as client:
+        scheduler = Scheduler(default_jobs(client=client))
+        print(f"[JOBS] Serving {', '.join(job.name for job in scheduler.jobs)}")
+        try:
+            scheduler.run_forever(stop)
+        finally:
+            email_stats = transport_stats()
+            close_transport()
+    print(f"[JOBS] Stopped. {json.dumps(scheduler.stats())} email: {json.dumps(email_stats)}")
+
+@cli.command()
+@click.option("--retry-dead", is_flag=True, help="Requeue emails that used up their attempts or were rejected.")
+def outbox(retry_dead):
+    """Deliver queued emails that are due and show the outbox counts."""
+    import json
+    from app.db import SessionLocal
+    from notifications import outbox as email_outbox
+    from notifications.transport import close_transport, transport_stats
+    db = SessionLocal()
+    try:
+        if retry_dead:
+            print(f"Requeued {email_outbox.retry_dead(db)} dead email(s)")
+        print(f"Delivered: {json.dumps(email_outbox.deliver_pending(db))}")
+        print(f"Transport: {json.dumps(transport_stats())}")
+        print(f"Outbox:    {json.dumps(email_outbox.outbox_stats(db))}")
+    finally:
+        db.close()
+        close_transport()
+
+@cli.command()
+@click.option("--raw-days", type=int, default=None, help="Keep raw snapshots for N days (default: RAW_RETENTION_DAYS).")
+@click.option("--hourly-after-days", type=int, default=None, help="Fold older half-hourly rollups into hourly ones (default: ROLLUP_HOURLY_AFTER_DAYS).")
+@click.option("--batch-days", type=int, default=7, show_default=True, help="Local days of raw snapshots deleted per transaction.")
+@click.option("--vacuum", is_flag=True, help="VACUUM (ANALYZE) the history tables afterwards.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be deleted or folded.")
+def retention(raw_days, hourly_after_days, batch_days, vacuum, dry_run):
+    """Purge old raw snapshots and downsample old rollups (keeps the heatmap history)."""
+    from app.config import settings
+    from app.db import SessionLocal, engine
+    from app.retention import purge_raw_snapshots, fold_rollups_to_hourly, vacuum_history
+    from notifications.outbox import purge_sent
+    raw_days = raw_days if raw_days is not None else settings.raw_retention_days
+    hourly_after_days = hourly_after_days if hourly_after_days is not None else settings.rollup_hourly_after_days
+    db = SessionLocal()
+    try:
+        purged = purge_raw_snapshots(db, raw_days, batch_days=batch_days, dry_run=dry_run)
+        folded = fold_rollups_to_hourly(db, hourly_after_days, dry_run=dry_run)
+        emails_purged = 0 if dry_run else purge_sent(db, settings.outbox_keep_days)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    
+    verb = "Would delete" if dry_run else "Deleted"
+    print(f"{verb} {purged['snapshots_deleted']} raw snapshots before {purged['cutoff_date']}"
+          f" ({len(purged['partitions_dropped'])} whole partition(s): {', '.join(purged['partitions_dropped']) or 'none'})")
+    if purged["days_repaired"]:
+        print(f"Rebuilt rollups for {purged['days_repaired']} day(s) that were missing samples")
+    print(f"{'Would fold' if dry_run else 'Folded'} {folded} half-hourly rollup rows into hourly ones")
+    if not dry_run:
+        print(f"Deleted {emails_purged} sent email(s) older than {settings.outbox_keep_days} days from the outbox")
+    if vacuum and not dry_run:
+        vacuum_history(engine)
+        print("Vacuumed usage_snapshots and usage_rollups")
+
+@cli.command()
+@click.option("--days", type=int, default=14, show_default=True, help="Days of history ending now.")
+@click.option("--start", type=click.DateTime(), default=None, help="UTC start (overrides --days).")
+@click.option("--end", type=click.DateTime(), default=None, help="UTC end (default: now).")
+@click.option("--facilities", "facility_count", type=int, default=None, help="Number of facilities (default: the TTU list).")
+@click.option("--seed", type=int, default=None, help="Random seed for reproducible data.")
+def sample_data(days, start, end, facility_count, seed):
     """Generate sample data for testing."""
     from scripts.generate_sample_data import generate_sample_data
-    generate_sample_data()
+    generate_sample_data(days=days, start=start, end=end, facility_count=facility_count, seed=seed)
+
+@cli.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["csv", "parquet"]), default=None, help="Default: from the file extension.")
+@click.option("--parser-version", default="import_1.0", show_default=True, help="Stored for rows that don't carry one.")
+def import_snapshots(path, file_format, parser_version):
+    """Bulk-import archived snapshots (timestamp_utc, location_name, usage_percentage)."""
+    from app.db import SessionLocal
+    from ingestion.bulk import import_file
+    db = SessionLocal()
+    try:
+        count = import_file(db, path, parser_version, file_format=file_format)
+        db.commit()
+        print(f"Imported {count} new snapshots from {path}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 if __name__ == "__main__":
     cli()
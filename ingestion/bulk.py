@@ -0,0 +1,202 @@
+"""
+Bulk loading of snapshot history into Postgres.
+
+Rows are streamed with COPY into a temporary staging table and merged into
+usage_snapshots with one INSERT ... SELECT ... ON CONFLICT DO NOTHING per batch.
+Facility names are mapped to ids in the same statement; names not yet in the
+facilities table are added first, and likewise new parser versions.
+The same statement folds the rows it actually inserted into usage_rollups and
+usage_stats, so a bulk load leaves both consistent without a separate backfill
+or rebuild (which would lose the stats of readings retention has purged).
+
+Used by the sample-data generator and `python -m cli import-snapshots`
+(CSV, or Parquet when pyarrow is installed).
+"""
+import csv
+import io
+import os
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.facilities import invalidate_facilities_after_transaction
+from analytics.rollups import ROLLUP_INSERT_SQL, ROLLUP_SELECT_SQL, ROLLUP_MERGE_SQL
+from analytics.snapshots import bump_data_version
+from analytics.usage_stats import STATS_MERGE_SQL, STATS_SELECT_SQL, stats_params
+
+STAGING_TABLE = "usage_snapshots_import"
+IMPORT_COLUMNS = ("timestamp_utc", "location_name", "usage_percentage", "scraped_at_utc", "parser_version")
+REQUIRED_COLUMNS = ("timestamp_utc", "location_name", "usage_percentage")
+
+# Matches a staged name to a facility by canonical name or alias
+_FACILITY_MATCH = "(f.name = s.location_name OR s.location_name = ANY(f.aliases))"
+
+# Rows inserted by a data-modifying CTE are invisible to the rest of the same
+# statement, so new facilities go in first, as their own statement.
+_NEW_FACILITIES_SQL = f"""
+    INSERT INTO facilities (name, display_order)
+    SELECT s.location_name,
+           (SELECT COALESCE(MAX(display_order), 0) FROM facilities)
+               + ROW_NUMBER() OVER (ORDER BY s.location_name)
+    FROM (SELECT DISTINCT location_name FROM {STAGING_TABLE}) s
+    WHERE NOT EXISTS (SELECT 1 FROM facilities f WHERE {_FACILITY_MATCH})
+    ON CONFLICT (name) DO NOTHING
+"""
+
+_NEW_PARSER_VERSIONS_SQL = f"""
+    INSERT INTO parser_versions (version)
+    SELECT DISTINCT COALESCE(parser_version, :parser_version) FROM {STAGING_TABLE}
+    ON CONFLICT (version) DO NOTHING
+"""
+
+_MERGE_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO usage_snapshots
+            (timestamp_utc, facility_id, usage_percentage, parser_version_id)
+        SELECT date_trunc('minute', s.timestamp_utc), f.id, s.usage_percentage, p.id
+        FROM {STAGING_TABLE} s
+        JOIN facilities f ON {_FACILITY_MATCH}
+        JOIN parser_versions p ON p.version = COALESCE(s.parser_version, :parser_version)
+        WHERE s.usage_percentage BETWEEN 0 AND 100
+        ON CONFLICT (facility_id, timestamp_utc) DO NOTHING
+        RETURNING facility_id, timestamp_utc, usage_percentage
+    ),
+    rolled AS (
+        {ROLLUP_INSERT_SQL}
+        {ROLLUP_SELECT_SQL.format(source="inserted")}
+        {ROLLUP_MERGE_SQL}
+        RETURNING 1
+    ),
+    cells AS (
+        {STATS_SELECT_SQL.format(source="inserted")}
+    ),
+    stats AS (
+        {STATS_MERGE_SQL.format(cells="cells")}
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM inserted
+"""
+
+
+def _require_postgres(db: Session):
+    if db.get_bind().dialect.name != "postgresql":
+        raise RuntimeError("Bulk loading uses COPY and requires PostgreSQL")
+
+
+def _create_staging(db: Session):
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+        "timestamp_utc timestamp, location_name text, usage_percentage integer, "
+        "scraped_at_utc timestamp, parser_version text) ON COMMIT DROP"
+    ))
+
+
+def _copy_into_staging(db: Session, stream, columns, header: bool) -> None:
+    """Stream CSV from a file-like object into the staging table with COPY."""
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(columns)}) FROM STDIN "
+            f"WITH (FORMAT csv, HEADER {'true' if header else 'false'})",
+            stream,
+        )
+    finally:
+        cursor.close()
+
+
+def _merge_staging(db: Session, parser_version: str) -> int:
+    if db.execute(text(_NEW_FACILITIES_SQL)).rowcount:
+        invalidate_facilities_after_transaction(db)
+    db.execute(text(_NEW_PARSER_VERSIONS_SQL), {"parser_version": parser_version})
+    inserted = db.execute(
+        text(_MERGE_SQL), {"parser_version": parser_version, **stats_params()}
+    ).scalar()
+    db.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+    return inserted
+
+
+def load_rows(db: Session, batches, parser_version: str) -> int:
+    """Load an iterable of row batches, each a sequence of
+    (timestamp_utc, location_name, usage_percentage) tuples.
+    
+    Each batch is one COPY plus one merge, so memory stays bounded by the batch
+    size. Does not commit; returns the number of new snapshots.
+    """
+    _require_postgres(db)
+    _create_staging(db)
+    total = 0
+    for batch in batches:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(batch)
+        buf.seek(0)
+        _copy_into_staging(db, buf, REQUIRED_COLUMNS, header=False)
+        total += _merge_staging(db, parser_version)
+    if total:
+        # Archived rows can land anywhere in the past
+        bump_data_version(db, history=True)
+    return total
+
+
+def import_csv(db: Session, path: str, parser_version: str) -> int:
+    """Stream a CSV file with a header row straight into Postgres via COPY.
+    
+    The header must name timestamp_utc, location_name and usage_percentage;
+    parser_version is optional. scraped_at_utc is accepted for older exports
+    but not stored. Timestamps are UTC. Like load_rows, bumps the data
+    version (history included) when rows were added; does not commit.
+    """
+    _require_postgres(db)
+    with open(path, newline="") as f:
+        header = next(csv.reader(f))
+        columns = _validate_columns(header)
+        f.seek(0)
+        _create_staging(db)
+        _copy_into_staging(db, f, columns, header=True)
+    total = _merge_staging(db, parser_version)
+    if total:
+        bump_data_version(db, history=True)
+    return total
+
+
+def import_parquet(db: Session, path: str, parser_version: str, batch_size: int = 500_000) -> int:
+    """Import a Parquet file batch by batch (requires pyarrow)."""
+    try:
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet import requires pyarrow. Run: pip install pyarrow")
+    
+    _require_postgres(db)
+    parquet = pq.ParquetFile(path)
+    columns = _validate_columns(parquet.schema_arrow.names)
+    _create_staging(db)
+    total = 0
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=list(columns)):
+        buf = io.BytesIO()
+        pa_csv.write_csv(batch, buf, pa_csv.WriteOptions(include_header=False))
+        buf.seek(0)
+        _copy_into_staging(db, buf, columns, header=False)
+        total += _merge_staging(db, parser_version)
+    if total:
+        bump_data_version(db, history=True)
+    return total
+
+
+def import_file(db: Session, path: str, parser_version: str, file_format: str = None) -> int:
+    """Import archived snapshots from CSV or Parquet, picking the format by extension."""
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format == "csv":
+        return import_csv(db, path, parser_version)
+    if file_format in ("parquet", "pq"):
+        return import_parquet(db, path, parser_version)
+    raise ValueError(f"Unsupported import format: {file_format!r} (expected csv or parquet)")
+
+
+def _validate_columns(names) -> tuple:
+    columns = tuple(n.strip() for n in names)
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    unknown = [c for c in columns if c not in IMPORT_COLUMNS]
+    if missing or unknown:
+        raise ValueError(
+            f"Import columns must include {', '.join(REQUIRED_COLUMNS)} "
+            f"(missing: {missing or 'none'}, unknown: {unknown or 'none'})"
+        )
+    return columns
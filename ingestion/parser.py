@@ -0,0 +1,118 @@
+"""
+Parsing of the Live Facility Counts section of hours.php.
+
+The page renders one `<svg class="chart">` per facility inside `div#charts`:
+
+    <div id="charts">
+      <svg class="chart">
+        <text x="20" y="20">Raider Power Zone</text>
+        <text x="20" y="35">Last Updated: 4:34 PM</text>
+        <text x="200" y="45">83%</text>
+      ...
+
+`parse_html` reads that straight from the served HTML with the standard
+library's HTMLParser (the HTTP fast path); the Playwright path collects the
+same text nodes from the live DOM. Both turn them into locations with
+`locations_from_charts`, so the two paths agree on what counts as a reading.
+"""
+import re
+from html.parser import HTMLParser
+
+_PERCENT = re.compile(r'(\d+)\s*%')
+
+# Body-text fallback: "Facility Name: XX%" or "XX% Facility Name"
+_TEXT_PATTERN = re.compile(
+    r'([A-Z][A-Za-z\s&]+?)\s*[:]?\s*(\d+)\s*%|'
+    r'(\d+)\s*%\s*([A-Z][A-Za-z\s&]+)',
+    re.IGNORECASE | re.MULTILINE
+)
+_TEXT_STOPWORDS = {'the', 'and', 'for', 'university', 'recreation'}
+
+
+def _add_location(locations: list, name: str, pct: int) -> None:
+    if 0 <= pct <= 100 and len(name) > 2 and not any(loc["name"] == name for loc in locations):
+        locations.append({"name": name, "usage": pct})
+
+
+def locations_from_charts(charts) -> list:
+    """Locations from the text nodes of each chart: [name, last updated, "NN%", ...].
+    
+    Charts with fewer than three text nodes or no percentage are skipped; the
+    first reading of a facility wins.
+    """
+    locations = []
+    for texts in charts:
+        if len(texts) < 3:
+            continue
+        percent_match = _PERCENT.search(texts[2].strip())
+        if percent_match:
+            _add_location(locations, texts[0].strip(), int(percent_match.group(1)))
+    return locations
+
+
+def locations_from_text(body_text: str) -> list:
+    """Best-effort locations from the page's visible text, for when the charts are missing."""
+    locations = []
+    for match in _TEXT_PATTERN.findall(body_text):
+        # Handle both pattern directions
+        if match[0] and match[1]:  # "Name: XX%"
+            name, pct = match[0].strip(), int(match[1])
+        elif match[2] and match[3]:  # "XX% Name"
+            name, pct = match[3].strip(), int(match[2])
+        else:
+            continue
+        if name.lower() not in _TEXT_STOPWORDS:
+            _add_location(locations, name, pct)
+    return locations
+
+
+class _ChartTextParser(HTMLParser):
+    """Collects the text of every <text> node of each svg.chart inside div#charts."""
+    
+    def __init__(self):
+        super().__init__()
+        self.charts = []
+        self._charts_depth = 0  # open <div>s since div#charts, 0 = outside it
+        self._svg_depth = 0
+        self._text = None
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == "div":
+            if self._charts_depth:
+                self._charts_depth += 1
+            elif dict(attrs).get("id") == "charts":
+                self._charts_depth = 1
+        elif tag == "svg" and self._charts_depth:
+            if self._svg_depth:
+                self._svg_depth += 1
+            elif "chart" in (dict(attrs).get("class") or "").split():
+                self._svg_depth = 1
+                self.charts.append([])
+        elif tag == "text" and self._svg_depth and self._text is None:
+            self._text = []
+    
+    def handle_endtag(self, tag):
+        if tag == "div" and self._charts_depth:
+            self._charts_depth -= 1
+        elif tag == "svg" and self._svg_depth:
+            self._svg_depth -= 1
+        elif tag == "text" and self._text is not None:
+            self.charts[-1].append("".join(self._text))
+            self._text = None
+    
+    def handle_data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+
+def chart_texts(html: str) -> list:
+    """Text nodes of each `#charts svg.chart`, in document order."""
+    parser = _ChartTextParser()
+    parser.feed(html)
+    parser.close()
+    return parser.charts
+
+
+def parse_html(html: str) -> list:
+    """Locations from served HTML ([] when the charts aren't in the markup)."""
+    return locations_from_charts(chart_texts(html))
@@ -1,144 +1,205 @@
-from playwright.sync_api import sync_playwright
 from datetime import datetime
+from pathlib import Path
+import time
+import httpx
+from app.config import settings
 from app.db import SessionLocal
-from app import models
-import re
+from ingestion.parser import parse_html, locations_from_charts, locations_from_text
+from ingestion.storage import insert_snapshots
+from notifications.alerts import evaluate_readings
 
-PARSER_VERSION = "1.0"
+HOURS_URL = "https://www.depts.ttu.edu/recreation/facilities/hours.php"
+PARSER_VERSION = "1.0"  # Playwright (rendered DOM)
+HTTP_PARSER_VERSION = "http-1.0"  # httpx + HTML parser
+HTTP_TIMEOUT_SECONDS = 15
+USER_AGENT = "gym-usage-forecast/1.0 (+read-only facility count scraper)"
 
-def scrape():
+
+def _is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def http_client() -> httpx.Client:
+    """A reusable client for the fast path (long-running workers keep one open)."""
+    return httpx.Client(timeout=HTTP_TIMEOUT_SECONDS, headers={"User-Agent": USER_AGENT}, follow_redirects=True)
+
+
+def fetch_locations_http(source: str = HOURS_URL, client: httpx.Client = None) -> list:
+    """Fast path: fetch hours.php (or read a saved copy) and parse the chart SVGs.
+    
+    Returns [] when the charts aren't in the served HTML, or on an HTTP error,
+    so the caller can fall back to the browser.
     """
-    Scrape TTU Live Facility Counts from hours.php and store in DB.
+    if not _is_url(source):
+        return parse_html(Path(source).read_text(encoding="utf-8"))
+    try:
+        if client is not None:
+            response = client.get(source)
+        else:
+            response = httpx.get(source, timeout=HTTP_TIMEOUT_SECONDS, headers={"User-Agent": USER_AGENT},
+                                 follow_redirects=True)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"HTTP fetch failed ({e}); falling back to the browser")
+        return []
+    return parse_html(response.text)
+
+
+class BrowserScraper:
+    """Playwright fallback that keeps one Chromium and context open across scrapes.
     
-    Note: Data is manually updated by the university on the page.
-    This scraper is read-only and does not modify any TTU systems.
-    URL: https://www.depts.ttu.edu/recreation/facilities/hours.php
+    The browser starts on first use, so runs served by the HTTP fast path
+    never pay for it. Use as a context manager, or call close().
     """
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        page.goto("https://www.depts.ttu.edu/recreation/facilities/hours.php", wait_until="networkidle")
-        
-        # Wait for page to fully load
-        page.wait_for_load_state("networkidle")
-        
-        locations = []
+    
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._context = None
+    
+    def _ensure_started(self):
+        if self._context is None:
+            from playwright.sync_api import sync_playwright
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=True)
+            self._context = self._browser.new_context(user_agent=USER_AGENT)
+    
+    def fetch_locations(self, source: str = HOURS_URL) -> list:
+        """Render the page and read the chart SVGs, falling back to the page text."""
+        self._ensure_started()
+        url = source if _is_url(source) else Path(source).resolve().as_uri()
+        page = self._context.new_page()
         try:
-            # Wait for LIVE FACILITY COUNTS section (best-effort)
+            page.goto(url, wait_until="networkidle")
             try:
-                page.wait_for_selector("div#charts h1:has-text('LIVE FACILITY COUNTS')", timeout=5000)
-            except:
-                pass  # Continue even if selector doesn't match exactly
-            
-            # Strategy 1 (primary): SVG charts inside #charts
-            # Structure example:
-            # <div id="charts">
-            #   <svg class="chart">
-            #     <text x="20" y="20">Raider Power Zone</text>
-            #     <text x="20" y="35">Last Updated: 4:34 PM</text>
-            #     <text x="200" y="45">83%</text>
-            #   ...
-            chart_svgs = page.query_selector_all("#charts svg.chart")
-            for svg in chart_svgs:
-                texts = svg.query_selector_all("text")
-                if len(texts) < 3:
-                    continue
-                
-                # For SVG <text> nodes, use text_content() instead of inner_text()
-                name_text = (texts[0].text_content() or "").strip()
-                pct_text = (texts[2].text_content() or "").strip()
-                
-                percent_match = re.search(r'(\d+)\s*%', pct_text)
-                if not percent_match:
-                    continue
-                
-                try:
-                    pct = int(percent_match.group(1))
-                except ValueError:
-                    continue
-                
-                if 0 <= pct <= 100 and len(name_text) > 2:
-                    if not any(loc["name"] == name_text for loc in locations):
-                        locations.append({"name": name_text, "usage": pct})
+                page.wait_for_selector("#charts svg.chart", timeout=5000)
+            except Exception:
+                pass  # Continue even if the charts never render; the text fallback may still work
             
-            # Strategy 2 (fallback): parse entire page text if SVG parsing fails
+            # For SVG <text> nodes, text_content() rather than inner_text()
+            charts = [
+                [t.text_content() or "" for t in svg.query_selector_all("text")]
+                for svg in page.query_selector_all("#charts svg.chart")
+            ]
+            locations = locations_from_charts(charts)
             if not locations:
                 body = page.query_selector("body")
                 if body:
-                    body_text = body.inner_text()
-                    # Look for patterns like "Facility Name: XX%" or "Facility Name XX%"
-                    pattern = re.compile(
-                        r'([A-Z][A-Za-z\s&]+?)\s*[:]?\s*(\d+)\s*%|'
-                        r'(\d+)\s*%\s*([A-Z][A-Za-z\s&]+)',
-                        re.IGNORECASE | re.MULTILINE
-                    )
-                    matches = pattern.findall(body_text)
-                    
-                    for match in matches:
-                        # Handle both pattern directions
-                        if match[0] and match[1]:  # "Name: XX%"
-                            name = match[0].strip()
-                            pct = int(match[1])
-                        elif match[2] and match[3]:  # "XX% Name"
-                            name = match[3].strip()
-                            pct = int(match[2])
-                        else:
-                            continue
-                        
-                        # Filter out false positives
-                        if (0 <= pct <= 100 and 
-                            len(name) > 2 and 
-                            name.lower() not in ['the', 'and', 'for', 'university', 'recreation'] and
-                            not any(loc["name"] == name for loc in locations)):
-                            locations.append({"name": name, "usage": pct})
-            
-            # Debug: Print what we found
-            if locations:
-                print(f"Found {len(locations)} facilities:")
-                for loc in locations:
-                    print(f"  - {loc['name']}: {loc['usage']}%")
-            else:
-                # Save page HTML for debugging
-                html = page.content()
+                    locations = locations_from_text(body.inner_text())
+            if not locations:
                 print("No locations found. Page structure:")
-                print(html[:1000])  # First 1000 chars for debugging
-                
-        except Exception as e:
-            print(f"Scraping error: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        browser.close()
+                print(page.content()[:1000])  # First 1000 chars for debugging
+            return locations
+        finally:
+            page.close()
+    
+    def close(self):
+        for resource, shutdown in ((self._context, "close"), (self._browser, "close"), (self._playwright, "stop")):
+            if resource is not None:
+                try:
+                    getattr(resource, shutdown)()
+                except Exception:
+                    pass  # Already gone, e.g. the browser crashed
+        self._playwright = self._browser = self._context = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def collect_locations(source: str = HOURS_URL, browser: BrowserScraper = None,
+                      client: httpx.Client = None, use_http: bool = True):
+    """Readings from the HTTP fast path, or the browser when it finds no facilities.
+    
+    Returns (locations, parser_version). A browser is launched for this call
+    only if none is passed in.
+    """
+    if use_http:
+        locations = fetch_locations_http(source, client)
+        if locations:
+            return locations, HTTP_PARSER_VERSION
+    
+    try:
+        if browser is not None:
+            return browser.fetch_locations(source), PARSER_VERSION
+        with BrowserScraper() as one_off:
+            return one_off.fetch_locations(source), PARSER_VERSION
+    except Exception as e:
+        print(f"Scraping error: {e}")
+        import traceback
+        traceback.print_exc()
+        if browser is not None:
+            browser.close()  # Relaunched on next use, in case the browser itself died
+        return [], PARSER_VERSION
+
+
+def scrape(source: str = HOURS_URL, browser: BrowserScraper = None, client: httpx.Client = None,
+           use_http: bool = True, dry_run: bool = False):
+    """
+    Scrape TTU Live Facility Counts from hours.php and store in DB.
+    
+    Note: Data is manually updated by the university on the page.
+    This scraper is read-only and does not modify any TTU systems.
+    URL: https://www.depts.ttu.edu/recreation/facilities/hours.php
+    
+    `source` may also be a saved copy of the page (a local path), which both
+    the HTTP parser and the browser can read. With `dry_run` the readings are
+    printed but not stored. New readings are checked against the low-usage
+    alert rules once committed. Returns the list of readings.
+    """
+    locations, parser_version = collect_locations(source, browser, client, use_http)
     
     if not locations:
         print("No locations found - check selectors or page structure")
-        return
+        return locations
+    
+    print(f"Found {len(locations)} facilities ({parser_version}):")
+    for loc in locations:
+        print(f"  - {loc['name']}: {loc['usage']}%")
+    if dry_run:
+        return locations
     
     db = SessionLocal()
     try:
-        stored_count = 0
-        for loc in locations:
-            # Check for duplicates (timestamp + location) - within same minute
-            cutoff = datetime.utcnow().replace(second=0, microsecond=0)
-            existing = db.query(models.UsageSnapshot).filter(
-                models.UsageSnapshot.location_name == loc["name"],
-                models.UsageSnapshot.timestamp_utc >= cutoff
-            ).first()
-            
-            if not existing:
-                snapshot = models.UsageSnapshot(
-                    timestamp_utc=datetime.utcnow(),
-                    location_name=loc["name"],
-                    usage_percentage=loc["usage"],
-                    parser_version=PARSER_VERSION
-                )
-                db.add(snapshot)
-                stored_count += 1
+        # One shared timestamp for the whole scrape, written in a single statement
+        inserted = insert_snapshots(db, locations, datetime.utcnow(), parser_version)
         db.commit()
-        print(f"Stored {stored_count} new snapshots")
+        print(f"Stored {len(inserted)} new snapshots")
     except Exception as e:
         db.rollback()
+        db.close()
         print(f"Database error: {e}")
         raise
+    
+    try:
+        if inserted:
+            stats = evaluate_readings(db, inserted)
+            if stats["matched"]:
+                print(f"[ALERT] {stats['matched']} subscriber(s) matched, {stats['sent']} alert(s) sent")
+    except Exception as e:
+        # A failed alert never fails the scrape; the readings are already stored
+        db.rollback()
+        print(f"[ALERT] Error: {e}")
     finally:
         db.close()
+    return locations
+
+
+def run_daemon(interval_minutes: int = None, source: str = HOURS_URL, use_http: bool = True):
+    """Scrape every `interval_minutes` (default SCRAPE_INTERVAL_MINUTES) until interrupted.
+    
+    One HTTP client and, only if the fast path ever comes up empty, one
+    browser context are reused for the life of the process.
+    """
+    interval = (interval_minutes or settings.scrape_interval_minutes) * 60
+    with http_client() as client, BrowserScraper() as browser:
+        while True:
+            started = time.monotonic()
+            try:
+                scrape(source, browser=browser, client=client, use_http=use_http)
+            except Exception as e:
+                # Keep the daemon alive through database hiccups; the next run retries
+                print(f"Scrape failed: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
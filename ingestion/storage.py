@@ -0,0 +1,97 @@
+"""Write scraped facility readings to usage_snapshots (plus the rollups and usage stats) in one round-trip."""
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app import models
+from app.facilities import get_or_create_facility_id
+from analytics.rollups import apply_snapshots
+from analytics.snapshots import bump_data_version
+from analytics.usage_stats import apply_readings
+
+# parser version string -> parser_versions.id; versions are never renamed or deleted
+_parser_version_ids = {}
+
+
+def get_or_create_parser_version_id(db: Session, version: str) -> int:
+    """Id for a parser version string, adding it to the lookup table if it is new.
+    
+    Only ids already committed are cached, so a rolled-back scrape can't leave
+    a dangling id behind.
+    """
+    version_id = _parser_version_ids.get(version)
+    if version_id is not None:
+        return version_id
+    
+    pv = models.ParserVersion
+    version_id = db.execute(select(pv.id).where(pv.version == version)).scalar()
+    if version_id is not None:
+        _parser_version_ids[version] = version_id
+        return version_id
+    
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            pg_insert(pv.__table__)
+            .values(version=version)
+            .on_conflict_do_nothing(index_elements=["version"])
+        )
+    else:
+        db.add(pv(version=version))
+        db.flush()
+    return db.execute(select(pv.id).where(pv.version == version)).scalar_one()
+
+
+def insert_snapshots(db: Session, locations, scraped_at: datetime, parser_version: str) -> list:
+    """Insert one scrape's readings with a single shared, minute-truncated timestamp.
+    
+    `locations` is a list of {"name": ..., "usage": ...} dicts; names resolve to
+    facility ids (new facilities are added). On Postgres this is
+    one multi-row INSERT ... ON CONFLICT DO NOTHING against the
+    (facility_id, timestamp_utc) primary key, so retried or concurrent scrapes of the
+    same minute are no-ops. Only rows actually inserted are folded into the
+    rollups and usage stats. Does not commit; returns the new rows as
+    (facility_id, timestamp_utc, usage_percentage).
+    """
+    if not locations:
+        return []
+    
+    timestamp_utc = scraped_at.replace(second=0, microsecond=0)
+    parser_version_id = get_or_create_parser_version_id(db, parser_version)
+    values = [
+        {
+            "timestamp_utc": timestamp_utc,
+            "facility_id": get_or_create_facility_id(db, loc["name"]),
+            "usage_percentage": loc["usage"],
+            "parser_version_id": parser_version_id,
+        }
+        for loc in locations
+    ]
+    
+    snap = models.UsageSnapshot
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = (
+            pg_insert(snap.__table__)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["facility_id", "timestamp_utc"])
+            .returning(snap.facility_id, snap.timestamp_utc, snap.usage_percentage)
+        )
+        inserted = db.execute(stmt).all()
+    else:
+        existing = {
+            fid for (fid,) in db.query(snap.facility_id).filter(
+                snap.timestamp_utc == timestamp_utc
+            )
+        }
+        inserted = []
+        for row in values:
+            if row["facility_id"] not in existing:
+                db.add(snap(**row))
+                existing.add(row["facility_id"])
+                inserted.append((row["facility_id"], timestamp_utc, row["usage_percentage"]))
+    
+    # Keep the half-hourly rollups and running stats in step with the raw rows (same transaction)
+    apply_snapshots(db, inserted)
+    apply_readings(db, inserted)
+    if inserted:
+        bump_data_version(db)
+    return [tuple(row) for row in inserted]
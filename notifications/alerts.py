@@ -0,0 +1,266 @@
+"""
+Low-usage alerts, evaluated as readings are ingested.
+
+Every subscriber with an email and a preferred time window is one rule:
+alert when a facility they follow (any facility if they picked none) reads
+below their `alert_threshold_pct` inside their window, at most once per
+local day. A window that ends at or before its start (e.g. 22:00-02:00)
+runs past midnight, and its small hours count as the day it opened on.
+`AlertIndex` files the rules under (facility, half-hour slot of
+the day), each list sorted by threshold, so a new reading only looks at the
+rules for its facility and slot and bisects straight to the ones whose
+threshold it is under.
+
+The scraper passes the rows it just inserted to `evaluate_readings`;
+`python -m cli alert` runs the same rules over the last hour of readings.
+Dedup is per subscriber: `last_alert_sent_date` is claimed in the database
+(so two processes can't both alert the same person) in the same transaction
+that queues the email in the outbox, which retries it until it is delivered.
+Subscribers whose rows another transaction has locked are claimed again
+once it commits, so a concurrent preference save can't swallow an alert.
+"""
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import pytz
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from app.facilities import facility_ids_for, facility_index
+from analytics.rollups import local_midnight_utc
+from notifications.digest import templates
+from notifications.outbox import deliver_pending, enqueue
+from notifications.transport import EmailTransport
+
+TZ = pytz.timezone("America/Chicago")
+ALERT_SUBJECT = "🚨 Raider Power Zone - Low Usage Alert"
+ALERT_TEMPLATE = templates.get_template("alert.html")
+DEFAULT_THRESHOLD_PCT = 30
+SLOT_MINUTES = 30
+ALL_FACILITIES = None  # index key for subscribers who follow every facility
+ALERT_INDEX_TTL_SECONDS = 300  # preference edits reach other processes within this
+
+
+@dataclass
+class AlertRule:
+    subscriber_id: int
+    email: str
+    threshold: int  # alert when usage < threshold
+    start_minutes: int  # local window [start, end), minutes after midnight
+    end_minutes: int
+    facility_ids: tuple  # () = every facility
+    alerted_on: date = None  # local date the window of the last alert opened on
+    
+    @property
+    def crosses_midnight(self) -> bool:
+        return self.end_minutes <= self.start_minutes
+    
+    def covers(self, local_minutes: int) -> bool:
+        if self.crosses_midnight:
+            return local_minutes >= self.start_minutes or local_minutes < self.end_minutes
+        return self.start_minutes <= local_minutes < self.end_minutes
+    
+    def window_day(self, local: datetime) -> date:
+        """Local date the window holding `local` opened on."""
+        if self.crosses_midnight and local.hour * 60 + local.minute < self.end_minutes:
+            return local.date() - timedelta(days=1)
+        return local.date()
+    
+    def day_start_utc(self, day: date) -> datetime:
+        """Naive UTC start of `day` for the once-a-day limit: local midnight, or
+        the end of the previous night's window for one that crosses midnight."""
+        if not self.crosses_midnight:
+            return local_midnight_utc(day)
+        local = TZ.localize(datetime.combine(day, datetime.min.time()) + timedelta(minutes=self.end_minutes))
+        return local.astimezone(pytz.UTC).replace(tzinfo=None)
+
+
+def _minutes(hhmm: str) -> int:
+    hour, minute = map(int, hhmm.split(":"))
+    return hour * 60 + minute
+
+
+def _local(utc: datetime) -> datetime:
+    return pytz.UTC.localize(utc).astimezone(TZ)
+
+
+def load_rules(db: Session) -> list:
+    """One rule per subscriber with an email and a non-empty preferred window."""
+    prefs = models.UserPreferences
+    rules = []
+    for p in db.query(prefs).filter(prefs.email.isnot(None), prefs.email != "").order_by(prefs.id):
+        if not p.preferred_start_time_local or not p.preferred_end_time_local:
+            continue
+        start, end = _minutes(p.preferred_start_time_local), _minutes(p.preferred_end_time_local)
+        facility_ids = facility_ids_for(db, p.areas_of_interest)
+        if start == end or facility_ids == []:
+            continue  # Empty window, or only facilities we have never seen
+        rule = AlertRule(
+            subscriber_id=p.id,
+            email=p.email,
+            threshold=p.alert_threshold_pct if p.alert_threshold_pct is not None else DEFAULT_THRESHOLD_PCT,
+            start_minutes=start,
+            end_minutes=end,
+            facility_ids=tuple(facility_ids or ()),
+        )
+        if p.last_alert_sent_date:
+            rule.alerted_on = rule.window_day(_local(p.last_alert_sent_date))
+        rules.append(rule)
+    return rules
+
+
+class AlertIndex:
+    """Rules keyed by (facility_id, slot), sorted by threshold for bisecting."""
+    
+    def __init__(self, rules):
+        self.rules = list(rules)
+        buckets = {}
+        for rule in self.rules:
+            if rule.crosses_midnight:
+                # Same split as the recommendations: the evening, then the small hours
+                slots = [*range(rule.start_minutes // SLOT_MINUTES, 24 * 60 // SLOT_MINUTES),
+                         *range(0, (rule.end_minutes - 1) // SLOT_MINUTES + 1)]
+            else:
+                slots = range(rule.start_minutes // SLOT_MINUTES, (rule.end_minutes - 1) // SLOT_MINUTES + 1)
+            for facility_id in rule.facility_ids or (ALL_FACILITIES,):
+                for slot in slots:
+                    buckets.setdefault((facility_id, slot), []).append(rule)
+        # (facility_id, slot) -> (thresholds ascending, rules in the same order)
+        self._slots = {}
+        for key, rules in buckets.items():
+            rules.sort(key=lambda r: r.threshold)
+            self._slots[key] = ([r.threshold for r in rules], rules)
+    
+    def match(self, facility_id: int, pct: int, local_minutes: int):
+        """Rules triggered by a reading of `pct` at `local_minutes` after local midnight."""
+        slot = local_minutes // SLOT_MINUTES
+        for key in ((facility_id, slot), (ALL_FACILITIES, slot)):
+            entry = self._slots.get(key)
+            if entry is None:
+                continue
+            thresholds, rules = entry
+            for rule in rules[bisect.bisect_right(thresholds, pct):]:
+                # Slots are half-hour granular; windows need not be
+                if rule.covers(local_minutes):
+                    yield rule
+
+
+_index = None
+_index_loaded_at = 0.0
+_index_lock = threading.Lock()
+
+
+def alert_index(db: Session) -> AlertIndex:
+    """The cached AlertIndex, rebuilt from `db` when stale."""
+    global _index, _index_loaded_at
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_loaded_at > ALERT_INDEX_TTL_SECONDS:
+            _index = AlertIndex(load_rules(db))
+            _index_loaded_at = time.monotonic()
+        return _index
+
+
+def invalidate_alert_index() -> None:
+    """Drop the cached rules, e.g. after preferences were saved."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _claim(db: Session, claims: dict, wait: bool = False) -> set:
+    """Mark subscribers as alerted unless they already were since their day started; returns the ids marked.
+    
+    `claims` maps subscriber id to (naive UTC start of the day being alerted,
+    timestamp of the triggering reading), which is recorded as the alert
+    time so a late evaluation can't spill into the next window. Rows locked
+    by another transaction are skipped unless `wait`. Does not commit, so
+    the caller can queue the emails in the same transaction.
+    """
+    prefs = models.UserPreferences
+    by_start = {}
+    for subscriber_id, (day_start, _reading_utc) in claims.items():
+        by_start.setdefault(day_start, []).append(subscriber_id)
+    rows = (
+        db.query(prefs)
+        .filter(or_(*(
+            and_(prefs.id.in_(ids), or_(prefs.last_alert_sent_date.is_(None), prefs.last_alert_sent_date < day_start))
+            for day_start, ids in by_start.items()
+        )))
+        .order_by(prefs.id)
+        .with_for_update(skip_locked=not wait)
+        .all()
+    )
+    for row in rows:
+        row.last_alert_sent_date = claims[row.id][1]
+    return {row.id for row in rows}
+
+
+def render_alert(rule: AlertRule, facilities: list) -> str:
+    return ALERT_TEMPLATE.render(
+        facilities=facilities,
+        threshold=rule.threshold,
+        dashboard_url=settings.dashboard_url,
+    )
+
+
+def evaluate_readings(db: Session, readings, transport: EmailTransport = None) -> dict:
+    """Queue and send the alerts triggered by `readings`, (facility_id, timestamp_utc, usage_percentage) rows.
+    
+    When a facility has several readings the first one listed is reported,
+    so pass them newest first. Returns counts for logging.
+    """
+    index = alert_index(db)
+    readings = list(readings)
+    facilities_index = facility_index(db, {facility_id for facility_id, _ts, _pct in readings})
+    hits = {}  # subscriber_id -> (rule, window day, reading time, {facility_id: reading})
+    for facility_id, timestamp_utc, pct in readings:
+        local = _local(timestamp_utc)
+        for rule in index.match(facility_id, pct, local.hour * 60 + local.minute):
+            day = rule.window_day(local)
+            if rule.alerted_on is not None and rule.alerted_on >= day:
+                continue
+            facilities = hits.setdefault(rule.subscriber_id, (rule, day, timestamp_utc, {}))[3]
+            facilities.setdefault(facility_id, {"name": facilities_index.name(facility_id), "usage": pct, "time": local})
+    
+    stats = {"rules": len(index.rules), "matched": len(hits), "queued": 0, "sent": 0, "retrying": 0, "dead": 0}
+    if not hits:
+        return stats
+    if transport is None and (not settings.email_api_key or not settings.email_from):
+        for rule, _day, _ts, facilities in hits.values():
+            print(f"[ALERT] Would send to {rule.email}: {', '.join(f['name'] for f in facilities.values())}")
+        return stats
+    
+    # The claim and the queued emails commit together: an alert is recorded
+    # as sent exactly when it is in the outbox, which retries until delivered.
+    # The first pass skips rows other transactions hold, so the scrape isn't
+    # held up while it has locks of its own; the second claims those after
+    # committing, waiting for the other transaction so its outcome is known.
+    pending = {
+        subscriber_id: (rule.day_start_utc(day), timestamp_utc)
+        for subscriber_id, (rule, day, timestamp_utc, _f) in hits.items()
+    }
+    for wait in (False, True):
+        claimed = _claim(db, pending, wait=wait)
+        messages = [
+            {
+                "from": settings.email_from,
+                "to": [hits[subscriber_id][0].email],
+                "subject": ALERT_SUBJECT,
+                "html": render_alert(hits[subscriber_id][0], list(hits[subscriber_id][3].values())),
+            }
+            for subscriber_id in sorted(claimed)
+        ]
+        stats["queued"] += len(enqueue(db, messages, "alert"))
+        db.commit()
+        pending = {subscriber_id: claim for subscriber_id, claim in pending.items() if subscriber_id not in claimed}
+        if not pending:
+            break
+    for rule, day, _ts, _f in hits.values():
+        # Claimed here or, after the waiting pass, by another process
+        rule.alerted_on = max(rule.alerted_on or day, day)
+    if stats["queued"]:
+        stats.update(deliver_pending(db, transport))
+    return stats
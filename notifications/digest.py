@@ -0,0 +1,177 @@
+"""
+Daily digest for every subscriber, batched.
+
+Each subscriber gets one digest per local day, at their own
+`digest_send_time_local` (else DIGEST_TIME_LOCAL). `run_digest` picks the
+subscribers whose time has passed and who haven't had today's digest, and
+stamps their `digest_sent_on` in the transaction that queues the emails in
+the outbox. It can run as often as needed (the worker checks every
+DIGEST_INTERVAL_SECONDS, cron whenever): restarts, overlapping runs and a
+second scheduler never send the same digest twice.
+
+Subscribers are grouped by their preference fingerprint (the fields that
+decide a recommendation), so recommendations are computed and the digest is
+rendered once per group rather than once per user; in practice a handful of
+groups cover thousands of subscribers. Messages are queued in the outbox and
+delivered through Resend's batch endpoint (up to 100 emails per request) over
+the shared pooled transport, with a bounded number of requests in flight.
+
+`notifications.fake_email.FakeEmailServer` stands in for Resend locally
+(point EMAIL_API_BASE_URL at it); scripts/benchmark_digest.py measures
+throughput against it.
+"""
+from datetime import datetime
+from pathlib import Path
+import pytz
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from analytics.forecast import hourly_outlook
+from analytics.recommendations import get_recommendations, prefs_fingerprint
+from app.facilities import facility_ids_for
+from notifications.outbox import deliver_pending, enqueue
+from notifications.transport import EmailTransport
+
+TZ = pytz.timezone("America/Chicago")
+DIGEST_SUBJECT = "🏋️ Raider Power Zone - Daily Digest"
+DIGEST_FORECAST_HOURS = 18  # from the morning send to around midnight
+
+templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "templates"),
+    autoescape=select_autoescape(["html"]),
+)
+DIGEST_TEMPLATE = templates.get_template("digest.html")
+
+
+def load_subscribers(db: Session) -> list:
+    """Every preferences row with an email address."""
+    prefs = models.UserPreferences
+    return db.query(prefs).filter(prefs.email.isnot(None), prefs.email != "").order_by(prefs.id).all()
+
+
+def normalize_send_time(value: str):
+    """`value` as zero-padded HH:MM ("9:00" -> "09:00"), or None if it isn't a time of day."""
+    try:
+        return datetime.strptime((value or "").strip(), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def _due(now_local: datetime) -> list:
+    """Filters for subscribers whose digest time has passed today and who haven't had today's digest."""
+    prefs = models.UserPreferences
+    send_time = func.coalesce(func.nullif(prefs.digest_send_time_local, ""), settings.digest_time_local)
+    return [
+        prefs.email.isnot(None),
+        prefs.email != "",
+        # Zero-padded HH:MM compares as text; rows saved before times were normalised may lack the pad
+        func.lpad(send_time, 5, "0") <= now_local.strftime("%H:%M"),
+        or_(prefs.digest_sent_on.is_(None), prefs.digest_sent_on < now_local.date()),
+    ]
+
+
+def due_subscribers(db: Session, now_local: datetime = None) -> list:
+    """Subscribers a digest run at `now_local` (default: now) would send to, without claiming them."""
+    prefs = models.UserPreferences
+    return db.query(prefs).filter(*_due(now_local or datetime.now(TZ))).order_by(prefs.id).all()
+
+
+def claim_due_subscribers(db: Session, now_local: datetime = None) -> list:
+    """Stamp today's date on every due subscriber and return them.
+    
+    The UPDATE re-checks the filter on rows another run changed meanwhile,
+    so concurrent runs claim each subscriber once. Does not commit: the
+    caller queues the digests in the same transaction, so a digest is
+    recorded as sent exactly when it is in the outbox.
+    """
+    now_local = now_local or datetime.now(TZ)
+    prefs = models.UserPreferences
+    ids = db.execute(
+        update(prefs)
+        .where(*_due(now_local))
+        .values(digest_sent_on=now_local.date())
+        .returning(prefs.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if not ids:
+        return []
+    return list(db.execute(
+        select(prefs).where(prefs.id.in_(ids)).order_by(prefs.id).execution_options(populate_existing=True)
+    ).scalars())
+
+
+def group_by_fingerprint(subscribers) -> dict:
+    """{fingerprint: [subscriber, ...]}, in first-seen order."""
+    groups = {}
+    for sub in subscribers:
+        groups.setdefault(prefs_fingerprint(sub), []).append(sub)
+    return groups
+
+
+def render_digest(recommendations, workout_duration: int, forecast=()) -> str:
+    return DIGEST_TEMPLATE.render(
+        recommendations=recommendations,
+        workout_duration=workout_duration,
+        forecast=forecast,
+        dashboard_url=settings.dashboard_url,
+    )
+
+
+def digest_forecast(db: Session, subscriber) -> list:
+    """Hourly outlook for the subscriber's facilities; empty if it can't be computed."""
+    try:
+        return hourly_outlook(db, hours=DIGEST_FORECAST_HOURS,
+                              facility_ids=facility_ids_for(db, subscriber.areas_of_interest))
+    except Exception as e:
+        print(f"[DIGEST] Forecast unavailable: {e}")
+        return []
+
+
+def build_digest_messages(db: Session, subscribers) -> tuple:
+    """Resend message dicts for `subscribers`, plus the number of distinct fingerprints.
+    
+    Subscribers in one group share the rendered HTML string (the areas that
+    pick the forecast's facilities are part of the fingerprint).
+    """
+    messages = []
+    groups = group_by_fingerprint(subscribers)
+    for members in groups.values():
+        representative = members[0]
+        html = render_digest(
+            get_recommendations(db, representative),
+            representative.workout_duration_minutes,
+            digest_forecast(db, representative),
+        )
+        messages.extend(
+            {"from": settings.email_from, "to": [sub.email], "subject": DIGEST_SUBJECT, "html": html}
+            for sub in members
+        )
+    return messages, len(groups)
+
+
+def run_digest(db: Session, subscribers=None, transport: EmailTransport = None, now_local: datetime = None) -> dict:
+    """Queue the digest for `subscribers` (default: everyone due, claimed) and deliver it.
+    
+    Returns counts for logging. Without EMAIL_API_KEY / EMAIL_FROM (and no
+    explicit transport) the messages are built but not queued, and nobody
+    is marked as sent.
+    """
+    preview = transport is None and (not settings.email_api_key or not settings.email_from)
+    if subscribers is None:
+        subscribers = due_subscribers(db, now_local) if preview else claim_due_subscribers(db, now_local)
+    messages, groups = build_digest_messages(db, subscribers)
+    stats = {"subscribers": len(messages), "fingerprints": groups, "queued": 0,
+             "sent": 0, "retrying": 0, "dead": 0, "requests": 0}
+    if not messages:
+        db.commit()  # Nothing to send; don't hold the claim's transaction open
+        return stats
+    if preview:
+        print(f"[DIGEST] Would send {len(messages)} digests ({groups} distinct) "
+              f"to {messages[0]['to'][0]}{' and others' if len(messages) > 1 else ''}")
+        return stats
+    stats["queued"] = len(enqueue(db, messages, "digest"))
+    db.commit()
+    stats.update(deliver_pending(db, transport))
+    return stats
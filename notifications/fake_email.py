@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Resend API, for exercising email code offline.
+
+    with FakeEmailServer(latency=0.02) as server:
+        transport = EmailTransport(api_key="test", base_url=server.url)
+        assert transport.send(messages).ok
+        assert len(server.messages) == len(messages)
+
+Serves POST /emails (one message) and POST /emails/batch (a list of up to
+100) with Resend's response shapes, and keeps every accepted message in
+`messages`. `latency` adds a per-request delay to mimic the real API,
+`fail_next(n, status)` makes the next n requests fail, and `reject(address)`
+answers 422 to any request with a message to that address. A request that
+repeats an earlier Idempotency-Key gets the earlier reply and sends
+nothing. It can also run on its own for manual testing:
+
+    python -m notifications.fake_email --port 8025
+    EMAIL_API_BASE_URL=http://127.0.0.1:8025 EMAIL_API_KEY=test EMAIL_FROM=me@example.com python -m cli digest
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BATCH_LIMIT = 100
+
+
+class FakeEmailServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency  # seconds per request
+        self.messages = []
+        self.requests = 0
+        self._failures = []  # status codes for the next requests
+        self._rejected = set()  # recipient addresses answered with 422
+        self._replies = {}  # Idempotency-Key -> (status, body)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def fail_next(self, count: int = 1, status: int = 500) -> None:
+        with self._lock:
+            self._failures.extend([status] * count)
+    
+    def reject(self, address: str) -> None:
+        with self._lock:
+            self._rejected.add(address)
+    
+    def start(self) -> "FakeEmailServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _accept(self, path: str, payload, idempotency_key: str = None):
+        """(status, body) for one request; records accepted messages."""
+        with self._lock:
+            self.requests += 1
+            if idempotency_key in self._replies:
+                return self._replies[idempotency_key]
+            reply = self._reply(path, payload)
+            if idempotency_key and reply[0] < 500:
+                self._replies[idempotency_key] = reply
+            return reply
+    
+    def _reply(self, path: str, payload):
+        if self._failures:
+            return self._failures.pop(0), {"name": "internal_server_error", "message": "Injected failure"}
+        batch = payload if isinstance(payload, list) else [payload] if isinstance(payload, dict) else []
+        rejected = [to for message in batch if isinstance(message, dict)
+                    for to in message.get("to", []) if to in self._rejected]
+        if rejected:
+            return 422, {"name": "validation_error", "message": f"Invalid `to` field: {rejected[0]}"}
+        if path == "/emails" and isinstance(payload, dict):
+            self.messages.append(payload)
+            return 200, {"id": f"fake-{next(self._ids)}"}
+        if path == "/emails/batch" and isinstance(payload, list):
+            if len(payload) > BATCH_LIMIT:
+                return 422, {"name": "validation_error", "message": f"At most {BATCH_LIMIT} emails per batch"}
+            self.messages.extend(payload)
+            return 200, {"data": [{"id": f"fake-{next(self._ids)}"} for _ in payload]}
+        return 404, {"name": "not_found", "message": f"Unknown endpoint {path}"}
+    
+    def _handler_class(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    status, reply = 401, {"name": "missing_api_key", "message": "Missing API key"}
+                else:
+                    try:
+                        payload = json.loads(body or b"null")
+                    except ValueError:
+                        payload = None
+                    if server.latency:
+                        time.sleep(server.latency)
+                    status, reply = server._accept(self.path, payload, self.headers.get("Idempotency-Key"))
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Resend API on localhost.")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay per request.")
+    args = parser.parse_args()
+    server = FakeEmailServer(port=args.port, latency=args.latency)
+    print(f"Fake email API on {server.url} (Ctrl-C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nReceived {len(server.messages)} messages in {server.requests} requests")
+
+
+if __name__ == "__main__":
+    main()
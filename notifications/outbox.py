@@ -0,0 +1,215 @@
+"""
+Durable outbox for outbound email.
+
+Digests and alerts are written to `email_outbox` before anything is sent.
+An alert's row is written in the same transaction that records the alert
+as sent. `deliver_pending` then sends due rows in batches through the
+shared EmailTransport:
+
+- a delivered row is marked `sent`;
+- a row that failed for a transient reason (connection error, 429, 5xx,
+  open circuit) stays `pending` with an exponentially later
+  `next_attempt_at`;
+- a row the API rejected as malformed, or one that used up
+  OUTBOX_MAX_ATTEMPTS, becomes `dead`. The API rejects a whole batch for
+  one bad message, so a rejected batch is resent one message at a time
+  and only the messages rejected on their own are dead-lettered.
+
+Rows are never deleted before they are sent. The worker's `outbox` job
+retries pending rows every OUTBOX_INTERVAL_SECONDS, and
+`python -m cli outbox --retry-dead` puts dead ones back in the queue.
+
+Rows are leased (their `next_attempt_at` is pushed forward) rather than
+locked while a batch is in flight, so no transaction stays open across
+HTTP calls. A worker that dies mid-send leaves rows that become due again
+when the lease expires, so delivery is at least once. Each request
+carries an Idempotency-Key derived from its row ids, so the API drops a
+repeat of a request it already accepted.
+"""
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+from app import models
+from app.config import settings
+from notifications.transport import EmailTransport, SendResult, get_transport
+
+LEASE_SECONDS = 120
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+RESEND_BATCH_LIMIT = 100  # emails per /emails/batch request
+
+
+def enqueue(db: Session, messages: list, kind: str) -> list:
+    """Add Resend message dicts ({"from", "to", "subject", "html"}) to the outbox, one row per recipient.
+    
+    Does not commit; returns the new row ids.
+    """
+    rows = [
+        {
+            "kind": kind,
+            "from_email": message["from"],
+            "to_email": to,
+            "subject": message["subject"],
+            "html": message["html"],
+            "next_attempt_at": datetime.utcnow(),
+        }
+        for message in messages
+        for to in message["to"]
+    ]
+    if not rows:
+        return []
+    return list(db.execute(insert(models.EmailOutbox).returning(models.EmailOutbox.id), rows).scalars())
+
+
+def _lease(db: Session, limit: int) -> list:
+    """Claim up to `limit` due pending rows for LEASE_SECONDS, oldest first, and commit."""
+    outbox = models.EmailOutbox
+    now = datetime.utcnow()
+    due = (
+        select(outbox.id)
+        .where(outbox.status == "pending", outbox.next_attempt_at <= now)
+        .order_by(outbox.next_attempt_at, outbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(outbox)
+        .where(outbox.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=now + timedelta(seconds=LEASE_SECONDS))
+        .returning(outbox.id, outbox.from_email, outbox.to_email, outbox.subject, outbox.html, outbox.attempts)
+    ).all()
+    db.commit()
+    return sorted(rows, key=lambda r: r.id)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def _idempotency_key(rows) -> str:
+    """Stable key for a request carrying exactly these rows."""
+    if len(rows) == 1:
+        return f"outbox-{rows[0].id}"
+    ids = ",".join(str(r.id) for r in rows)
+    return f"outbox-batch-{hashlib.sha256(ids.encode()).hexdigest()[:32]}"
+
+
+def _send_batch(transport: EmailTransport, batch: list) -> list:
+    """Send one batch of leased rows; returns ([(rows, SendResult)], requests made).
+    
+    A batch the API rejects as malformed is resent one message at a time.
+    Unexpected errors come back as a failed result, so the rows are retried.
+    """
+    try:
+        result = transport.send(
+            [{"from": r.from_email, "to": [r.to_email], "subject": r.subject, "html": r.html} for r in batch],
+            idempotency_key=_idempotency_key(batch),
+        )
+    except Exception as e:
+        result = SendResult(ok=False, error=f"{type(e).__name__}: {e}")
+    if result.permanent and len(batch) > 1:
+        print(f"[OUTBOX] Batch of {len(batch)} rejected ({result.error}); sending one at a time")
+        singles = [_send_batch(transport, [row]) for row in batch]
+        return [pair for pairs, _n in singles for pair in pairs], 1 + sum(n for _pairs, n in singles)
+    return [(batch, result)], int(not result.circuit_open)
+
+
+def _outcome(row, result, now: datetime, max_attempts: int, circuit_wait: float, provider_id: str = None) -> dict:
+    """The row update for one message after a send."""
+    if result.ok:
+        return {"id": row.id, "status": "sent", "sent_at": now, "attempts": row.attempts + 1,
+                "last_error": None, "provider_id": provider_id}
+    if result.circuit_open:
+        # Nothing was attempted; wait for the breaker instead of spending an attempt
+        return {"id": row.id, "next_attempt_at": now + timedelta(seconds=circuit_wait), "last_error": result.error}
+    attempts = row.attempts + 1
+    if result.permanent or attempts >= max_attempts:
+        return {"id": row.id, "status": "dead", "attempts": attempts, "last_error": result.error}
+    return {"id": row.id, "attempts": attempts, "next_attempt_at": now + _retry_delay(attempts),
+            "last_error": result.error}
+
+
+def deliver_pending(db: Session, transport: EmailTransport = None, batch_size: int = None,
+                    concurrency: int = None, max_attempts: int = None) -> dict:
+    """Send every due pending row; returns {"sent", "retrying", "dead", "requests"}.
+    
+    Batches go out `concurrency` at a time over the transport's pooled
+    connections. Stops early once the circuit breaker opens.
+    """
+    transport = transport or get_transport()
+    batch_size = min(batch_size or settings.email_batch_size, RESEND_BATCH_LIMIT)
+    concurrency = concurrency or settings.email_concurrency
+    max_attempts = max_attempts or settings.outbox_max_attempts
+    stats = {"sent": 0, "retrying": 0, "dead": 0, "requests": 0}
+    outbox = models.EmailOutbox
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="outbox") as pool:
+        while True:
+            rows = _lease(db, batch_size * concurrency)
+            if not rows:
+                break
+            batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+            sent = []
+            for pairs, requests in pool.map(lambda batch: _send_batch(transport, batch), batches):
+                sent.extend(pairs)
+                stats["requests"] += requests
+            
+            now = datetime.utcnow()
+            circuit_wait = max(RETRY_BASE_SECONDS, transport.breaker.retry_after())
+            updates = []
+            circuit_open = False
+            for batch, result in sent:
+                circuit_open = circuit_open or result.circuit_open
+                if not result.ok:
+                    print(f"[OUTBOX] Batch of {len(batch)} failed: {result.error}")
+                for i, row in enumerate(batch):
+                    update_ = _outcome(row, result, now, max_attempts, circuit_wait,
+                                       result.ids[i] if i < len(result.ids) else None)
+                    updates.append(update_)
+                    status = update_.get("status")
+                    stats["sent" if status == "sent" else "dead" if status == "dead" else "retrying"] += 1
+            db.execute(update(outbox), updates)
+            db.commit()
+            if circuit_open:
+                break
+    return stats
+
+
+def outbox_stats(db: Session) -> dict:
+    """Row counts by status, plus the age of the oldest pending row in seconds."""
+    outbox = models.EmailOutbox
+    counts = dict(db.execute(select(outbox.status, func.count()).group_by(outbox.status)).all())
+    oldest = db.execute(select(func.min(outbox.created_at)).where(outbox.status == "pending")).scalar()
+    return {
+        "pending": counts.get("pending", 0),
+        "sent": counts.get("sent", 0),
+        "dead": counts.get("dead", 0),
+        "oldest_pending_seconds": round((datetime.utcnow() - oldest).total_seconds()) if oldest else None,
+    }
+
+
+def retry_dead(db: Session) -> int:
+    """Put dead rows back in the queue with a fresh attempt count; returns how many. Commits."""
+    outbox = models.EmailOutbox
+    result = db.execute(
+        update(outbox)
+        .where(outbox.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=datetime.utcnow())
+    )
+    db.commit()
+    return result.rowcount
+
+
+def purge_sent(db: Session, keep_days: int) -> int:
+    """Delete rows sent more than `keep_days` ago; returns how many. Commits."""
+    outbox = models.EmailOutbox
+    result = db.execute(
+        outbox.__table__.delete().where(
+            outbox.status == "sent",
+            outbox.sent_at < datetime.utcnow() - timedelta(days=keep_days),
+        )
+    )
+    db.commit()
+    return result.rowcount
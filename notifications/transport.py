@@ -0,0 +1,263 @@
+"""
+Shared HTTP transport for outbound email (Resend).
+
+One httpx.Client per process keeps connections to the API open between
+sends (HTTP/2 when the `h2` package is installed, else HTTP/1.1 keep-alive).
+Each request is retried with exponential backoff and jitter on connection
+errors, 429 and 5xx, honouring Retry-After; other 4xx responses are final.
+A circuit breaker stops calling the API after repeated failures, so during
+an outage each send fails fast instead of waiting out its retries; messages
+stay in the outbox (notifications.outbox) until it closes again. Callers
+pass an Idempotency-Key so retried requests aren't delivered twice.
+
+Request latency and success rate are kept per process in `metrics` and
+reported on /metrics and in the worker's logs.
+"""
+import importlib.util
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+import httpx
+from app.config import settings
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+PERMANENT_STATUSES = {400, 422}  # the message itself is bad; retrying won't help
+LATENCY_SAMPLES = 1000
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    status: int = None  # final HTTP status; None on connection errors or an open circuit
+    error: str = None
+    ids: list = field(default_factory=list)  # provider ids, in message order
+    circuit_open: bool = False
+    
+    @property
+    def permanent(self) -> bool:
+        return self.status in PERMANENT_STATUSES
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+    
+    While open every call is refused. After `reset_seconds` one trial call
+    is let through (half-open): success closes the breaker, failure opens it
+    for another `reset_seconds`.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False  # Open, or half-open with the trial call still in flight
+    
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a trial call through (0 unless open)."""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class EmailMetrics:
+    """Thread-safe counters and recent latencies for sends through one transport."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds per send, retries included
+        self.sends = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.circuit_rejections = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+    
+    def record(self, ok: bool, seconds: float, messages: int) -> None:
+        with self._lock:
+            self.sends += 1
+            self._latencies.append(seconds)
+            if ok:
+                self.succeeded += 1
+                self.messages_sent += messages
+            else:
+                self.failed += 1
+                self.messages_failed += messages
+    
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+    
+    def record_rejection(self, messages: int) -> None:
+        with self._lock:
+            self.circuit_rejections += 1
+            self.messages_failed += messages
+    
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            attempted = self.succeeded + self.failed
+            return {
+                "sends": self.sends,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "retries": self.retries,
+                "circuit_rejections": self.circuit_rejections,
+                "messages_sent": self.messages_sent,
+                "messages_failed": self.messages_failed,
+                "success_rate": round(self.succeeded / attempted, 4) if attempted else None,
+                "latency_ms": {
+                    "p50": round(latencies[len(latencies) // 2] * 1000, 1),
+                    "p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+                    "max": round(latencies[-1] * 1000, 1),
+                } if latencies else None,
+            }
+
+
+class EmailTransport:
+    """Pooled client for Resend's /emails/batch endpoint, with retries and a circuit breaker."""
+    
+    def __init__(self, api_key: str = None, base_url: str = None, concurrency: int = None,
+                 timeout: float = 10.0, max_attempts: int = None, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, breaker: CircuitBreaker = None,
+                 transport: httpx.BaseTransport = None, sleep=time.sleep):
+        concurrency = concurrency or settings.email_concurrency
+        self.max_attempts = max_attempts or settings.email_http_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(settings.email_breaker_failures, settings.email_breaker_reset_seconds)
+        self.metrics = EmailMetrics()
+        self._sleep = sleep
+        self.http2 = HTTP2 and transport is None
+        self.client = httpx.Client(
+            base_url=base_url or settings.email_api_base_url,
+            headers={"Authorization": f"Bearer {api_key or settings.email_api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            http2=self.http2,
+            transport=transport,  # e.g. httpx.MockTransport
+        )
+    
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass  # An HTTP date; fall back to our own backoff
+        delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+        return random.uniform(delay / 2, delay)
+    
+    def send(self, messages: list, idempotency_key: str = None) -> SendResult:
+        """Send up to 100 Resend message dicts in one batch request.
+        
+        Resend delivers a request at most once per `idempotency_key`, so a
+        retry after a timeout can't send the batch twice.
+        """
+        if not self.breaker.allow():
+            self.metrics.record_rejection(len(messages))
+            return SendResult(ok=False, error="circuit open", circuit_open=True)
+        
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        started = time.perf_counter()
+        response = error = None
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    response, error = self.client.post("/emails/batch", json=messages, headers=headers), None
+                except httpx.TransportError as e:
+                    response, error = None, f"{type(e).__name__}: {e}"
+                if response is not None and response.status_code not in RETRY_STATUSES:
+                    break
+                if attempt < self.max_attempts:
+                    self.metrics.record_retry()
+                    self._sleep(self._backoff(attempt, response))
+        finally:
+            # Always settle the breaker, even if something unexpected was raised,
+            # or a half-open breaker would wait for its trial call forever
+            if response is None or response.status_code in RETRY_STATUSES:
+                # The API is down or overloaded
+                self.breaker.record_failure()
+            else:
+                # The API answered, even if it rejected this batch
+                self.breaker.record_success()
+            ok = response is not None and response.is_success
+            self.metrics.record(ok, time.perf_counter() - started, len(messages))
+        
+        if ok:
+            try:
+                ids = [item.get("id") for item in response.json().get("data", [])]
+            except (ValueError, AttributeError):
+                ids = []  # Sent all the same
+            return SendResult(ok=True, status=response.status_code, ids=ids)
+        if response is not None:
+            error = f"{response.status_code} - {response.text[:200]}"
+        return SendResult(ok=False, status=response.status_code if response is not None else None, error=error)
+    
+    def stats(self) -> dict:
+        return {
+            **self.metrics.stats(),
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+            "http2": self.http2,
+        }
+    
+    def close(self) -> None:
+        self.client.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> EmailTransport:
+    """The process-wide transport, created on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = EmailTransport()
+        return _transport
+
+
+def transport_stats():
+    """Stats of the shared transport, or None if this process hasn't sent email."""
+    with _transport_lock:
+        return _transport.stats() if _transport is not None else None
+
+
+def close_transport() -> None:
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+            _transport = None
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Time /ask round-trips against a scripted model, with a cold and a warm tool cache (needs the database)."""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import asyncio
+import statistics
+import time
+from app.agent import ask_async, tool_cache
+from app.fake_llm import ScriptedChat
+
+SCRIPT = [
+    [
+        ("get_current_usage", {}),
+        ("query_gym_data", {"weekday": "Monday"}),
+        ("query_gym_data", {"facility": "Pool", "start_hour": 6, "end_hour": 10}),
+    ],
+    "Scripted answer.",
+]
+
+def timed_asks(runs: int, clear_cache: bool) -> list:
+    timings = []
+    for _ in range(runs):
+        if clear_cache:
+            tool_cache.clear()
+        chat = ScriptedChat(SCRIPT)
+        t0 = time.perf_counter()
+        asyncio.run(ask_async("How busy is it?", chat_factory=lambda: chat, use_cache=False))
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    cold = timed_asks(args.runs, clear_cache=True)
+    tool_cache.clear()
+    timed_asks(1, clear_cache=False)
+    warm = timed_asks(args.runs, clear_cache=False)
+
+    print(f"runs:             {args.runs}")
+    print(f"cold tool cache:  {statistics.median(cold) * 1000:.1f} ms median")
+    print(f"warm tool cache:  {statistics.median(warm) * 1000:.1f} ms median "
+          f"({statistics.median(cold) / statistics.median(warm):.1f}x faster)")
+    print(f"cache stats:      {tool_cache.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Digest throughput for many subscribers: one-email-per-request vs the batched outbox pipeline, against a local fake Resend API (needs the database)."""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+import httpx
+from analytics.recommendations import get_recommendations, recommendation_cache
+from app import models
+from app.db import SessionLocal
+from notifications.digest import DIGEST_SUBJECT, build_digest_messages, render_digest
+from notifications.fake_email import FakeEmailServer
+from notifications.outbox import deliver_pending, enqueue
+from notifications.transport import EmailTransport
+
+def make_subscribers(count: int, fingerprints: int, seed: int = 7) -> list:
+    """`count` preference rows spread over about `fingerprints` distinct combinations."""
+    rng = random.Random(seed)
+    areas = ["Weight Room", "Cardio", "Pool", "Courts"]
+    profiles = [
+        {
+            "preferred_start_time_local": f"{rng.choice([6, 7, 11, 16, 17])}:00",
+            "preferred_end_time_local": f"{rng.choice([19, 20, 21, 22])}:00",
+            "workout_duration_minutes": rng.choice([30, 45, 60, 90]),
+            "crowd_tolerance_pct": rng.choice([50, 70, 100]),
+            "areas_of_interest": rng.sample(areas, rng.randint(0, 2)),
+        }
+        for _ in range(fingerprints)
+    ]
+    return [
+        SimpleNamespace(id=i, email=f"user{i}@example.com", **rng.choice(profiles))
+        for i in range(count)
+    ]
+
+def legacy_digest(db, subscribers, base_url: str) -> int:
+    """The old loop: recommendations, HTML and one POST /emails per subscriber."""
+    sent = 0
+    for sub in subscribers:
+        html = render_digest(get_recommendations(db, sub), sub.workout_duration_minutes)
+        response = httpx.post(
+            f"{base_url}/emails",
+            headers={"Authorization": "Bearer test"},
+            json={"from": "digest@example.com", "to": [sub.email], "subject": DIGEST_SUBJECT, "html": html},
+            timeout=10,
+        )
+        sent += response.status_code == 200
+    return sent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--fingerprints", type=int, default=50)
+    parser.add_argument("--legacy-sample", type=int, default=200,
+                        help="Subscribers sent the old way (extrapolated to the full list).")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake API delay per request.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    subscribers = make_subscribers(args.subscribers, args.fingerprints)
+    db = SessionLocal()
+    try:
+        with FakeEmailServer(latency=args.latency_ms / 1000) as server:
+            recommendation_cache.clear()
+            sample = subscribers[:args.legacy_sample]
+            t0 = time.perf_counter()
+            legacy_sent = legacy_digest(db, sample, server.url)
+            legacy_seconds = time.perf_counter() - t0
+            legacy_requests = server.requests
+
+            recommendation_cache.clear()
+            server.messages.clear()
+            server.requests = 0
+            transport = EmailTransport(api_key="test", base_url=server.url, concurrency=args.concurrency)
+            t0 = time.perf_counter()
+            messages, groups = build_digest_messages(db, subscribers)
+            for message in messages:
+                message["from"] = message["from"] or "digest@example.com"
+            build_seconds = time.perf_counter() - t0
+            enqueue(db, messages, "benchmark")
+            db.commit()
+            queue_seconds = time.perf_counter() - t0 - build_seconds
+            stats = deliver_pending(db, transport, concurrency=args.concurrency)
+            batched_seconds = time.perf_counter() - t0
+            received = len(server.messages)
+            transport.close()
+    finally:
+        db.query(models.EmailOutbox).filter(models.EmailOutbox.kind == "benchmark").delete()
+        db.commit()
+        db.close()
+
+    legacy_rate = legacy_sent / legacy_seconds
+    batched_rate = stats["sent"] / batched_seconds
+    print(f"subscribers:      {args.subscribers} ({groups} distinct fingerprints)")
+    print(f"fake API latency: {args.latency_ms:.0f} ms per request")
+    print(f"one per request:  {legacy_rate:,.0f} emails/s over {legacy_sent} emails, {legacy_requests} requests "
+          f"(~{args.subscribers / legacy_rate:.0f} s for everyone)")
+    print(f"batched outbox:   {batched_rate:,.0f} emails/s, {stats['requests']} requests, "
+          f"{batched_seconds:.2f} s total ({build_seconds:.2f} s building, {queue_seconds:.2f} s queueing) "
+          f"({batched_rate / legacy_rate:.0f}x faster)")
+    print(f"delivered:        {received}/{args.subscribers}, {stats['retrying'] + stats['dead']} not sent")
+
+if __name__ == "__main__":
+    main()
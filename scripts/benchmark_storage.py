@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Compare on-disk sizes of the legacy and compact usage_snapshots layouts on synthetic data (needs Postgres).
+
+Builds each layout in a scratch schema, fills it with the same readings (in
+time order, as the scraper writes them), vacuums, reports heap and index
+sizes, and drops the schema again.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from sqlalchemy import text
+from app.db import engine
+
+SCHEMA = "storage_benchmark"
+
+# Migration 007 layout: surrogate id, INTEGER pct, per-row scrape time and parser string
+LEGACY = """
+    CREATE TABLE {table} (
+        id SERIAL PRIMARY KEY,
+        timestamp_utc timestamp NOT NULL,
+        facility_id smallint NOT NULL,
+        usage_percentage integer NOT NULL,
+        scraped_at_utc timestamp,
+        parser_version varchar
+    );
+    CREATE UNIQUE INDEX ON {table} (facility_id, timestamp_utc) INCLUDE (usage_percentage);
+    CREATE INDEX ON {table} (timestamp_utc);
+"""
+
+# Migration 008 layout
+COMPACT = """
+    CREATE TABLE {table} (
+        timestamp_utc {ts_type} NOT NULL,
+        usage_percentage smallint NOT NULL,
+        facility_id smallint NOT NULL,
+        parser_version_id smallint NOT NULL,
+        PRIMARY KEY (facility_id, timestamp_utc) INCLUDE (usage_percentage)
+    );
+    CREATE INDEX ON {table} USING {time_index} (timestamp_utc);
+"""
+
+LAYOUTS = {
+    "legacy": LEGACY,
+    "compact": COMPACT.format(table="{table}", ts_type="timestamp", time_index="btree"),
+    "compact_timestamptz": COMPACT.format(table="{table}", ts_type="timestamptz", time_index="btree"),
+    "compact_brin": COMPACT.format(table="{table}", ts_type="timestamp", time_index="brin"),
+}
+
+# One reading per facility per interval, ordered by time; pct follows a rough daily curve
+FILL_SQL = """
+    INSERT INTO {table} ({columns})
+    SELECT {values}
+    FROM generate_series(
+        timestamp '2025-01-01', timestamp '2025-01-01' + make_interval(days => :days) - interval '1 minute',
+        make_interval(mins => :interval)
+    ) AS t(ts)
+    CROSS JOIN generate_series(1, :facilities) AS f(id)
+    CROSS JOIN LATERAL (
+        SELECT LEAST(100, GREATEST(0, round(
+            45 + 35 * sin(extract(hour FROM ts) / 24.0 * 2 * pi() - 2) + 10 * random()
+        )))::int AS pct
+    ) p
+    ORDER BY ts, f.id
+"""
+
+FILL_COLUMNS = {
+    "legacy": (
+        "timestamp_utc, facility_id, usage_percentage, scraped_at_utc, parser_version",
+        "ts, f.id, p.pct, ts + interval '17 seconds', '1.0'",
+    ),
+    "compact": (
+        "timestamp_utc, facility_id, usage_percentage, parser_version_id",
+        "ts, f.id, p.pct, 1",
+    ),
+}
+
+
+def _pretty(n: int) -> str:
+    return f"{n / 1024 / 1024:.2f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--facilities", type=int, default=9)
+    parser.add_argument("--interval-minutes", type=int, default=30)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("benchmark_storage requires PostgreSQL")
+
+    params = {"days": args.days, "facilities": args.facilities, "interval": args.interval_minutes}
+    sizes = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        try:
+            for layout, ddl in LAYOUTS.items():
+                table = f"{SCHEMA}.{layout}"
+                for statement in ddl.format(table=table).split(";"):
+                    if statement.strip():
+                        conn.execute(text(statement))
+                columns, values = FILL_COLUMNS["legacy" if layout == "legacy" else "compact"]
+                conn.execute(text(FILL_SQL.format(table=table, columns=columns, values=values)), params)
+                conn.execute(text(f"VACUUM ANALYZE {table}"))
+                sizes[layout] = conn.execute(text(
+                    f"SELECT count(*), pg_relation_size('{table}'), pg_indexes_size('{table}'), "
+                    f"pg_total_relation_size('{table}') FROM {table}"
+                )).one()
+        finally:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    rows = sizes["legacy"][0]
+    print(f"rows: {rows:,} ({args.days} days x {args.facilities} facilities, every {args.interval_minutes} min)")
+    print(f"{'layout':<22}{'table':>12}{'indexes':>12}{'total':>12}{'bytes/row':>11}")
+    for layout, (_count, heap, indexes, total) in sizes.items():
+        print(f"{layout:<22}{_pretty(heap):>12}{_pretty(indexes):>12}{_pretty(total):>12}{total / rows:>11.1f}")
+    legacy_total = sizes["legacy"][3]
+    for layout in ("compact", "compact_brin"):
+        print(f"{layout}: {legacy_total / sizes[layout][3]:.1f}x smaller than legacy in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,62 +6,69 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from datetime import datetime, timedelta
 from app.db import SessionLocal
-from app import models
 from app.constants import TTU_FACILITIES
-import random
+from ingestion.bulk import load_rows
+import numpy as np
 
-def generate_sample_data():
-    """Generate sample data with busy periods 4pm-8pm Mon-Fri."""
-    db = SessionLocal()
-    
-    # Use TTU Recreation Center facilities
-    facilities = TTU_FACILITIES
-    
-    # Generate data for the last 14 days
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=14)
+PARSER_VERSION = "sample_data_1.0"
+SLOT = np.timedelta64(30, "m")
+
+def facility_names(count: int = None):
+    """TTU facilities first, then numbered synthetic ones for load testing."""
+    if count is None:
+        return list(TTU_FACILITIES)
+    names = list(TTU_FACILITIES[:count])
+    names += [f"Facility {i + 1}" for i in range(len(names), count)]
+    return names
+
+def synthetic_batches(start: datetime, end: datetime, facilities, seed: int = None, batch_rows: int = 200_000):
+    """Yield batches of (timestamp_utc, location_name, usage_percentage) rows.
     
-    # Generate snapshots every 30 minutes
-    current = start_date
-    snapshots_created = 0
+    Every 30-minute slot in [start, end] gets one reading per facility; each batch
+    is generated with array ops rather than a Python loop per row.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(facilities, dtype=object)
+    slots = np.arange(np.datetime64(start, "m"), np.datetime64(end, "m") + 1, SLOT)
+    slots_per_batch = max(1, batch_rows // len(names))
     
-    while current <= end_date:
-        weekday = current.weekday()  # 0=Monday, 6=Sunday
-        hour = current.hour
+    for i in range(0, len(slots), slots_per_batch):
+        chunk = slots[i:i + slots_per_batch]
+        times = np.repeat(chunk, len(names))
+        locations = np.tile(names, len(chunk))
         
-        for facility in facilities:
-            # Busy between 4pm (16) and 8pm (20) on weekdays (Mon-Fri, 0-4)
-            if weekday < 5 and 16 <= hour < 20:
-                # Busy: 60-90% usage
-                usage = random.randint(60, 90)
-            else:
-                # Random: 10-50% usage
-                usage = random.randint(10, 50)
-            
-            # Check if snapshot already exists (avoid duplicates)
-            existing = db.query(models.UsageSnapshot).filter(
-                models.UsageSnapshot.location_name == facility,
-                models.UsageSnapshot.timestamp_utc == current.replace(second=0, microsecond=0)
-            ).first()
-            
-            if not existing:
-                snapshot = models.UsageSnapshot(
-                    timestamp_utc=current.replace(second=0, microsecond=0),
-                    location_name=facility,
-                    usage_percentage=usage,
-                    scraped_at_utc=current,
-                    parser_version="sample_data_1.0"
-                )
-                db.add(snapshot)
-                snapshots_created += 1
+        minutes = times.astype("int64")
+        weekday = (minutes // 1440 + 3) % 7  # 1970-01-01 was a Thursday; 0=Monday
+        hour = (minutes // 60) % 24
         
-        # Move to next 30-minute interval
-        current += timedelta(minutes=30)
+        # Busy between 4pm (16) and 8pm (20) on weekdays (Mon-Fri, 0-4): 60-90% usage,
+        # otherwise random 10-50% usage
+        busy = (weekday < 5) & (hour >= 16) & (hour < 20)
+        usage = np.where(busy, rng.integers(60, 91, len(times)), rng.integers(10, 51, len(times)))
+        
+        yield zip(np.datetime_as_string(times, unit="m"), locations, usage)
+
+def generate_sample_data(days: int = 14, start: datetime = None, end: datetime = None,
+                         facility_count: int = None, seed: int = None):
+    """Generate sample data with busy periods 4pm-8pm Mon-Fri.
     
+    Defaults to the last 14 days for the TTU facilities. Pass an explicit
+    start/end and facility_count to bulk-load larger synthetic histories.
+    """
+    facilities = facility_names(facility_count)
+    end_date = (end or datetime.utcnow()).replace(second=0, microsecond=0)
+    start_date = start or end_date - timedelta(days=days)
+    
+    db = SessionLocal()
     try:
+        started = datetime.utcnow()
+        snapshots_created = load_rows(
+            db, synthetic_batches(start_date, end_date, facilities, seed=seed), PARSER_VERSION
+        )
         db.commit()
-        print(f"✅ Created {snapshots_created} sample snapshots")
-        print(f"   Facilities: {', '.join(facilities)}")
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        print(f"✅ Created {snapshots_created} sample snapshots in {elapsed:.1f}s")
+        print(f"   Facilities: {', '.join(facilities) if len(facilities) <= 12 else f'{len(facilities)} facilities'}")
         print(f"   Date range: {start_date.date()} to {end_date.date()}")
         print(f"   Busy periods: 4pm-8pm Mon-Fri (60-90% usage)")
         print(f"   Other times: Random 10-50% usage")
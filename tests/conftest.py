@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def db():
+    """Session on DATABASE_URL inside a transaction that is rolled back afterwards.
+    
+    Needs a Postgres database migrated to head; the test is skipped otherwise.
+    """
+    from app.db import engine
+    from app.facilities import invalidate_facilities
+    try:
+        connection = engine.connect()
+    except OperationalError:
+        pytest.skip("DATABASE_URL is not reachable")
+    if connection.dialect.name != "postgresql" or not inspect(connection).has_table("usage_stats"):
+        connection.close()
+        pytest.skip("DATABASE_URL is not a migrated Postgres database")
+    connection.rollback()  # the inspection autobegan a transaction
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    invalidate_facilities()
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+        invalidate_facilities()
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import pytest
+from analytics.cache import LRUCache
+from app import agent
+from app.answer_cache import AnswerCache
+from app.fake_llm import ScriptedChat
+
+
+class _Session:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    """Fake tools, recording every call, and fresh caches; no database needed."""
+    calls = []
+    
+    def fake(name):
+        def tool(db, **kwargs):
+            calls.append((name, kwargs))
+            return {"tool": name}
+        return tool
+    
+    for name in ("get_current_usage", "get_best_times", "get_forecast", "query_gym_data"):
+        monkeypatch.setattr(agent, name, fake(name))
+    monkeypatch.setattr(agent, "SessionLocal", _Session)
+    monkeypatch.setattr(agent, "get_data_version", lambda db: (1, 0))
+    monkeypatch.setattr(agent, "_current_data_version", lambda: (1, 0))
+    monkeypatch.setattr(agent, "tool_cache", LRUCache(maxsize=16, name="test_tools"))
+    monkeypatch.setattr(agent, "answer_cache", AnswerCache(maxsize=16, matcher=None))
+    return calls
+
+
+def _run_loop(chat) -> str:
+    return asyncio.run(agent._react_loop(chat, "When is it quiet?", "test", threading.Event()))
+
+
+def test_tool_calls_are_dispatched_and_answered_in_order(tools):
+    chat = ScriptedChat([
+        [("query_gym_data", {"weekday": "Monday", "limit": 5.0}), ("get_forecast", {"hours": 12})],
+        [("no_such_tool", {})],
+        "Mondays are quietest before 8am.",
+    ])
+    
+    assert _run_loop(chat) == "Mondays are quietest before 8am."
+    assert sorted(tools) == [
+        ("get_forecast", {"facility": None, "hours": 12}),
+        ("query_gym_data", {"facility": None, "weekday": "Monday", "start_hour": None,
+                            "end_hour": None, "lookback_days": None, "limit": 5}),
+    ]
+    assert chat.sent[1] == [
+        {"name": "query_gym_data", "response": {"result": {"tool": "query_gym_data"}}},
+        {"name": "get_forecast", "response": {"result": {"tool": "get_forecast"}}},
+    ]
+    assert chat.sent[2] == [{"name": "no_such_tool", "response": {"result": {"error": "Unknown tool: no_such_tool"}}}]
+
+
+def test_repeated_data_tool_call_is_served_from_the_tool_cache(tools):
+    chat = ScriptedChat([
+        [("get_current_usage", {"facility": "Pool"})],
+        [("get_current_usage", {"facility": " pool "})],
+        "Quiet.",
+    ])
+    
+    assert _run_loop(chat) == "Quiet."
+    assert tools == [("get_current_usage", {"facility": "Pool"})]
+    assert chat.sent[1] == chat.sent[2]
+
+
+def test_loop_gives_up_after_max_steps(tools):
+    chat = ScriptedChat([[("get_best_times", {})]] * agent.MAX_STEPS)
+    
+    assert _run_loop(chat) == agent.MAX_STEPS_ANSWER
+    assert len(tools) == agent.MAX_STEPS
+
+
+def test_timeout_answers_and_skips_pending_tools(tools):
+    chat = ScriptedChat([[("get_current_usage", {})], "Quiet."], delay=0.3)
+    
+    answer = asyncio.run(agent.ask_async("How busy is it?", chat_factory=lambda: chat, timeout=0.1))
+    
+    assert answer == "The assistant took too long to answer. Please try again."
+    assert tools == []
+    assert agent.answer_cache.get("How busy is it?", (1, 0)) is None
+
+
+def test_answer_cache_hit_skips_the_model_and_new_data_misses(tools, monkeypatch):
+    chats = []
+    
+    def factory():
+        chats.append(ScriptedChat([[("get_current_usage", {})], f"Answer {len(chats) + 1}"]))
+        return chats[-1]
+    
+    def ask():
+        return asyncio.run(agent.ask_async("How busy is it?", chat_factory=factory))
+    
+    first, second = ask(), ask()
+    monkeypatch.setattr(agent, "_current_data_version", lambda: (2, 0))
+    monkeypatch.setattr(agent, "get_data_version", lambda db: (2, 0))
+    third = ask()
+    
+    assert (first, second, third) == ("Answer 1", "Answer 1", "Answer 2")
+    assert len(chats) == 2
+    assert len(tools) == 2
+
+
+def test_no_answer_is_not_cached(tools):
+    chats = []
+    
+    def factory():
+        chats.append(ScriptedChat([]))
+        return chats[-1]
+    
+    for _ in range(2):
+        assert asyncio.run(agent.ask_async("How busy is it?", chat_factory=factory)) == agent.NO_ANSWER
+    assert len(chats) == 2
@@ -0,0 +1,65 @@
+import threading
+from datetime import date, datetime
+import pytz
+from sqlalchemy import text
+from app import models
+from notifications import alerts
+from notifications.alerts import TZ, AlertIndex, AlertRule, _claim, evaluate_readings
+from notifications.fake_email import FakeEmailServer
+from notifications.transport import EmailTransport
+
+NIGHT = AlertRule(subscriber_id=1, email="owl@example.com", threshold=30,
+                  start_minutes=22 * 60, end_minutes=2 * 60, facility_ids=())
+
+
+def _utc(local: datetime) -> datetime:
+    return TZ.localize(local).astimezone(pytz.UTC).replace(tzinfo=None)
+
+
+def test_window_across_midnight_matches_both_sides():
+    index = AlertIndex([NIGHT])
+    
+    assert list(index.match(7, 10, 23 * 60 + 30)) == [NIGHT]
+    assert list(index.match(7, 10, 1 * 60 + 15)) == [NIGHT]
+    assert list(index.match(7, 10, 3 * 60)) == []
+    assert list(index.match(7, 10, 21 * 60 + 59)) == []
+
+
+def test_small_hours_belong_to_the_day_the_window_opened():
+    assert NIGHT.window_day(datetime(2026, 10, 17, 23, 30)) == date(2026, 10, 17)
+    assert NIGHT.window_day(datetime(2026, 10, 18, 1, 30)) == date(2026, 10, 17)
+    assert NIGHT.day_start_utc(date(2026, 10, 17)) == _utc(datetime(2026, 10, 17, 2, 0))
+
+
+def test_night_window_alerts_once_across_midnight(db):
+    facility_id = db.query(models.Facility.id).order_by(models.Facility.id).first()[0]
+    db.add(models.UserPreferences(id=1001, email="owl@example.com", preferred_start_time_local="22:00",
+                                  preferred_end_time_local="02:00", areas_of_interest=[], alert_threshold_pct=30))
+    db.flush()
+    alerts.invalidate_alert_index()
+    try:
+        with FakeEmailServer() as server:
+            transport = EmailTransport(api_key="test", base_url=server.url, max_attempts=1)
+            evening = evaluate_readings(db, [(facility_id, _utc(datetime(2026, 10, 16, 23, 30)), 5)], transport)
+            small_hours = evaluate_readings(db, [(facility_id, _utc(datetime(2026, 10, 17, 1, 0)), 5)], transport)
+            next_night = evaluate_readings(db, [(facility_id, _utc(datetime(2026, 10, 17, 22, 30)), 5)], transport)
+    finally:
+        alerts.invalidate_alert_index()
+    
+    assert evening["queued"] == 1
+    assert small_hours["queued"] == 0
+    assert next_night["queued"] == 1
+    assert [m["to"] for m in server.messages] == [["owl@example.com"], ["owl@example.com"]]
+
+
+def test_claim_skips_locked_rows_then_waits_for_them(db):
+    from app.db import engine
+    other = engine.connect()
+    other.execute(text("SELECT id FROM user_preferences WHERE id = 1 FOR UPDATE"))
+    claims = {1: (datetime(2100, 1, 1), datetime.utcnow())}
+    try:
+        assert _claim(db, claims) == set()
+        threading.Timer(0.2, other.commit).start()
+        assert _claim(db, claims, wait=True) == {1}
+    finally:
+        other.close()
@@ -0,0 +1,45 @@
+import pytest
+from app.answer_cache import AnswerCache, TokenSetMatcher
+
+VERSION = "2026-10-17T12:00"
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(maxsize=16, matcher=TokenSetMatcher(0.8))
+
+
+def test_paraphrase_reuses_answer(cache):
+    cache.set("How busy is it now?", VERSION, "Quiet")
+    assert cache.get("how busy is it right now", VERSION) == "Quiet"
+    assert cache.similar_hits == 1
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("How busy is the Raider Power Zone on Monday between 5 and 7 pm?",
+     "How busy is the Raider Power Zone on Tuesday between 5 and 7 pm?"),
+    ("How busy is the Raider Power Zone on Monday between 5 and 7 pm?",
+     "How busy is the Raider Power Zone on Monday between 6 and 7 pm?"),
+    ("How busy is the Free Weight Room on Monday evening?",
+     "How busy is the Machine Weight Room on Monday evening?"),
+    ("How busy is it on Mondays in the evening?",
+     "How busy is it on Mondays in the morning?"),
+    ("How busy is the gym tomorrow?",
+     "How busy is the gym today?"),
+])
+def test_near_miss_with_different_parameters_misses(cache, cached, asked):
+    cache.set(cached, VERSION, "cached answer")
+    assert cache.get(asked, VERSION) is None
+    assert cache.similar_hits == 0
+
+
+def test_answers_are_scoped_to_the_data_version(cache):
+    cache.set("How busy is it now?", VERSION, "Quiet")
+    assert cache.get("How busy is it now?", "2026-10-17T12:30") is None
+
+
+def test_exact_only_cache_ignores_paraphrases():
+    cache = AnswerCache(maxsize=16, matcher=None)
+    cache.set("How busy is it now?", VERSION, "Quiet")
+    assert cache.get("how busy is it now", VERSION) == "Quiet"
+    assert cache.get("how busy is it right now", VERSION) is None
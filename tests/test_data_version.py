@@ -0,0 +1,80 @@
+from datetime import datetime
+import pytest
+from analytics import usage_stats as usage_stats_module
+from analytics.recommendations import get_data_version
+from analytics.rollups import backfill_rollups
+from analytics.snapshots import data_version
+from analytics.usage_stats import rebuild_usage_stats, usage_stats, usage_stats_info
+from app import models
+from ingestion.bulk import import_file, load_rows
+from ingestion import storage
+from ingestion.storage import insert_snapshots
+
+
+@pytest.fixture(autouse=True)
+def fresh_parser_versions(monkeypatch):
+    # Ids cached by an earlier test were rolled back with it
+    monkeypatch.setattr(storage, "_parser_version_ids", {})
+
+
+def _facility_name(db) -> str:
+    return db.query(models.Facility.name).order_by(models.Facility.id).first()[0]
+
+
+def test_scrape_moves_the_version_but_not_history(db):
+    version, history = data_version(db)
+    insert_snapshots(db, [{"name": _facility_name(db), "usage": 42}], datetime(2030, 1, 7, 15), "test")
+    
+    assert data_version(db) == (version + 1, history)
+    assert get_data_version(db) == data_version(db)
+
+
+def test_repeated_scrape_of_the_same_minute_keeps_the_version(db):
+    locations = [{"name": _facility_name(db), "usage": 42}]
+    insert_snapshots(db, locations, datetime(2030, 1, 7, 15), "test")
+    before = data_version(db)
+    insert_snapshots(db, locations, datetime(2030, 1, 7, 15), "test")
+    
+    assert data_version(db) == before
+
+
+def test_bulk_import_and_rebuilds_rewrite_history(db):
+    version, history = data_version(db)
+    load_rows(db, [[(datetime(2030, 1, 7, 15), _facility_name(db), 42)]], "test")
+    assert data_version(db) == (version + 1, history + 1)
+    
+    backfill_rollups(db, days=1)
+    assert data_version(db) == (version + 2, history + 2)
+    
+    rebuild_usage_stats(db)
+    assert data_version(db) == (version + 3, history + 3)
+
+
+def test_file_import_rewrites_history(db, tmp_path):
+    path = tmp_path / "archive.csv"
+    path.write_text(f"timestamp_utc,location_name,usage_percentage\n2030-01-07 15:00,{_facility_name(db)},42\n")
+    version, history = data_version(db)
+    
+    assert import_file(db, str(path), "test") == 1
+    assert data_version(db) == (version + 1, history + 1)
+    assert import_file(db, str(path), "test") == 0
+    assert data_version(db) == (version + 1, history + 1)
+
+
+def test_rewritten_history_reloads_the_usage_stats(db):
+    usage_stats_module.invalidate_usage_stats()
+    try:
+        usage_stats(db)
+        insert_snapshots(db, [{"name": _facility_name(db), "usage": 42}], datetime(2030, 1, 7, 15), "test")
+        before = usage_stats_info()
+        usage_stats(db)
+        after_scrape = usage_stats_info()
+        rebuild_usage_stats(db)
+        usage_stats(db)
+        after_rebuild = usage_stats_info()
+    finally:
+        usage_stats_module.invalidate_usage_stats()
+    
+    assert after_scrape["refreshes"] == before["refreshes"] + 1
+    assert after_scrape["full_loads"] == before["full_loads"]
+    assert after_rebuild["full_loads"] == before["full_loads"] + 1
@@ -0,0 +1,145 @@
+from datetime import datetime
+from app import models
+from notifications import digest
+from notifications.digest import (DIGEST_SUBJECT, TZ, claim_due_subscribers, group_by_fingerprint,
+                                  normalize_send_time, render_digest, run_digest)
+from notifications.fake_email import FakeEmailServer
+from notifications.transport import EmailTransport
+
+
+def _local(*args) -> datetime:
+    return TZ.localize(datetime(*args))
+
+
+def _subscribe(db, id_: int, email: str, digest_time: str = None, **prefs) -> None:
+    db.add(models.UserPreferences(id=id_, email=email, digest_send_time_local=digest_time, **{
+        "preferred_start_time_local": "06:00", "preferred_end_time_local": "22:00", "areas_of_interest": [],
+        **prefs,
+    }))
+    db.flush()
+
+
+def _prefs(email: str, **prefs) -> models.UserPreferences:
+    return models.UserPreferences(email=email, **{
+        "preferred_start_time_local": "06:00", "preferred_end_time_local": "22:00", "workout_duration_minutes": 60,
+        "crowd_tolerance_pct": 50, "areas_of_interest": ["Pool", "Indoor Track"], **prefs,
+    })
+
+
+def test_subscribers_with_the_same_preferences_share_a_group():
+    a = _prefs("a@example.com")
+    b = _prefs("b@example.com", areas_of_interest=["Indoor Track", "Pool"], digest_send_time_local="09:00")
+    c = _prefs("c@example.com", workout_duration_minutes=90)
+    d = _prefs("d@example.com", areas_of_interest=["Pool"])
+    
+    groups = group_by_fingerprint([c, a, d, b])
+    
+    assert list(groups.values()) == [[c], [a, b], [d]]
+
+
+def test_digest_template_lists_recommendations_and_forecast(monkeypatch):
+    monkeypatch.setattr("app.config.settings.dashboard_url", "https://gym.example.com/")
+    html = render_digest(
+        [("6:00 AM - 7:00 AM", 12.345), ("<b>9:00 PM</b> - 10:00 PM", 20)],
+        45,
+        [(datetime(2026, 10, 17, 6, 0), 12.6)],
+    )
+    
+    assert "Recommended Times (45 minutes)" in html
+    assert "<li><strong>6:00 AM - 7:00 AM</strong> - 12.3% average usage</li>" in html
+    assert "&lt;b&gt;9:00 PM&lt;/b&gt; - 10:00 PM" in html
+    assert "Sat 06:00 AM" in html and ">13%<" in html
+    assert 'href="https://gym.example.com/"' in html
+    
+    empty = render_digest([], 60)
+    assert "No recommendations available at this time." in empty
+    assert "Today's Forecast" not in empty
+
+
+def test_one_render_per_group_and_one_email_per_subscriber(db, monkeypatch):
+    monkeypatch.setattr("app.config.settings.email_from", "gym@example.com")
+    computed = []
+    
+    def fake_recommendations(db, prefs):
+        computed.append(prefs.email)
+        return [(f"{prefs.workout_duration_minutes}-minute slot", 10.0)]
+    
+    monkeypatch.setattr(digest, "get_recommendations", fake_recommendations)
+    monkeypatch.setattr(digest, "digest_forecast", lambda db, subscriber: [])
+    _subscribe(db, 2001, "a@example.com", "06:00")
+    _subscribe(db, 2002, "b@example.com", "06:00")
+    _subscribe(db, 2003, "c@example.com", "06:00", workout_duration_minutes=90)
+    
+    with FakeEmailServer() as server:
+        transport = EmailTransport(api_key="test", base_url=server.url, max_attempts=1)
+        stats = run_digest(db, transport=transport, now_local=_local(2026, 10, 17, 7, 0))
+    
+    assert computed == ["a@example.com", "c@example.com"]
+    assert stats["fingerprints"] == 2 and stats["queued"] == 3 and stats["sent"] == 3
+    by_recipient = {tuple(m["to"]): m for m in server.messages}
+    assert sorted(by_recipient) == [("a@example.com",), ("b@example.com",), ("c@example.com",)]
+    assert by_recipient[("a@example.com",)]["html"] == by_recipient[("b@example.com",)]["html"]
+    assert "90-minute slot" in by_recipient[("c@example.com",)]["html"]
+    assert all(m["subject"] == DIGEST_SUBJECT and m["from"] == "gym@example.com" for m in server.messages)
+    outbox = (
+        db.query(models.EmailOutbox.to_email, models.EmailOutbox.status)
+        .filter(models.EmailOutbox.kind == "digest", models.EmailOutbox.to_email.like("%@example.com"))
+        .order_by(models.EmailOutbox.to_email).all()
+    )
+    assert outbox == [("a@example.com", "sent"), ("b@example.com", "sent"), ("c@example.com", "sent")]
+
+
+def test_each_subscriber_is_due_from_their_own_time(db, monkeypatch):
+    monkeypatch.setattr("app.config.settings.digest_time_local", "07:00")
+    _subscribe(db, 2001, "early@example.com", "06:00")
+    _subscribe(db, 2002, "late@example.com", "09:00")
+    _subscribe(db, 2003, "default@example.com", None)
+    
+    at_eight = [s.email for s in claim_due_subscribers(db, _local(2026, 10, 17, 8, 0))]
+    at_ten = [s.email for s in claim_due_subscribers(db, _local(2026, 10, 17, 10, 0))]
+    again = claim_due_subscribers(db, _local(2026, 10, 17, 23, 0))
+    next_day = [s.email for s in claim_due_subscribers(db, _local(2026, 10, 18, 9, 30))]
+    
+    assert at_eight == ["early@example.com", "default@example.com"]
+    assert at_ten == ["late@example.com"]
+    assert again == []
+    assert next_day == ["early@example.com", "late@example.com", "default@example.com"]
+
+
+def test_rerun_after_a_send_does_not_duplicate(db):
+    _subscribe(db, 2001, "a@example.com", "06:00")
+    with FakeEmailServer() as server:
+        transport = EmailTransport(api_key="test", base_url=server.url, max_attempts=1)
+        first = run_digest(db, transport=transport, now_local=_local(2026, 10, 17, 6, 5))
+        second = run_digest(db, transport=transport, now_local=_local(2026, 10, 17, 6, 10))
+    
+    assert first["queued"] == 1 and first["sent"] == 1
+    assert second["subscribers"] == 0
+    assert [m["to"] for m in server.messages] == [["a@example.com"]]
+    assert db.get(models.UserPreferences, 2001).digest_sent_on.isoformat() == "2026-10-17"
+
+
+def test_preview_without_email_settings_claims_nobody(db, monkeypatch):
+    monkeypatch.setattr("app.config.settings.email_api_key", "")
+    _subscribe(db, 2001, "a@example.com", "06:00")
+    
+    stats = run_digest(db, now_local=_local(2026, 10, 17, 7, 0))
+    
+    assert stats["subscribers"] == 1 and stats["queued"] == 0
+    assert db.get(models.UserPreferences, 2001).digest_sent_on is None
+
+
+def test_send_times_are_stored_zero_padded():
+    assert normalize_send_time("9:00") == "09:00"
+    assert normalize_send_time(" 18:30 ") == "18:30"
+    assert normalize_send_time("25:00") is None
+    assert normalize_send_time("") is None
+
+
+def test_unpadded_send_time_is_due_on_time(db):
+    _subscribe(db, 2001, "nine@example.com", "9:00")
+    _subscribe(db, 2002, "ten@example.com", "10:00")
+    
+    assert claim_due_subscribers(db, _local(2026, 10, 17, 8, 59)) == []
+    assert [s.email for s in claim_due_subscribers(db, _local(2026, 10, 17, 9, 30))] == ["nine@example.com"]
+    assert [s.email for s in claim_due_subscribers(db, _local(2026, 10, 17, 10, 0))] == ["ten@example.com"]
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+import pytest
+from app import facilities
+from app.facilities import facility_index, get_or_create_facility_id, invalidate_facilities
+
+
+class FakeSession:
+    """Answers facility_index's one query from a mutable list of rows."""
+    
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+    
+    def query(self, _model):
+        self.loads += 1
+        return SimpleNamespace(all=lambda: list(self.rows))
+
+
+def row(id, name):
+    return SimpleNamespace(id=id, name=name, aliases=[], display_order=id)
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(facilities, "MISS_RELOAD_SECONDS", 0)
+    invalidate_facilities()
+    yield
+    invalidate_facilities()
+
+
+def test_unknown_id_reloads_the_index():
+    db = FakeSession([row(1, "Pool")])
+    assert facility_index(db).name(1) == "Pool"
+    db.rows.append(row(2, "Climbing Wall"))  # added by another process
+    assert facility_index(db).names.get(2) is None  # within the TTL, no ids asked for
+    assert facility_index(db, {2}).name(2) == "Climbing Wall"
+    assert db.loads == 2
+
+
+def test_id_still_unknown_after_reload_gets_a_placeholder():
+    db = FakeSession([row(1, "Pool")])
+    index = facility_index(db, {7})
+    assert index.name(7) == "Facility 7"
+    assert index.names_by_id([7])[7] == "Facility 7"
+
+
+def test_new_facility_invalidates_only_when_the_transaction_ends(db):
+    loaded = facility_index(db)
+    facility_id = get_or_create_facility_id(db, "Rolled Back Test Facility")
+    assert facilities._index is loaded  # not dropped before commit
+    db.rollback()
+    assert facilities._index is None
+    assert "rolled back test facility" not in facility_index(db).ids
+    assert facility_index(db, {facility_id}).name(facility_id) == f"Facility {facility_id}"
+
+
+def test_new_facility_is_visible_after_commit(db):
+    facility_index(db)
+    facility_id = get_or_create_facility_id(db, "Committed Test Facility")
+    db.commit()
+    assert facilities._index is None
+    assert facility_index(db).name(facility_id) == "Committed Test Facility"
@@ -0,0 +1,58 @@
+from datetime import date, datetime
+import numpy as np
+import pytest
+import pytz
+from analytics import forecast
+from analytics.forecast import SEASON, TZ_NAME, fitted_state, load_slot_matrix, slot_of
+from analytics.snapshots import bump_data_version
+from app import models
+from app.facilities import invalidate_facilities
+
+
+@pytest.fixture
+def facility_id(db):
+    """A facility of its own, so the rollups below are all it has."""
+    db.add(models.Facility(id=999, name="Forecast Test Facility", display_order=999))
+    db.flush()
+    invalidate_facilities()
+    forecast.invalidate_forecasts()
+    yield 999
+    forecast.invalidate_forecasts()
+
+
+def _rollup(db, facility_id: int, day: date, bucket: int, pct: int) -> None:
+    db.add(models.UsageRollup(facility_id=facility_id, local_date=day, bucket=bucket, weekday=day.weekday(),
+                              usage_sum=pct, sample_count=1, usage_min=pct, usage_max=pct))
+    db.flush()
+
+
+def test_folded_days_are_read_from_the_rollups(db, facility_id):
+    recent, old = date(2030, 1, 7), date(2020, 1, 6)
+    _rollup(db, facility_id, recent, 12, 40)  # only even buckets: folded, whatever the settings say
+    for bucket, pct in ((12, 40), (13, 60), (14, 50)):  # an odd bucket: still half-hourly
+        _rollup(db, facility_id, old, bucket, pct)
+    
+    def day(d):
+        first = slot_of(d, 0)
+        return load_slot_matrix(db, first, first + 48, [facility_id])[0]
+    
+    assert list(day(recent)[12:14]) == [40, 40]
+    assert list(day(old)[12:14]) == [40, 60]
+    assert day(old)[14] == 50 and np.isnan(day(old)[15])
+
+
+def test_late_readings_in_fed_slots_are_picked_up(db, facility_id):
+    now = pytz.timezone(TZ_NAME).localize(datetime(2030, 1, 7, 8, 10))
+    day = date(2030, 1, 7)
+    _rollup(db, facility_id, day, 13, 35)
+    _rollup(db, facility_id, day, 14, 40)
+    row = fitted_state(db, now).facility_ids.index(facility_id)
+    assert np.isnan(forecast._state.naive[row, slot_of(day, 15) % SEASON])
+    
+    # 07:30-08:00 was fed in as empty; a scrape from 07:55 commits after that
+    _rollup(db, facility_id, day, 15, 60)
+    bump_data_version(db)
+    state = fitted_state(db, now)
+    
+    assert state.naive[row, slot_of(day, 15) % SEASON] == 60
+    assert state.naive[row, slot_of(day, 14) % SEASON] == 40
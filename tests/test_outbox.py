@@ -0,0 +1,74 @@
+import httpx
+import pytest
+from app import models
+from notifications.fake_email import FakeEmailServer
+from notifications.outbox import deliver_pending, enqueue
+from notifications.transport import CircuitBreaker, EmailTransport
+
+
+def _message(to: str) -> dict:
+    return {"from": "gym@example.com", "to": [to], "subject": "Hello", "html": "<p>Hi</p>"}
+
+
+def _transport(server: FakeEmailServer) -> EmailTransport:
+    return EmailTransport(api_key="test", base_url=server.url, concurrency=1, max_attempts=1,
+                          breaker=CircuitBreaker(5, 60), sleep=lambda seconds: None)
+
+
+def test_rejected_batch_dead_letters_only_the_bad_message(db):
+    with FakeEmailServer() as server:
+        server.reject("bad@example.com")
+        ids = enqueue(db, [_message(to) for to in ("a@example.com", "bad@example.com", "b@example.com")], "digest")
+        db.commit()
+        stats = deliver_pending(db, transport=_transport(server), batch_size=10, concurrency=1)
+    
+    assert stats["sent"] == 2
+    assert stats["dead"] == 1
+    assert stats["requests"] == 4  # the batch, then each message on its own
+    assert sorted(m["to"][0] for m in server.messages) == ["a@example.com", "b@example.com"]
+    status = dict(db.query(models.EmailOutbox.to_email, models.EmailOutbox.status)
+                  .filter(models.EmailOutbox.id.in_(ids)))
+    assert status == {"a@example.com": "sent", "bad@example.com": "dead", "b@example.com": "sent"}
+
+
+def test_outbox_requests_carry_row_idempotency_keys(db):
+    keys = []
+    
+    def handler(request):
+        keys.append(request.headers.get("Idempotency-Key"))
+        return httpx.Response(200, json={"data": [{"id": "x"}]})
+    
+    [row_id] = enqueue(db, [_message("a@example.com")], "alert")
+    db.commit()
+    transport = EmailTransport(api_key="test", base_url="http://email.test", transport=httpx.MockTransport(handler),
+                               max_attempts=1)
+    deliver_pending(db, transport=transport, batch_size=10, concurrency=1)
+    
+    assert keys == [f"outbox-{row_id}"]
+
+
+def test_repeated_idempotency_key_is_not_delivered_twice():
+    with FakeEmailServer() as server:
+        transport = _transport(server)
+        first = transport.send([_message("a@example.com")], idempotency_key="outbox-1")
+        second = transport.send([_message("a@example.com")], idempotency_key="outbox-1")
+    
+    assert first.ok and second.ok
+    assert first.ids == second.ids
+    assert len(server.messages) == 1
+
+
+def test_unexpected_error_does_not_leave_breaker_half_open():
+    def handler(request):
+        raise RuntimeError("boom")
+    
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    transport = EmailTransport(api_key="test", base_url="http://email.test", transport=httpx.MockTransport(handler),
+                               max_attempts=1, breaker=breaker)
+    
+    with pytest.raises(RuntimeError):
+        transport.send([_message("a@example.com")])
+    assert breaker.state == "open"
+    assert breaker.allow()  # reset_seconds=0: the next trial call is let through
+    assert transport.metrics.stats()["failed"] == 1
@@ -0,0 +1,43 @@
+from datetime import date
+import pytest
+from sqlalchemy import text
+from app.partitions import DEFAULT_PARTITION, create_monthly_partitions, existing_partitions
+
+
+@pytest.fixture
+def partitioned(db):
+    """A small partitioned usage_snapshots (default partition only) in place of the real table."""
+    conn = db.connection()
+    if conn.execute(text(f"SELECT to_regclass('{DEFAULT_PARTITION}')")).scalar():
+        pytest.skip("usage_snapshots is already partitioned")
+    conn.execute(text("ALTER TABLE usage_snapshots RENAME TO usage_snapshots_unpartitioned"))
+    conn.execute(text(
+        "CREATE TABLE usage_snapshots (timestamp_utc timestamp NOT NULL, usage_percentage smallint, "
+        "facility_id smallint NOT NULL, parser_version_id smallint, "
+        "CONSTRAINT ck_test_minute CHECK (date_trunc('minute', timestamp_utc) = timestamp_utc)) "
+        "PARTITION BY RANGE (timestamp_utc)"
+    ))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF usage_snapshots DEFAULT"))
+    return conn
+
+
+def _count(conn, table: str) -> int:
+    return conn.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+
+
+def test_month_with_rows_in_the_default_partition_takes_them_over(partitioned):
+    conn = partitioned
+    conn.execute(text(
+        "INSERT INTO usage_snapshots VALUES "
+        "('2030-01-05 12:00', 40, 1, NULL), ('2030-01-31 23:59', 50, 2, NULL), ('2030-03-01 00:00', 60, 1, NULL)"
+    ))
+    
+    created = create_monthly_partitions(conn, date(2030, 1, 1), date(2030, 2, 1))
+    
+    assert created == ["usage_snapshots_y2030m01", "usage_snapshots_y2030m02"]
+    assert set(created) <= set(existing_partitions(conn))
+    assert _count(conn, "usage_snapshots_y2030m01") == 2
+    assert _count(conn, "usage_snapshots_y2030m02") == 0
+    assert _count(conn, DEFAULT_PARTITION) == 1
+    assert _count(conn, "usage_snapshots") == 3
+    assert create_monthly_partitions(conn, date(2030, 1, 1), date(2030, 2, 1)) == []
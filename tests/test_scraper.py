@@ -0,0 +1,78 @@
+from pathlib import Path
+import httpx
+import pytest
+from ingestion.parser import parse_html
+from ingestion.scraper import HOURS_URL, HTTP_PARSER_VERSION, PARSER_VERSION, collect_locations
+
+FIXTURE = Path(__file__).resolve().parent.parent / "ingestion" / "fixtures" / "hours.html"
+FIXTURE_READINGS = [
+    {"name": "Raider Power Zone", "usage": 83},
+    {"name": "Front Courts", "usage": 40},
+    {"name": "Indoor Soccer Court", "usage": 12},
+    {"name": "Machine Weight Room", "usage": 57},
+    {"name": "Free Weight Room", "usage": 66},
+    {"name": "Back Courts", "usage": 25},
+    {"name": "Main Level Cardio", "usage": 48},
+    {"name": "Indoor Track", "usage": 9},
+    {"name": "Track Level Cardio", "usage": 31},
+]
+BROWSER_READINGS = [{"name": "Raider Power Zone", "usage": 50}]
+
+
+class FakeBrowser:
+    """Stands in for BrowserScraper; records the sources it was asked to render."""
+    
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.fetched = []
+        self.closed = False
+    
+    def fetch_locations(self, source: str) -> list:
+        self.fetched.append(source)
+        if self.error:
+            raise self.error
+        return BROWSER_READINGS
+    
+    def close(self):
+        self.closed = True
+
+
+def _client(status: int = 200, html: str = None) -> httpx.Client:
+    body = FIXTURE.read_text(encoding="utf-8") if html is None else html
+    return httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(status, text=body)))
+
+
+def test_http_parser_reads_every_facility_in_the_fixture():
+    assert parse_html(FIXTURE.read_text(encoding="utf-8")) == FIXTURE_READINGS
+
+
+def test_served_charts_skip_the_browser():
+    browser = FakeBrowser()
+    
+    assert collect_locations(HOURS_URL, browser, _client()) == (FIXTURE_READINGS, HTTP_PARSER_VERSION)
+    assert collect_locations(str(FIXTURE), browser) == (FIXTURE_READINGS, HTTP_PARSER_VERSION)
+    assert browser.fetched == []
+
+
+@pytest.mark.parametrize("status, html", [
+    (200, "<html><body><div id='charts'></div>Loading...</body></html>"),
+    (503, "Service Unavailable"),
+])
+def test_falls_back_to_the_browser_when_the_http_path_finds_nothing(status, html):
+    browser = FakeBrowser()
+    
+    assert collect_locations(HOURS_URL, browser, _client(status, html)) == (BROWSER_READINGS, PARSER_VERSION)
+    assert browser.fetched == [HOURS_URL]
+
+
+def test_browser_only_when_http_is_disabled():
+    browser = FakeBrowser()
+    
+    assert collect_locations(HOURS_URL, browser, _client(), use_http=False) == (BROWSER_READINGS, PARSER_VERSION)
+
+
+def test_failed_browser_is_closed_for_relaunch():
+    browser = FakeBrowser(error=RuntimeError("browser crashed"))
+    
+    assert collect_locations(HOURS_URL, browser, _client(200, "<html></html>")) == ([], PARSER_VERSION)
+    assert browser.closed
@@ -0,0 +1,127 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from analytics import recommendations, usage_stats as usage_stats_module
+from analytics.recommendations import get_heatmap_data, get_recommendations, recommendation_cache
+from analytics.rollups import local_bucket
+from analytics.usage_stats import UsageStats, welford
+from app import models
+from ingestion.bulk import load_rows
+
+ALPHA = 0.4
+
+
+def _row(facility_id: int, weekday: int, bucket: int, readings) -> tuple:
+    count, mean, m2, ewma = 0, 0.0, 0.0, None
+    for x in readings:
+        count, mean, m2, ewma = welford(count, mean, m2, ewma, x, ALPHA)
+    return facility_id, weekday, bucket, count, mean, m2, ewma
+
+
+def test_steady_usage_matches_the_plain_mean():
+    # Two facilities, one reading a week each, usage unchanged: same as the rollup average
+    stats = UsageStats().with_rows([_row(1, 2, 20, [40] * 6), _row(2, 2, 20, [60] * 6)])
+    
+    assert stats.interval_usage(2, 600, 630) == {20: (50.0, 12)}
+
+
+def test_every_facility_counts_once():
+    # Facility 2 has three times the history, but doesn't outweigh facility 1
+    stats = UsageStats().with_rows([_row(1, 2, 20, [40] * 2), _row(2, 2, 20, [60] * 6)])
+    
+    assert stats.interval_usage(2, 600, 630) == {20: (50.0, 8)}
+    assert stats.interval_usage(2, 600, 630, facility_ids=[2]) == {20: (60.0, 6)}
+
+
+def test_recent_weeks_dominate():
+    stats = UsageStats().with_rows([_row(1, 0, 10, [80] * 20 + [20] * 4)])
+    
+    avg, count = stats.interval_usage(0, 300, 330)[10]
+    assert count == 24
+    assert avg == pytest.approx(20 + 60 * 0.6 ** 4)
+
+
+def test_heatmap_pools_buckets_and_facilities():
+    values = {(1, 20): [10, 20, 30], (1, 21): [40], (2, 21): [50, 70]}
+    stats = UsageStats().with_rows([_row(f, 3, b, xs) for (f, b), xs in values.items()])
+    
+    mean, count, std = stats.heatmap()[(3, 10)]
+    pooled = [x for xs in values.values() for x in xs]
+    assert count == len(pooled)
+    assert mean == pytest.approx(np.mean(pooled))
+    assert std == pytest.approx(np.std(pooled))
+
+
+def test_heatmap_defaults_to_heatmap_weeks_of_rollups(db):
+    prefs = models.UserPreferences(email="", areas_of_interest=[])
+    recent = get_heatmap_data(db, prefs)
+    explicit = get_heatmap_data(db, prefs, weeks=recommendations.settings.heatmap_weeks)
+    if not recent:
+        pytest.skip("no rollups in the last HEATMAP_WEEKS weeks")
+    
+    assert recent == explicit
+    assert all(std is None for _mean, _count, std in recent.values())
+    all_time = get_heatmap_data(db, prefs, all_history=True)
+    assert sum(c for _m, c, _s in all_time.values()) >= sum(c for _m, c, _s in recent.values())
+
+
+def test_recommendations_reuse_the_data_version(db, monkeypatch):
+    prefs = models.UserPreferences(email="", preferred_start_time_local="06:00",
+                                   preferred_end_time_local="22:00", areas_of_interest=[])
+    usage_stats_module.invalidate_usage_stats()
+    recommendation_cache.clear()
+    
+    def unexpected(db):
+        raise AssertionError("usage_stats looked the version up again")
+    
+    monkeypatch.setattr(usage_stats_module, "data_version", unexpected)
+    try:
+        get_recommendations(db, prefs)
+    finally:
+        recommendation_cache.clear()
+        usage_stats_module.invalidate_usage_stats()
+
+
+def _stats_row(db, key) -> tuple:
+    row = db.get(models.UsageStat, key, populate_existing=True)
+    return (row.sample_count, row.mean, row.m2, row.ewma) if row else (0, 0.0, 0.0, None)
+
+
+@pytest.mark.parametrize("facility", ["existing", "new"])
+def test_bulk_loaded_rows_reach_the_usage_stats(db, monkeypatch, facility):
+    monkeypatch.setattr(usage_stats_module.settings, "usage_stats_ewma_alpha", ALPHA)
+    name = (db.query(models.Facility.name).order_by(models.Facility.id).first()[0]
+            if facility == "existing" else "Bulk Test Facility")
+    # Mondays 09:00 Central, loaded in two batches out of order
+    readings = [(datetime(2030, 1, 14, 15, 0), 60), (datetime(2030, 1, 7, 15, 10), 40), (datetime(2030, 1, 21, 15, 5), 90)]
+    facility_id = db.query(models.Facility.id).filter(models.Facility.name == name).scalar()
+    _date, weekday, bucket = local_bucket(readings[0][0])
+    count, mean, m2, ewma = _stats_row(db, (facility_id, weekday, bucket)) if facility_id else (0, 0.0, 0.0, None)
+    
+    load_rows(db, [[(ts, name, pct) for ts, pct in readings[:2]], [(ts, name, pct) for ts, pct in readings[2:]]], "test")
+    
+    facility_id = db.query(models.Facility.id).filter(models.Facility.name == name).scalar()
+    for pct in (40, 60, 90):  # each batch in time order, after what was there
+        count, mean, m2, ewma = welford(count, mean, m2, ewma, pct, ALPHA)
+    assert _stats_row(db, (facility_id, weekday, bucket)) == pytest.approx((count, mean, m2, ewma))
+    stats = UsageStats().with_rows(usage_stats_module._load_rows(db))
+    assert stats.interval_usage(weekday, 9 * 60, 9 * 60 + 30, facility_ids=[facility_id]) == {
+        bucket: (pytest.approx(ewma), count)
+    }
+
+
+def test_empty_window_does_not_fall_back_to_raw_snapshots(db, monkeypatch):
+    since = datetime.now(recommendations.pytz.timezone(recommendations.TZ_NAME))
+    scans = []
+    monkeypatch.setattr(recommendations, "_interval_usage_sql", lambda *args: scans.append(args) or {})
+    
+    # Stats loaded, nothing in this window (no such facility): no fallback at all
+    assert recommendations._interval_usage(db, since, 0, 360, 480, [32000], 30) == {}
+    # Empty stats table: rollups answer, once they have been backfilled
+    monkeypatch.setattr(recommendations, "usage_stats", lambda db, version=None: UsageStats())
+    assert recommendations._interval_usage(db, since, 0, 360, 480, [32000], 30) == {}
+    assert scans == []
+    
+    monkeypatch.setattr(recommendations, "rollups_backfilled", lambda db: False)
+    recommendations._interval_usage(db, since, 0, 360, 480, [32000], 30)
+    assert len(scans) == 1